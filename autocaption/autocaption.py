@@ -5,39 +5,30 @@ import time
 
 import ffmpeg
 import numpy as np
-import whisper_timestamped as whisper
 from whisper_timestamped.transcribe import TransformerWhisperAsOpenAIWhisper
-from moviepy.editor import ColorClip, CompositeVideoClip, TextClip, VideoFileClip
+from moviepy.editor import VideoFileClip
+from typing import Union
+from src.models import models
+from src.tools.audio import decode_pcm
+from src.video.ass import burn_subtitles, probe_video_size, write_ass
+from src.video.compositor import CaptionCompositor, resolve_position, solid_sprite
+from src.video.overlay import render_overlay
+from src.video.render import render_slices, slice_count
+from src.video.sprites import sprite_cache
 
 start = time.time()
 
 directory = tempfile.gettempdir()
 
 
-def create_audio(videofilename):
-	extension = os.path.splitext(videofilename)[1]
-	audiofilename = videofilename.replace(extension, ".mp3")
-
-	# Create the ffmpeg input stream
-	input_stream = ffmpeg.input(videofilename)
-
-	# Extract the audio stream from the input stream
-	audio = input_stream.audio
-
-	# Save the audio stream as an MP3 file
-	output_stream = ffmpeg.output(audio, audiofilename)
-
-	# # Overwrite output file if it already exists
-	output_stream = ffmpeg.overwrite_output(output_stream)
-
-	ffmpeg.run(output_stream)
-
-	return audiofilename
+def create_audio(videofilename) -> np.ndarray:
+	# decoded in memory as 16 kHz mono float PCM, ready for whisper
+	return decode_pcm(videofilename)
 
 
 def transcribe_audio(whisper_model: TransformerWhisperAsOpenAIWhisper,
-                     audiofilename):
-	segments = whisper_model.transcribe(audiofilename, word_timestamps=True)
+                     audio: Union[str, np.ndarray]):
+	segments = whisper_model.transcribe(audio, word_timestamps=True)
 
 	# segments = list(segments)  # The transcription will actually run here.
 	segments = segments['segments']
@@ -128,9 +119,8 @@ def create_caption(
     right_to_left=False,
 ):
 	wordcount = len(textJSON["textcontents"])
-	full_duration = textJSON["end"] - textJSON["start"]
 
-	word_clips = []
+	word_sprites = []
 	xy_textclips_positions = []
 
 	x_pos = 0
@@ -151,51 +141,23 @@ def create_caption(
 	else:
 		enumerator = enumerate(textJSON["textcontents"])
 
+	# each word and style is only rasterized once, see src/video/sprites.py
+	style = {
+	    "font": font,
+	    "fontsize": fontsize,
+	    "color": color,
+	    "stroke_color": stroke_color,
+	    "stroke_width": stroke_width,
+	    "kerning": kerning,
+	    "right_to_left": right_to_left,
+	}
+	highlight_style = {**style, "color": highlight_color}
+
 	for index, wordJSON in enumerator:
 		duration = wordJSON["end"] - wordJSON["start"]
-		word_clip = (
-		    TextClip(
-		        txt=wordJSON["word"],
-		        font=font,
-		        fontsize=fontsize,
-		        color=color,
-		        stroke_color=stroke_color,
-		        stroke_width=stroke_width,
-		        kerning=kerning,
-		        # print_cmd=True,
-		    ).set_start(textJSON["start"]).set_duration(full_duration))
-
-		word_clip_space = (
-		    TextClip(
-		        " ",
-		        font=font,
-		        fontsize=fontsize,
-		        color=color,
-		        kerning=kerning,
-		        # print_cmd=True,
-		    ).set_start(textJSON["start"]).set_duration(full_duration))
-		word_width, word_height = word_clip.size
-		space_width, space_height = word_clip_space.size
-		space_width = 0
-		space_height = 0
+		word_sprite = sprite_cache.get(wordJSON["word"], **style)
+		word_height, word_width = word_sprite.shape[:2]
 		if line_width + word_width + space_width <= max_line_width:
-			# Store info of each word_clip created
-			xy_textclips_positions.append({
-			    "x_pos": x_pos,
-			    "y_pos": y_pos,
-			    "width": word_width,
-			    "height": word_height,
-			    "word": wordJSON["word"],
-			    "start": wordJSON["start"],
-			    "end": wordJSON["end"],
-			    "duration": duration,
-			})
-
-			word_clip = word_clip.set_position((x_pos, y_pos))
-			word_clip_space = word_clip_space.set_position(
-			    (x_pos + word_width, y_pos))
-
-			x_pos = x_pos + word_width + space_width
 			line_width = line_width + word_width + space_width
 		else:
 			# Move to the next line
@@ -203,45 +165,36 @@ def create_caption(
 			y_pos = y_pos + word_height + 10
 			line_width = word_width + space_width
 
-			# Store info of each word_clip created
-			xy_textclips_positions.append({
-			    "x_pos": x_pos,
-			    "y_pos": y_pos,
-			    "width": word_width,
-			    "height": word_height,
-			    "word": wordJSON["word"],
-			    "start": wordJSON["start"],
-			    "end": wordJSON["end"],
-			    "duration": duration,
-			})
-
-			word_clip = word_clip.set_position((x_pos, y_pos))
-			word_clip_space = word_clip_space.set_position(
-			    (x_pos + word_width, y_pos))
-			x_pos = word_width + space_width
-
-		word_clips.append(word_clip)
-		word_clips.append(word_clip_space)
+		# Store info of each word placed
+		xy_textclips_positions.append({
+		    "x_pos": x_pos,
+		    "y_pos": y_pos,
+		    "width": word_width,
+		    "height": word_height,
+		    "word": wordJSON["word"],
+		    "start": wordJSON["start"],
+		    "end": wordJSON["end"],
+		    "duration": duration,
+		})
+		word_sprites.append({
+		    "sprite": word_sprite,
+		    "x": x_pos,
+		    "y": y_pos,
+		    "start": textJSON["start"],
+		    "end": textJSON["end"],
+		})
+		x_pos = x_pos + word_width + space_width
 
 	for highlight_word in xy_textclips_positions:
-		word_clip_highlight = (
-		    TextClip(
-		        highlight_word["word"],
-		        font=font,
-		        fontsize=fontsize,
-		        color=highlight_color,
-		        stroke_color=stroke_color,
-		        # type: ignore
-		        stroke_width=stroke_width,
-		        kerning=kerning,
-		        # print_cmd=True,
-		    ).set_start(highlight_word["start"]).set_duration(
-		        highlight_word["duration"]))
-		word_clip_highlight = word_clip_highlight.set_position(
-		    (highlight_word["x_pos"], highlight_word["y_pos"]))
-		word_clips.append(word_clip_highlight)
-
-	return word_clips, xy_textclips_positions
+		word_sprites.append({
+		    "sprite": sprite_cache.get(highlight_word["word"], **highlight_style),
+		    "x": highlight_word["x_pos"],
+		    "y": highlight_word["y_pos"],
+		    "start": highlight_word["start"],
+		    "end": highlight_word["end"],
+		})
+
+	return word_sprites, xy_textclips_positions
 
 
 def get_final_cliped_video(
@@ -258,14 +211,16 @@ def get_final_cliped_video(
     stroke_width,
     kerning,
     right_to_left,
+    slices=None,
+    renderer="moviepy",
 ):
-	input_video = VideoFileClip(videofilename)
-	frame_size = input_video.size
+	frame_size = probe_video_size(videofilename)
 
-	all_linelevel_splits = []
+	# captions are drawn onto each frame, only the words showing at that time
+	compositor = CaptionCompositor()
 
 	for line in linelevel_subtitles:
-		out_clips, positions = create_caption(
+		word_sprites, positions = create_caption(
 		    line,
 		    frame_size,
 		    v_type,
@@ -289,29 +244,39 @@ def get_final_cliped_video(
 			max_width = max(max_width, x_pos + width)
 			max_height = max(max_height, y_pos + height)
 
-		color_clip = ColorClip(size=(int(max_width * 1.1), int(max_height * 1.1)),
-		                       color=(64, 64, 64))
-		color_clip = color_clip.set_opacity(opacity)
-		color_clip = color_clip.set_start(
-		    line["start"]).set_duration(line["end"] - line["start"])
-
-		clip_to_overlay = CompositeVideoClip([color_clip] + out_clips)
+		box_size = (int(max_width * 1.1), int(max_height * 1.1))
 
 		if subs_position == "bottom75":
-			clip_to_overlay = clip_to_overlay.set_position(("center", 0.75),
-			                                               relative=True)
+			x, y = resolve_position(("center", 0.75),
+			                        box_size,
+			                        frame_size,
+			                        relative=True)
 		else:
-			clip_to_overlay = clip_to_overlay.set_position(subs_position)
+			x, y = resolve_position(subs_position, box_size, frame_size)
 
-		all_linelevel_splits.append(clip_to_overlay)
+		# box behind the line, fully transparent by default
+		if opacity > 0:
+			compositor.add(solid_sprite(*box_size, (64, 64, 64), opacity), x, y,
+			               line["start"], line["end"])
+		for word in word_sprites:
+			compositor.add(word["sprite"], x + word["x"], y + word["y"],
+			               word["start"], word["end"])
 
-	input_video_duration = input_video.duration
+	destination = os.path.join(directory, "output.mp4")
+	if renderer == "overlay":
+		# only the caption layer is rendered, ffmpeg puts it on the source
+		render_overlay(videofilename, compositor, destination)
+		return destination
+	if slice_count(slices) > 1:
+		# rendered in parallel slices, joined without re-encoding
+		render_slices(videofilename, compositor, destination, slices)
+		return destination
 
-	final_video = CompositeVideoClip([input_video] + all_linelevel_splits)
+	input_video = VideoFileClip(videofilename)
+	final_video = compositor.apply(input_video)
 
 	# Set the audio of the final video to be the same as the input video
 	final_video = final_video.set_audio(input_video.audio)
-	destination = os.path.join(directory, "output.mp4")
 	# Save the final clip as a video file with the audio included
 	final_video.write_videofile(destination,
 	                            fps=24,
@@ -320,6 +285,44 @@ def get_final_cliped_video(
 	return destination
 
 
+def get_final_ass_video(
+    videofilename,
+    linelevel_subtitles,
+    subs_position,
+    highlight_color,
+    fontsize,
+    opacity,
+    color,
+    font,
+    stroke_color,
+    stroke_width,
+    kerning,
+):
+	# the same captions as an ASS file, burned in by ffmpeg in one pass
+	# (libass lays out right to left text itself)
+	frame_width, frame_height = probe_video_size(videofilename)
+	subtitles = os.path.join(directory, "output.ass")
+	fonts_dir = write_ass(
+	    linelevel_subtitles,
+	    subtitles,
+	    (frame_width, frame_height),
+	    font=font,
+	    fontsize=int(frame_height * fontsize / 100),
+	    color=color,
+	    highlight_color=highlight_color,
+	    stroke_color=stroke_color,
+	    stroke_width=stroke_width,
+	    kerning=kerning,
+	    position=subs_position,
+	    margin_h=round(frame_width / 10),
+	    margin_v=0,
+	    box_opacity=opacity,
+	)
+	destination = os.path.join(directory, "output.mp4")
+	burn_subtitles(videofilename, subtitles, destination, fonts_dir)
+	return destination
+
+
 def add_subtitle(
     videofilename,
     v_type,
@@ -335,6 +338,8 @@ def add_subtitle(
     stroke_width,
     kerning,
     right_to_left,
+    renderer="moviepy",
+    slices=None,
 ):
 	print("video type is: " + v_type)
 
@@ -346,6 +351,20 @@ def add_subtitle(
 	for line in linelevel_subtitles:
 		json_str = json.dumps(line, indent=4)
 		print("whole json: ", json_str)
+	if renderer == "ass":
+		return get_final_ass_video(
+		    videofilename,
+		    linelevel_subtitles,
+		    subs_position,
+		    highlight_color,
+		    fontsize,
+		    opacity,
+		    color,
+		    font,
+		    stroke_color,
+		    stroke_width,
+		    kerning,
+		)
 	outputfile = get_final_cliped_video(
 	    videofilename,
 	    linelevel_subtitles,
@@ -360,17 +379,12 @@ def add_subtitle(
 	    stroke_width,
 	    kerning,
 	    right_to_left,
+	    slices,
+	    renderer,
 	)
 	return outputfile
 
 
 def load_model(model_size="base"):
-	print("Loading the Whisper Model into the App............")
-
-	try:
-		model = whisper.load_model(model_size, device="cuda")
-	except RuntimeError as e:
-		model = whisper.load_model(model_size)
-		print("Error: ", e)
-
-	return model
+	# shared with everything else in the process, loaded on first use
+	return models.whisper(model_size)
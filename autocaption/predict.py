@@ -2,19 +2,22 @@ import json
 import os
 import shutil
 import tempfile
-from typing import List
+from typing import List, Optional
+from src.config import CAPTION_RENDERER
+from src.video.captions import load_caption_words
 from .autocaption import load_model, create_audio, transcribe_audio, add_subtitle
 from whisper_timestamped.transcribe import TransformerWhisperAsOpenAIWhisper
 
 
 class VideoCaptioner:
 
-	model: TransformerWhisperAsOpenAIWhisper
+	def __init__(self, model_size: str = "base"):
+		"""Initialize the captioner, the model is only loaded once it's needed"""
+		self.model_size = model_size
 
-	def __init__(self):
-		"""Initialize the captioner"""
-		m = load_model()
-		self.model = m
+	@property
+	def model(self) -> TransformerWhisperAsOpenAIWhisper:
+		return load_model(self.model_size)
 
 	def add_captions(
 	    self,
@@ -33,6 +36,8 @@ class VideoCaptioner:
 	    stroke_width: float = 2.6,
 	    kerning: float = -5.0,
 	    right_to_left: bool = False,
+	    renderer: str = CAPTION_RENDERER,
+	    slices: Optional[int] = None,
 	) -> List[str]:
 		"""
         Add captions to a video file
@@ -55,11 +60,11 @@ class VideoCaptioner:
 
 		# Get word-level information
 		if transcript_file_path != '':
-			with open(transcript_file_path) as f:
-				wordlevel_info = json.loads(f.read())
+			# our word JSON, or an SRT/JSON transcript from create_transcript
+			wordlevel_info = load_caption_words(transcript_file_path)
 		else:
-			audiofilename = create_audio(video_temp_path)
-			wordlevel_info = transcribe_audio(self.model, audiofilename)
+			audio = create_audio(video_temp_path)
+			wordlevel_info = transcribe_audio(self.model, audio)
 
 		outputs = []
 
@@ -80,6 +85,8 @@ class VideoCaptioner:
 			    stroke_width,
 			    kerning,
 			    right_to_left,
+			    renderer,
+			    slices,
 			)
 			outputs.append(outputfile)
 
@@ -0,0 +1,115 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# per-chunk latency of the AllTalk client against a local stand-in server that
+# behaves like AllTalk: one clip is generated at a time, files are fetched separately
+
+parser = argparse.ArgumentParser(description='Benchmark the AllTalk client.')
+parser.add_argument('--chunks', type=int, default=8, help='Number of chunks')
+parser.add_argument('--generate-ms',
+                    type=int,
+                    default=200,
+                    help='Simulated generation time per chunk')
+parser.add_argument('--download-ms',
+                    type=int,
+                    default=100,
+                    help='Simulated download time per chunk')
+parser.add_argument('--size-kb', type=int, default=512, help='Clip size')
+args = parser.parse_args()
+
+CLIP = b'\0' * (args.size_kb * 1024)
+generate_lock = threading.Lock()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		pass
+
+	def read_body(self):
+		self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+	def send_clip(self, generate: bool):
+		self.send_response(200)
+		self.send_header('Content-Type', 'audio/wav')
+		self.send_header('Content-Length', str(len(CLIP)))
+		self.end_headers()
+		parts = 8
+		step = len(CLIP) // parts
+		for i in range(parts):
+			if generate:
+				with generate_lock:
+					time.sleep(args.generate_ms / 1000 / parts)
+			else:
+				time.sleep(args.download_ms / 1000 / parts)
+			self.wfile.write(CLIP[i * step:(i + 1) * step])
+
+	def do_POST(self):
+		self.read_body()
+		if self.path == '/api/tts-generate':
+			with generate_lock:
+				time.sleep(args.generate_ms / 1000)
+			body = b'{"status": "generate-success", "output_file_url": "/audio/clip.wav"}'
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		elif self.path == '/api/tts-generate-streaming':
+			self.send_clip(generate=True)
+		else:
+			self.send_error(404)
+
+	def do_GET(self):
+		if self.path.startswith('/audio/'):
+			self.send_clip(generate=False)
+		else:
+			self.send_error(404)
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ['ALLTALK_BASE_URL'] = f'http://127.0.0.1:{server.server_port}'
+
+from src.clients.alltalk import alltalk
+from src.clients.stream import write_chunks
+
+
+class Discard:
+
+	def write(self, chunk):
+		pass
+
+
+def run_chunk(i: int, streaming: bool) -> float:
+	start = time.perf_counter()
+	write_chunks(alltalk.iterSpeech(f'chunk {i}', streaming=streaming), Discard())
+	return time.perf_counter() - start
+
+
+def run(name: str, streaming: bool, workers: int):
+	alltalk.streaming_supported = None
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		latencies = list(
+		    executor.map(lambda i: run_chunk(i, streaming), range(args.chunks)))
+	total = time.perf_counter() - start
+	print(f'{name}: {total:.2f}s total, {sum(latencies) / len(latencies):.3f}s '
+	      f'mean per chunk, {max(latencies):.3f}s max')
+
+
+run('generate + fetch, sequential', streaming=False, workers=1)
+run('generate + fetch, pipelined', streaming=False, workers=2)
+run('streaming', streaming=True, workers=1)
+run('streaming, pipelined', streaming=True, workers=2)
+server.shutdown()
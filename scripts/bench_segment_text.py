@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import re
+import time
+import argparse
+from src.utils import segment_text
+
+# benchmark for src.utils.segment_text, time per MB should stay flat as the input grows
+# the script sections are first checked against the input: none is blank, none is
+# longer than max_chars and each one's offsets span exactly its text
+
+parser = argparse.ArgumentParser(description='Benchmark the text segmenter.')
+parser.add_argument('--sizes',
+                    type=int,
+                    nargs='+',
+                    default=[1, 2, 4, 8],
+                    help='Input sizes in MB')
+parser.add_argument('--max-chars',
+                    type=int,
+                    default=5000,
+                    help='Max chunk length')
+args = parser.parse_args()
+
+paragraph = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20
+script_block = f'# Title\n[a comment]\n{paragraph}\n{paragraph}\n--\n'
+
+
+def check(text: str, max_chars: int):
+	for section in segment_text(text, max_chars, script=True):
+		content = section['content']
+		spanned = text[section['start']:section['end']]
+		assert content.strip(), f'blank section: {section}'
+		if section['type'] == 'title':
+			assert content == spanned.lstrip('#').strip(), section
+			continue
+		assert len(content.strip()) <= max_chars, f'section too long: {section}'
+		# lines are stripped and comments removed, otherwise it's the text as is
+		expected = [
+		    line.strip()
+		    for line in re.sub(r'\[[^\]\n]*\]', '', spanned).split('\n')
+		    if line.strip() and not line.startswith('--')
+		]
+		assert content.strip().split('\n') == expected, (section, spanned)
+
+
+# a line longer than max_chars is split into sentences, each with its own offsets
+long_line = 'First sentence here. Second one is here. Third! A fourth? . . . .'
+cases = [(script_block * 3, 300), (f'# Title\n{long_line}\nshort\n[only a comment]\n', 25),
+         ('. . . . . . . . . . .\nok\n', 4)]
+for case, max_chars in cases:
+	check(case, max_chars)
+print('Script sections match the input')
+
+for size in args.sizes:
+	n = size * 1024 * 1024
+	text = (paragraph + '\n') * (n // (len(paragraph) + 1))
+	script = script_block * (n // len(script_block))
+
+	start = time.perf_counter()
+	chunks = sum(1 for _ in segment_text(text, args.max_chars))
+	text_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	sections = sum(1 for _ in segment_text(script, args.max_chars, script=True))
+	script_time = time.perf_counter() - start
+
+	print(f'{size} MB: text {chunks} chunks in {text_time:.3f}s '
+	      f'({text_time / size:.4f}s/MB), script {sections} sections in '
+	      f'{script_time:.3f}s ({script_time / size:.4f}s/MB)')
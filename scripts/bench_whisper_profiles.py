@@ -0,0 +1,188 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import os
+import re
+import time
+import argparse
+from dotenv import load_dotenv
+from pydub import AudioSegment
+from src.clients.whisper_local import whisper_local, get_backend, get_profile
+from src.config import WHISPER_PROFILES
+
+# real-time factor and word error rate of each transcription profile
+# fixtures are reference texts (name.txt) with their audio (name.mp3/.wav) next to
+# them or in --audio, which is outside the repo. Missing audio is only synthesized
+# from the text with --synthesize, since that uses a (paid) TTS provider.
+
+load_dotenv()
+
+parser = argparse.ArgumentParser(
+    description='Benchmark the transcription profiles.')
+parser.add_argument('--fixtures',
+                    default=os.path.join(os.path.dirname(__file__), 'fixtures',
+                                         'stt'),
+                    help='Directory of name.txt reference texts')
+parser.add_argument('--audio',
+                    default=os.path.expanduser(
+                        '~/.cache/comic-generator-ai/fixtures/stt'),
+                    help='Directory of the fixtures\' name.mp3/.wav audio')
+parser.add_argument('--synthesize',
+                    action='store_true',
+                    help='Synthesize missing audio with --provider')
+parser.add_argument('--profiles',
+                    nargs='+',
+                    default=list(WHISPER_PROFILES),
+                    help='Profiles to benchmark')
+parser.add_argument('--provider',
+                    default='elevenlabs',
+                    help='TTS provider used to synthesize missing fixture audio')
+args = parser.parse_args()
+
+ONES = [
+    'zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight',
+    'nine', 'ten', 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen',
+    'sixteen', 'seventeen', 'eighteen', 'nineteen'
+]
+TENS = [
+    '', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty',
+    'ninety'
+]
+SCALES = [(10**9, 'billion'), (10**6, 'million'), (1000, 'thousand'),
+          (100, 'hundred')]
+ORDINALS = {
+    'one': 'first',
+    'two': 'second',
+    'three': 'third',
+    'five': 'fifth',
+    'eight': 'eighth',
+    'nine': 'ninth',
+    'twelve': 'twelfth'
+}
+NUMBER_WORDS = set(ONES + TENS[2:] + [name for _, name in SCALES])
+
+
+def number_words(n: int) -> str:
+	if n < 20:
+		return ONES[n]
+	if n < 100:
+		return TENS[n // 10] + ('' if n % 10 == 0 else ' ' + ONES[n % 10])
+	for value, name in SCALES:
+		if n >= value:
+			rest = n % value
+			return f'{number_words(n // value)} {name}' + ('' if rest == 0 else
+			                                               ' ' + number_words(rest))
+	return str(n)
+
+
+def ordinal_words(n: int) -> str:
+	*words, last = number_words(n).split()
+	if last in ORDINALS:
+		last = ORDINALS[last]
+	elif last.endswith('y'):
+		last = last[:-1] + 'ieth'
+	else:
+		last += 'th'
+	return ' '.join(words + [last])
+
+
+def time_words(hours: str, minutes: str) -> str:
+	if minutes == '00':
+		return number_words(int(hours))
+	# 9:05 is 'nine oh five'
+	oh = ' oh' if minutes[0] == '0' else ''
+	return f'{number_words(int(hours))}{oh} {number_words(int(minutes))}'
+
+
+def spell_numbers(text: str) -> str:
+	"""Numerals as words, so '9:30' and 'nine thirty' compare equal"""
+	text = re.sub(r'\b(\d{1,2}):(\d{2})\b', lambda m: time_words(m[1], m[2]),
+	              text)
+	text = re.sub(r'(?<=\d),(?=\d{3}\b)', '', text)
+	text = re.sub(r'\b(\d+)(?:st|nd|rd|th)\b',
+	              lambda m: ordinal_words(int(m[1])), text)
+	text = re.sub(
+	    r'\b(\d+)\.(\d+)\b', lambda m: number_words(int(m[1])) + ' point ' + ' '.
+	    join(ONES[int(d)] for d in m[2]), text)
+	text = re.sub(r'\b\d+\b', lambda m: number_words(int(m[0])), text)
+	return text.replace('%', ' percent')
+
+
+def normalize(text: str) -> list[str]:
+	words = re.sub(r"[^\w\s']", ' ', spell_numbers(text.lower())).split()
+	# 'two hundred and fifty' is 'two hundred fifty'
+	return [
+	    word for i, word in enumerate(words)
+	    if not (word == 'and' and 0 < i < len(words) - 1 and
+	            words[i - 1] in NUMBER_WORDS and words[i + 1] in NUMBER_WORDS)
+	]
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+	"""Word-level edit distance divided by the reference length"""
+	ref, hyp = normalize(reference), normalize(hypothesis)
+	previous = list(range(len(hyp) + 1))
+	for i, ref_word in enumerate(ref, 1):
+		current = [i]
+		for j, hyp_word in enumerate(hyp, 1):
+			current.append(
+			    min(previous[j] + 1, current[j - 1] + 1,
+			        previous[j - 1] + (ref_word != hyp_word)))
+		previous = current
+	return previous[-1] / max(1, len(ref))
+
+
+def find_audio(name: str):
+	for directory in [args.fixtures, args.audio]:
+		for ext in ['.wav', '.mp3']:
+			path = os.path.join(directory, name + ext)
+			if os.path.exists(path):
+				return path
+	return None
+
+
+fixtures = []
+for file in sorted(os.listdir(args.fixtures)):
+	if not file.endswith('.txt'):
+		continue
+	name = file[:-4]
+	with open(os.path.join(args.fixtures, file)) as f:
+		reference = f.read().strip()
+	audio_path = find_audio(name)
+	if audio_path is None and not args.synthesize:
+		print(f'Skipping {name}: no audio in {args.audio} (use --synthesize to make it)')
+		continue
+	if audio_path is None:
+		from src.tools.tts import make_tts
+		audio_path = make_tts(reference,
+		                      'text',
+		                      os.path.join(args.audio, name + '.mp3'),
+		                      provider=args.provider)
+	duration = len(AudioSegment.from_file(audio_path)) / 1000
+	fixtures.append((name, reference, audio_path, duration))
+
+for profile in args.profiles:
+	settings = get_profile(profile)
+	start = time.perf_counter()
+	whisper_local.initialize_client(profile)
+	load_time = time.perf_counter() - start
+
+	total_audio = total_time = total_errors = 0.0
+	total_words = 0
+	for name, reference, audio_path, duration in fixtures:
+		start = time.perf_counter()
+		result = whisper_local.getTranscript(audio_path, profile=profile)
+		elapsed = time.perf_counter() - start
+		wer = word_error_rate(reference, result['text'])
+		words = len(normalize(reference))
+		total_audio += duration
+		total_time += elapsed
+		total_errors += wer * words
+		total_words += words
+		print(f'  {profile}/{name}: RTF {elapsed / duration:.3f}, WER {wer:.1%}')
+
+	print(f'{profile} ({get_backend(settings)}, {settings["model"]}): '
+	      f'load {load_time:.1f}s, RTF {total_time / max(total_audio, 1e-9):.3f}, '
+	      f'WER {total_errors / max(total_words, 1):.1%}')
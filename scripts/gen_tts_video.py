@@ -6,8 +6,8 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 import os
 from src.utils import ensuredir, displayVideo
 from src.enums import ElevenLabsTTSModel, ElevenLabsTTSVoice
-from src.tools.tts import make_tts
-from src.tools.stt import create_transcript
+from src.tools.tts import make_tts_job
+from src.tools.stt import create_transcript, create_transcript_from_words
 from src.video.moviepy import create_video_with_subtitles
 
 # change the model and/or voice if desired
@@ -33,14 +33,20 @@ elif input_url:
 	input_type = 'url'
 	input_src = input_url
 
-audio = make_tts(input_src,
-                 input_type,
-                 output_file,
-                 model=tts_model,
-                 voice=tts_voice)
-
-# Generate SRT file
-srt_file = create_transcript(audio)  # Your existing function
+tts = make_tts_job(input_src,
+                   input_type,
+                   output_file,
+                   model=tts_model,
+                   voice=tts_voice,
+                   timestamps=True)
+audio = tts['path']
+
+# Generate SRT file, from the provider's word timings when it returns them,
+# otherwise by aligning the text that we just synthesized rather than transcribing it
+if tts['words'] is not None:
+	srt_file = create_transcript_from_words(tts['words'])
+else:
+	srt_file = create_transcript(audio, text=tts['text'], spans=tts['spans'])
 
 # Create video with subtitles
 video_output_file = f"{os.path.splitext(audio)[0]}.mp4"
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import argparse
+from dotenv import load_dotenv
+from src.clients.whisper_worker import get_address, serve
+from src.config import WHISPER_WORKER_QUEUE_SIZE
+
+# keeps a whisper model loaded so that create_transcript doesn't have to load it on every run
+# set WHISPER_WORKER_ADDRESS (e.g. localhost:8765) for both this script and its clients,
+# and WHISPER_WORKER_AUTHKEY too if they don't run as the same user (see whisper.worker in config/config.yaml)
+
+load_dotenv()
+
+parser = argparse.ArgumentParser(description='Run the local whisper worker.')
+parser.add_argument('--address',
+                    help='host:port to listen on (default: WHISPER_WORKER_ADDRESS)')
+parser.add_argument('--queue-size',
+                    type=int,
+                    default=WHISPER_WORKER_QUEUE_SIZE,
+                    help='Max jobs waiting for the model')
+parser.add_argument('--allow-remote',
+                    action='store_true',
+                    help='Listen on an address other machines can reach')
+args = parser.parse_args()
+
+address = get_address()
+if args.address:
+	host, _, port = args.address.rpartition(':')
+	address = (host or 'localhost', int(port))
+
+serve(address, args.queue_size, args.allow_remote)
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Optional
+from src.config import TTS_CACHE_DIR, TTS_CACHE_MAX_MB, TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB
+
+# (path, size, mtime) -> content hash, so a file is only hashed again once it changes
+file_hashes: dict[tuple, str] = {}
+
+
+class FileCache:
+	"""
+	Content-addressed file cache with size-based LRU eviction.
+
+	Entries are stored as `{key}{suffix}` in `directory`. A hit touches the
+	entry's mtime, so the least recently used entries are evicted first once
+	the total size goes over `max_bytes`.
+	"""
+
+	def __init__(self, directory: str, max_bytes: int):
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+		self.total_bytes: Optional[int] = None
+
+	@staticmethod
+	def key(*parts) -> str:
+		data = json.dumps(parts, sort_keys=True, default=str)
+		return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+	def path(self, key: str, suffix='') -> str:
+		return os.path.join(self.directory, f'{key}{suffix}')
+
+	def get(self, key: str, suffix='') -> Optional[str]:
+		"""Returns the path of the cached entry, or None on a miss"""
+		path = self.path(key, suffix)
+		with self.lock:
+			if os.path.exists(path):
+				os.utime(path)
+				self.hits += 1
+				return path
+			self.misses += 1
+			return None
+
+	def fetch(self, key: str, dest: str, suffix='') -> bool:
+		"""Copies the cached entry to `dest`, returns False on a miss"""
+		path = self.get(key, suffix)
+		if path is None:
+			return False
+		dest_dir = os.path.dirname(dest)
+		if dest_dir:
+			os.makedirs(dest_dir, exist_ok=True)
+		shutil.copyfile(path, dest)
+		return True
+
+	def put(self, key: str, src: str, suffix='') -> str:
+		"""Copies `src` into the cache and evicts old entries if needed"""
+		os.makedirs(self.directory, exist_ok=True)
+		path = self.path(key, suffix)
+		tmp_path = f'{path}.{threading.get_ident()}.tmp'
+		shutil.copyfile(src, tmp_path)
+
+		with self.lock:
+			# a replaced entry's bytes are no longer in the cache
+			replaced = os.path.getsize(path) if os.path.exists(path) else 0
+			os.replace(tmp_path, path)
+			if self.total_bytes is None:
+				self.total_bytes = self._scan_size()
+			else:
+				self.total_bytes += os.path.getsize(path) - replaced
+			if self.total_bytes > self.max_bytes:
+				self._evict(keep=path)
+		return path
+
+	def stats(self) -> dict:
+		return {'hits': self.hits, 'misses': self.misses}
+
+	def _entries(self) -> list[os.DirEntry]:
+		if not os.path.isdir(self.directory):
+			return []
+		return [
+		    e for e in os.scandir(self.directory)
+		    if e.is_file() and not e.name.endswith('.tmp')
+		]
+
+	def _scan_size(self) -> int:
+		return sum(e.stat().st_size for e in self._entries())
+
+	def _evict(self, keep: str):
+		entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+		total = sum(e.stat().st_size for e in entries)
+		for entry in entries:
+			if total <= self.max_bytes:
+				break
+			if os.path.samefile(entry.path, keep):
+				continue
+			total -= entry.stat().st_size
+			os.remove(entry.path)
+		self.total_bytes = total
+
+
+def speech_cache_key(provider: str,
+                     model: Optional[str],
+                     voice: Optional[str],
+                     voice_settings: Optional[dict],
+                     text: str,
+                     previous_text: Optional[str] = None,
+                     next_text: Optional[str] = None) -> str:
+	return FileCache.key(provider, model, voice, voice_settings, text,
+	                     previous_text, next_text)
+
+
+def file_hash(path: str) -> str:
+	"""sha256 of a file's contents"""
+	stat = os.stat(path)
+	memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+	if memo_key not in file_hashes:
+		digest = hashlib.sha256()
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(1024 * 1024), b''):
+				digest.update(block)
+		file_hashes[memo_key] = digest.hexdigest()
+	return file_hashes[memo_key]
+
+
+def transcript_cache_key(media_path: str, provider: str, profile: Optional[str],
+                         prompt: Optional[str], outformat: str) -> str:
+	return FileCache.key(file_hash(media_path), provider, profile, prompt,
+	                     outformat)
+
+
+tts_cache = FileCache(TTS_CACHE_DIR, TTS_CACHE_MAX_MB * 1024 * 1024)
+transcript_cache = FileCache(TRANSCRIPT_CACHE_DIR,
+                             TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
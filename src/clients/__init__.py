@@ -5,3 +5,4 @@ from .ollama import ollama
 from .openrouter import openrouter
 from .together import together
 from .whisper_local import whisper_local
+from .whisper_worker import whisper_worker
@@ -1,27 +1,32 @@
 import os
 import requests
 import json
-import httpx
 import base64
+import threading
 import typing
-from io import BytesIO
-from src.config import DEFAULT_TTS_MODEL, DEFAULT_TTS_VOICE
-from typing import Union
-
-STREAM_CHUNK_SIZE = 1024
+from src.config import DEFAULT_TTS_MODEL, DEFAULT_TTS_VOICE, ALLTALK_STREAMING, ALLTALK_VOICE, ALLTALK_LANGUAGE
+from src.clients import pool
+from src.clients.scheduler import ProviderError, release_on_close
+from src.clients.stream import STREAM_CHUNK_SIZE, Sink, awrite_chunks, write_chunks
+from typing import AsyncIterator, Iterator, Union
 
 
 def get_url(url: str) -> str:
-	base_url = os.getenv("ALLTALK_BASE_URL")
-	if not base_url:
-		raise ValueError("ALLTALK_BASE_URL environment variable not set")
-	return f"{base_url}{url}"
+	alltalk.initialize_client()
+	return f"{alltalk.base_url}{url}"
 
 
 class alltalk:
 	client = None
+	base_url = ''
 	headers = {"Accept": "application/json", "Content-Type": "application/json"}
 
+	# None until the first streaming request tells us whether the server has the endpoint
+	streaming_supported: Union[bool, None] = None
+	# the server generates one clip at a time; holding this only while generating
+	# lets the download of one chunk overlap the generation of the next
+	generate_lock = threading.Lock()
+
 	@classmethod
 	def initialize_client(cls):
 		if cls.client is None:
@@ -29,10 +34,8 @@ class alltalk:
 			if not base_url:
 				raise ValueError("ALLTALK_BASE_URL environment variable not set")
 			print(f"Initializing AllTalk client with base URL: {base_url}")
-			cls.base_url = base_url
-			client = requests.Session()
-			cls.client = client
-			cls.client.headers.update(cls.headers)
+			cls.base_url = base_url.rstrip('/')
+			cls.client = pool.session()
 
 	@classmethod
 	def getVoices(cls, ) -> list[dict]:
@@ -40,7 +43,7 @@ class alltalk:
 		assert cls.client is not None
 
 		url = '/api/voices'
-		response = cls.client.get(get_url(url))
+		response = cls.client.get(get_url(url), headers=cls.headers)
 		data = response.json()
 		return data['voices']
 
@@ -50,29 +53,191 @@ class alltalk:
 		assert cls.client is not None
 
 		url = '/api/currentsettings'
-		response = cls.client.get(get_url(url))
+		response = cls.client.get(get_url(url), headers=cls.headers)
 		data = response.json()
 		return data['models_available']
 
 	@classmethod
-	def getSpeechB64(cls, text: str) -> str:
+	def generateRequest(cls, text: str) -> dict:
+		request = {'text_input': text}
+		if ALLTALK_VOICE:
+			request['character_voice_gen'] = ALLTALK_VOICE
+			request['language'] = ALLTALK_LANGUAGE
+		return request
+
+	@classmethod
+	def generateSpeech(cls, text: str) -> str:
+		"""Generate speech on the server and return the path of the output file"""
 		cls.initialize_client()
 		assert cls.client is not None
 
 		response = cls.client.post(
 		    get_url("/api/tts-generate"),
-		    data={"text_input": text},
+		    data=cls.generateRequest(text),
 		    headers={"Content-Type": "application/x-www-form-urlencoded"})
 
-		if response.ok:
-			data = response.json()
-			if data['status'] != 'generate-success':
-				print('tts failed: ' + response.text)
-				return ''
-			output_url_path = data['output_file_url']
-			response = cls.client.get(get_url(output_url_path))
-			audio_base64 = base64.b64encode(response.content).decode('utf-8')
-			return audio_base64
-		else:
-			print('tts failed: ' + response.text)
-			return ''
+		if not response.ok:
+			raise ProviderError('alltalk', 'tts failed: ' + response.text,
+			                    response.status_code)
+		data = response.json()
+		if data['status'] != 'generate-success':
+			raise ProviderError('alltalk', 'tts failed: ' + response.text,
+			                    response.status_code)
+		return data['output_file_url']
+
+	@classmethod
+	async def generateSpeechAsync(cls, text: str) -> str:
+		cls.initialize_client()
+
+		response = await pool.async_client().post(get_url("/api/tts-generate"),
+		                                          data=cls.generateRequest(text))
+
+		if response.is_error:
+			raise ProviderError('alltalk', 'tts failed: ' + response.text,
+			                    response.status_code)
+		data = response.json()
+		if data['status'] != 'generate-success':
+			raise ProviderError('alltalk', 'tts failed: ' + response.text,
+			                    response.status_code)
+		return data['output_file_url']
+
+	@classmethod
+	def streamingRequest(cls, text: str) -> dict:
+		request = {
+		    'text': text,
+		    'language': ALLTALK_LANGUAGE,
+		    'output_file': 'stream_output.wav'
+		}
+		# without a voice the server uses the one it's configured with
+		if ALLTALK_VOICE:
+			request['voice'] = ALLTALK_VOICE
+		return request
+
+	@classmethod
+	def openStream(cls, text: str) -> Union[requests.Response, None]:
+		"""
+		Request speech from the streaming endpoint (generation and download in one round trip).
+		Returns None if the server doesn't support streaming.
+		The server keeps generating while the body streams, so the generate lock
+		is held until the response is closed.
+		"""
+		cls.initialize_client()
+		assert cls.client is not None
+
+		cls.generate_lock.acquire()
+		try:
+			response = cls.client.post(get_url("/api/tts-generate-streaming"),
+			                           data=cls.streamingRequest(text),
+			                           stream=True)
+		except BaseException:
+			cls.generate_lock.release()
+			raise
+		if response.status_code in [404, 405]:
+			response.close()
+			cls.generate_lock.release()
+			print('AllTalk server does not support streaming, falling back')
+			cls.streaming_supported = False
+			return None
+		if not response.ok:
+			message = response.text
+			response.close()
+			cls.generate_lock.release()
+			raise ProviderError('alltalk', 'tts failed: ' + message,
+			                    response.status_code)
+		cls.streaming_supported = True
+		if not release_on_close(response, None, cls.generate_lock.release):
+			cls.generate_lock.release()
+		return response
+
+	@classmethod
+	def iterSpeech(cls,
+	               text: str,
+	               chunk_size=STREAM_CHUNK_SIZE,
+	               streaming=ALLTALK_STREAMING) -> Iterator[bytes]:
+		if streaming and cls.streaming_supported is not False:
+			response = cls.openStream(text)
+			if response is not None:
+
+				def iter_stream():
+					with response:
+						yield from response.iter_content(chunk_size=chunk_size)
+
+				return iter_stream()
+
+		with cls.generate_lock:
+			output_url_path = cls.generateSpeech(text)
+		assert cls.client is not None
+		client = cls.client
+
+		def iter_file():
+			with client.get(get_url(output_url_path), stream=True) as response:
+				if not response.ok:
+					raise ProviderError('alltalk', 'tts fetch failed: ' + response.text,
+					                    response.status_code)
+				yield from response.iter_content(chunk_size=chunk_size)
+
+		return iter_file()
+
+	@classmethod
+	async def aiterSpeech(cls,
+	                      text: str,
+	                      chunk_size=STREAM_CHUNK_SIZE,
+	                      streaming=ALLTALK_STREAMING) -> AsyncIterator[bytes]:
+		cls.initialize_client()
+		client = pool.async_client()
+
+		if streaming and cls.streaming_supported is not False:
+			request = client.build_request('POST',
+			                               get_url("/api/tts-generate-streaming"),
+			                               data=cls.streamingRequest(text))
+			response = await client.send(request, stream=True)
+			try:
+				if response.status_code in [404, 405]:
+					cls.streaming_supported = False
+				elif response.is_error:
+					await response.aread()
+					raise ProviderError('alltalk', 'tts failed: ' + response.text,
+					                    response.status_code)
+				else:
+					cls.streaming_supported = True
+					async for chunk in response.aiter_bytes(chunk_size):
+						yield chunk
+					return
+			finally:
+				await response.aclose()
+
+		output_url_path = await cls.generateSpeechAsync(text)
+		async with client.stream('GET', get_url(output_url_path)) as response:
+			if response.is_error:
+				await response.aread()
+				raise ProviderError('alltalk', 'tts fetch failed: ' + response.text,
+				                    response.status_code)
+			async for chunk in response.aiter_bytes(chunk_size):
+				yield chunk
+
+	@classmethod
+	def writeSpeech(cls, text: str, dest: Sink, streaming=ALLTALK_STREAMING) -> dict:
+		written = write_chunks(cls.iterSpeech(text, streaming=streaming), dest)
+		return {'bytes': written, 'request_id': None}
+
+	@classmethod
+	async def writeSpeechAsync(cls,
+	                           text: str,
+	                           dest: Sink,
+	                           streaming=ALLTALK_STREAMING) -> dict:
+		written = await awrite_chunks(cls.aiterSpeech(text, streaming=streaming),
+		                              dest)
+		return {'bytes': written, 'request_id': None}
+
+	# base64 adapter, kept for the notebooks
+	@classmethod
+	def getSpeechB64(cls, text: str) -> str:
+		audio = b''.join(cls.iterSpeech(text))
+		return base64.b64encode(audio).decode('utf-8')
+
+	@classmethod
+	async def getSpeechB64Async(cls, text: str) -> str:
+		audio = bytearray()
+		async for chunk in cls.aiterSpeech(text):
+			audio += chunk
+		return base64.b64encode(audio).decode('utf-8')
@@ -1,13 +1,14 @@
 import os
 import requests
+import httpx
 import base64
 import typing
-from io import BytesIO
 from elevenlabs import ElevenLabs, Model
 from src.config import DEFAULT_TTS_MODEL, DEFAULT_TTS_VOICE
-from typing import Union
-
-STREAM_CHUNK_SIZE = 1024
+from src.clients import pool
+from src.clients.scheduler import scheduler
+from src.clients.stream import STREAM_CHUNK_SIZE, Sink, awrite_chunks, write_chunks
+from typing import AsyncIterator, Iterator, Union
 
 
 class elevenlabs:
@@ -20,13 +21,20 @@ class elevenlabs:
 	    "Content-Type": "application/json"
 	}
 
+	voice_settings = {
+	    "stability": 0.5,
+	    "similarity_boost": 0.8,
+	    "style": 0.0,
+	    "use_speaker_boost": True
+	}
+
 	@classmethod
 	def initialize_client(cls):
 		if cls.client is None:
 			api_key = os.getenv("ELEVENLABS_API_KEY")
 			if not api_key:
 				raise ValueError("ELEVENLABS_API_KEY environment variable not set")
-			cls.client = ElevenLabs(api_key=api_key)
+			cls.client = ElevenLabs(api_key=api_key, httpx_client=pool.client())
 			cls.headers['xi-api-key'] = api_key
 
 	@classmethod
@@ -35,7 +43,8 @@ class elevenlabs:
 		assert cls.client is not None
 
 		url = f"{cls.base_url}/voices"
-		response = requests.get(url, headers=cls.headers)
+		response = scheduler.call(
+		    'elevenlabs', lambda: pool.session().get(url, headers=cls.headers))
 		data = response.json()
 		return data['voices']
 
@@ -48,16 +57,21 @@ class elevenlabs:
 		return data
 
 	@classmethod
-	def getSpeechB64(cls,
-	                 text: str,
-	                 model_id=DEFAULT_TTS_MODEL,
-	                 voice_id=DEFAULT_TTS_VOICE,
-	                 previous_text: Union[str, None] = None,
-	                 next_text: Union[str, None] = None,
-	                 outformat='mp3_22050_32') -> str:
+	def speechRequest(cls,
+	                  text: str,
+	                  model_id=DEFAULT_TTS_MODEL,
+	                  voice_id=DEFAULT_TTS_VOICE,
+	                  previous_text: Union[str, None] = None,
+	                  next_text: Union[str, None] = None,
+	                  outformat='mp3_22050_32',
+	                  previous_request_ids: Union[list[str], None] = None,
+	                  next_request_ids: Union[list[str], None] = None,
+	                  timestamps=False) -> tuple[str, dict]:
 		cls.initialize_client()
 
-		url = f"{cls.base_url}/text-to-speech/{voice_id}/stream"
+		# with-timestamps returns JSON with the audio and per-character timings
+		endpoint = 'with-timestamps' if timestamps else 'stream'
+		url = f"{cls.base_url}/text-to-speech/{voice_id}/{endpoint}"
 
 		data = {
 		    "text": text,
@@ -65,33 +79,23 @@ class elevenlabs:
 		    'output_format': outformat,
 		    "previous_text": previous_text,
 		    "next_text": next_text,
-		    "voice_settings": {
-		        "stability": 0.5,
-		        "similarity_boost": 0.8,
-		        "style": 0.0,
-		        "use_speaker_boost": True
-		    }
+		    "voice_settings": cls.voice_settings
 		}
-
-		response = requests.post(url, headers=cls.headers, json=data, stream=True)
-
-		if response.ok:
-			audio_stream = BytesIO()
-			for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
-				audio_stream.write(chunk)
-			audio_content = audio_stream.getvalue()
-			audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-			return audio_base64
-		else:
-			print('bad response: ' + response.text)
-			return ''
+		# see https://elevenlabs.io/docs/api-reference/how-to-use-request-stitching
+		# the api accepts up to 3 of each
+		if previous_request_ids:
+			data['previous_request_ids'] = previous_request_ids[-3:]
+		if next_request_ids:
+			data['next_request_ids'] = next_request_ids[:3]
+		return url, data
 
 	@classmethod
-	def getSoundEffectB64(cls,
-	                      prompt: str,
-	                      duration_seconds=None,
-	                      prompt_influence=0.3) -> str:
+	def soundEffectRequest(cls,
+	                       prompt: str,
+	                       duration_seconds=None,
+	                       prompt_influence=0.3) -> tuple[str, dict]:
 		cls.initialize_client()
+
 		url = f"{cls.base_url}/sound-generation"
 
 		data = {
@@ -99,16 +103,192 @@ class elevenlabs:
 		    "duration_seconds": duration_seconds,
 		    "prompt_influence": prompt_influence
 		}
+		return url, data
+
+	@classmethod
+	def postAudio(cls, url: str, data: dict) -> requests.Response:
+		return scheduler.call(
+		    'elevenlabs', lambda: pool.session().post(
+		        url, headers=cls.headers, json=data, stream=True))
+
+	@classmethod
+	async def postAudioAsync(cls, url: str, data: dict) -> httpx.Response:
+		client = pool.async_client()
+		request = client.build_request('POST', url, headers=cls.headers, json=data)
+		return await scheduler.call_async(
+		    'elevenlabs', lambda: client.send(request, stream=True))
+
+	@classmethod
+	def postJson(cls, url: str, data: dict) -> requests.Response:
+		return scheduler.call(
+		    'elevenlabs',
+		    lambda: pool.session().post(url, headers=cls.headers, json=data))
+
+	@classmethod
+	async def postJsonAsync(cls, url: str, data: dict) -> httpx.Response:
+		client = pool.async_client()
+		return await scheduler.call_async(
+		    'elevenlabs', lambda: client.post(url, headers=cls.headers, json=data))
+
+	@classmethod
+	def iterAudio(cls,
+	              url: str,
+	              data: dict,
+	              chunk_size=STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+		with cls.postAudio(url, data) as response:
+			yield from response.iter_content(chunk_size=chunk_size)
+
+	@classmethod
+	def writeAudio(cls,
+	               url: str,
+	               data: dict,
+	               dest: Sink,
+	               chunk_size=STREAM_CHUNK_SIZE) -> dict:
+		"""Stream audio to `dest`, returns the bytes written and the request id"""
+		with cls.postAudio(url, data) as response:
+			written = write_chunks(response.iter_content(chunk_size=chunk_size),
+			                       dest)
+			return {'bytes': written, 'request_id': response.headers.get('request-id')}
+
+	@classmethod
+	async def aiterAudio(cls,
+	                     url: str,
+	                     data: dict,
+	                     chunk_size=STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+		response = await cls.postAudioAsync(url, data)
+		try:
+			async for chunk in response.aiter_bytes(chunk_size):
+				yield chunk
+		finally:
+			await response.aclose()
+
+	@classmethod
+	async def writeAudioAsync(cls,
+	                          url: str,
+	                          data: dict,
+	                          dest: Sink,
+	                          chunk_size=STREAM_CHUNK_SIZE) -> dict:
+		response = await cls.postAudioAsync(url, data)
+		try:
+			written = await awrite_chunks(response.aiter_bytes(chunk_size), dest)
+			return {'bytes': written, 'request_id': response.headers.get('request-id')}
+		finally:
+			await response.aclose()
+
+	@classmethod
+	def iterSpeech(cls, text: str, **kwargs) -> Iterator[bytes]:
+		"""Stream synthesized audio as raw bytes (see `speechRequest` for kwargs)"""
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.speechRequest(text, **kwargs)
+		return cls.iterAudio(url, data, chunk_size)
+
+	@classmethod
+	def aiterSpeech(cls, text: str, **kwargs) -> AsyncIterator[bytes]:
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.speechRequest(text, **kwargs)
+		return cls.aiterAudio(url, data, chunk_size)
+
+	@classmethod
+	def writeSpeech(cls, text: str, dest: Sink, **kwargs) -> dict:
+		"""Stream synthesized audio to a path or file-like object"""
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.speechRequest(text, **kwargs)
+		return cls.writeAudio(url, data, dest, chunk_size)
+
+	@classmethod
+	async def writeSpeechAsync(cls, text: str, dest: Sink, **kwargs) -> dict:
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.speechRequest(text, **kwargs)
+		return await cls.writeAudioAsync(url, data, dest, chunk_size)
+
+	@classmethod
+	def writeSpeechWithTimestamps(cls, text: str, dest: Sink, **kwargs) -> dict:
+		"""
+		Synthesize to `dest` along with character timings (see `speechRequest` for kwargs).
+		Returns the bytes written, the request id and the `alignment`: lists of
+		'characters', 'character_start_times_seconds' and 'character_end_times_seconds'.
+		"""
+		url, data = cls.speechRequest(text, timestamps=True, **kwargs)
+		response = cls.postJson(url, data)
+		body = response.json()
+		written = write_chunks([base64.b64decode(body['audio_base64'])], dest)
+		return {
+		    'bytes': written,
+		    'request_id': response.headers.get('request-id'),
+		    'alignment': body.get('alignment')
+		}
+
+	@classmethod
+	async def writeSpeechWithTimestampsAsync(cls, text: str, dest: Sink,
+	                                         **kwargs) -> dict:
+		url, data = cls.speechRequest(text, timestamps=True, **kwargs)
+		response = await cls.postJsonAsync(url, data)
+		body = response.json()
+		written = write_chunks([base64.b64decode(body['audio_base64'])], dest)
+		return {
+		    'bytes': written,
+		    'request_id': response.headers.get('request-id'),
+		    'alignment': body.get('alignment')
+		}
+
+	@classmethod
+	def iterSoundEffect(cls, prompt: str, **kwargs) -> Iterator[bytes]:
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.soundEffectRequest(prompt, **kwargs)
+		return cls.iterAudio(url, data, chunk_size)
+
+	@classmethod
+	def aiterSoundEffect(cls, prompt: str, **kwargs) -> AsyncIterator[bytes]:
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.soundEffectRequest(prompt, **kwargs)
+		return cls.aiterAudio(url, data, chunk_size)
+
+	@classmethod
+	def writeSoundEffect(cls, prompt: str, dest: Sink, **kwargs) -> dict:
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.soundEffectRequest(prompt, **kwargs)
+		return cls.writeAudio(url, data, dest, chunk_size)
+
+	@classmethod
+	async def writeSoundEffectAsync(cls, prompt: str, dest: Sink,
+	                                **kwargs) -> dict:
+		chunk_size = kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+		url, data = cls.soundEffectRequest(prompt, **kwargs)
+		return await cls.writeAudioAsync(url, data, dest, chunk_size)
+
+	# base64 adapters, kept for the notebooks
+
+	@classmethod
+	def getSpeechB64(cls,
+	                 text: str,
+	                 model_id=DEFAULT_TTS_MODEL,
+	                 voice_id=DEFAULT_TTS_VOICE,
+	                 previous_text: Union[str, None] = None,
+	                 next_text: Union[str, None] = None,
+	                 outformat='mp3_22050_32') -> str:
+		audio = b''.join(
+		    cls.iterSpeech(text,
+		                   model_id=model_id,
+		                   voice_id=voice_id,
+		                   previous_text=previous_text,
+		                   next_text=next_text,
+		                   outformat=outformat))
+		return base64.b64encode(audio).decode('utf-8')
 
-		response = requests.post(url, headers=cls.headers, json=data, stream=True)
-
-		if response.ok:
-			audio_stream = BytesIO()
-			for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
-				audio_stream.write(chunk)
-			audio_content = audio_stream.getvalue()
-			audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-			return audio_base64
-		else:
-			print('bad response: ' + response.text)
-			return ''
+	@classmethod
+	def getSoundEffectB64(cls,
+	                      prompt: str,
+	                      duration_seconds=None,
+	                      prompt_influence=0.3) -> str:
+		audio = b''.join(
+		    cls.iterSoundEffect(prompt,
+		                        duration_seconds=duration_seconds,
+		                        prompt_influence=prompt_influence))
+		return base64.b64encode(audio).decode('utf-8')
+
+	@classmethod
+	async def getSpeechB64Async(cls, text: str, **kwargs) -> str:
+		audio = bytearray()
+		async for chunk in cls.aiterSpeech(text, **kwargs):
+			audio += chunk
+		return base64.b64encode(audio).decode('utf-8')
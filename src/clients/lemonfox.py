@@ -1,10 +1,21 @@
 import os
-from openai import OpenAI
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, AsyncOpenAI
+from src.clients import pool
+from src.clients.scheduler import scheduler
+from src.config import LEMONFOX_COMPRESS, LEMONFOX_BITRATE, LEMONFOX_SEGMENT_SECONDS
+from src.tools.audio import SAMPLE_RATE, decode_pcm, encode_opus, find_silences, plan_segments
 from typing import Union
 
 
 class lemonfox:
 	client: Union[OpenAI, None] = None
+	base_url = "https://api.lemonfox.ai/v1"
+	api_key = ''
+	# sizes of the last transcription's upload: source file, bytes sent, bytes received, pieces
+	last_upload: dict = {}
 
 	@classmethod
 	def initialize_client(cls):
@@ -12,31 +23,185 @@ class lemonfox:
 			api_key = os.getenv("LEMONFOX_API_KEY")
 			if not api_key:
 				raise ValueError("LEMONFOX_API_KEY environment variable not set")
+			cls.api_key = api_key
 			cls.client = OpenAI(api_key=api_key,
-			                    base_url="https://api.lemonfox.ai/v1")
+			                    base_url=cls.base_url,
+			                    http_client=pool.client(),
+			                    max_retries=0)
+
+	@classmethod
+	def async_client(cls) -> AsyncOpenAI:
+		# cheap to create, the connections live in the shared pool for the running loop
+		# retries are left to the scheduler
+		cls.initialize_client()
+		return AsyncOpenAI(api_key=cls.api_key,
+		                   base_url=cls.base_url,
+		                   http_client=pool.async_client(),
+		                   max_retries=0)
+
+	@classmethod
+	def prepareUploads(cls,
+	                   audio_path: str,
+	                   compress=LEMONFOX_COMPRESS) -> list[tuple[float, str, bytes]]:
+		"""
+		The (offset, filename, data) pieces to upload for `audio_path`: the file
+		as is, or encoded to Opus and, if it's long, split at silences
+		"""
+		if not compress:
+			with open(audio_path, 'rb') as f:
+				return [(0.0, os.path.basename(audio_path), f.read())]
+
+		audio = decode_pcm(audio_path)
+		duration = len(audio) / SAMPLE_RATE
+		if duration < LEMONFOX_SEGMENT_SECONDS * 1.5:
+			return [(0.0, 'audio.ogg', encode_opus(audio, LEMONFOX_BITRATE))]
+
+		pieces = plan_segments(duration, find_silences(audio, SAMPLE_RATE),
+		                       LEMONFOX_SEGMENT_SECONDS)
+		return [(start, f'audio_{i}.ogg',
+		         encode_opus(audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)],
+		                     LEMONFOX_BITRATE))
+		        for i, (start, end) in enumerate(pieces)]
+
+	@classmethod
+	def recordUpload(cls, audio_path: str, uploads: list, response_bytes: int):
+		cls.last_upload = {
+		    'source_bytes': os.path.getsize(audio_path),
+		    'upload_bytes': sum(len(data) for _, _, data in uploads),
+		    'response_bytes': response_bytes,
+		    'pieces': len(uploads)
+		}
+		print(f"lemonfox: uploaded {cls.last_upload['upload_bytes']} bytes "
+		      f"in {len(uploads)} pieces ({cls.last_upload['source_bytes']} "
+		      f"bytes source), received {response_bytes} bytes")
 
 	@classmethod
 	def getTranscript(cls,
 	                  audio_path: str,
 	                  prompt='',
 	                  granularity='segment',
-	                  outformat='verbose_json'):
+	                  outformat='verbose_json',
+	                  compress=LEMONFOX_COMPRESS):
+		"""
+		Transcribe `audio_path`. Unless `compress` is off, the audio is uploaded as
+		Opus and long audio is split into pieces that are transcribed concurrently
+		and merged. Sizes are recorded in `last_upload`.
+		"""
 		cls.initialize_client()
 		assert cls.client is not None
+		client = cls.client
+
+		uploads = cls.prepareUploads(audio_path, compress)
+		# pieces are merged from verbose json
+		piece_format = outformat if len(uploads) == 1 else 'verbose_json'
+
+		def transcribe(filename: str, data: bytes):
+			return client.audio.transcriptions.create(
+			    # `model` is not actually used by lemonfox
+			    model='whisper-1',
+			    file=(filename, data),
+			    prompt=prompt,
+			    timestamp_granularities=[granularity],
+			    response_format=piece_format,
+			    language='en')
+
+		with ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+			responses = list(
+			    executor.map(
+			        lambda upload: scheduler.call(
+			            'lemonfox', lambda: transcribe(upload[1], upload[2])),
+			        uploads))
+
+		return cls.transcriptResult(audio_path, uploads, responses, outformat)
+
+	@classmethod
+	async def getTranscriptAsync(cls,
+	                             audio_path: str,
+	                             prompt='',
+	                             granularity='segment',
+	                             outformat='verbose_json',
+	                             compress=LEMONFOX_COMPRESS):
+		client = cls.async_client()
+
+		uploads = await asyncio.to_thread(cls.prepareUploads, audio_path, compress)
+		piece_format = outformat if len(uploads) == 1 else 'verbose_json'
+
+		async def transcribe(filename: str, data: bytes):
+			return await client.audio.transcriptions.create(
+			    model='whisper-1',
+			    file=(filename, data),
+			    prompt=prompt,
+			    timestamp_granularities=[granularity],
+			    response_format=piece_format,
+			    language='en')
+
+		responses = await asyncio.gather(*[
+		    scheduler.call_async('lemonfox',
+		                         lambda upload=upload: transcribe(upload[1], upload[2]))
+		    for upload in uploads
+		])
+
+		return cls.transcriptResult(audio_path, uploads, responses, outformat)
+
+	@classmethod
+	def transcriptResult(cls, audio_path: str, uploads: list, responses: list,
+	                     outformat: str):
+		if len(uploads) == 1:
+			response = responses[0]
+			if outformat == 'verbose_json' or outformat == 'json':
+				response = str(response.model_dump_json())
+			cls.recordUpload(audio_path, uploads, len(str(response)))
+			return response
+
+		pieces = [json.loads(response.model_dump_json()) for response in responses]
+		merged = merge_verbose_json([(offset, piece) for (offset, _, _), piece in zip(
+		    uploads, pieces)])
+		cls.recordUpload(audio_path, uploads,
+		                 sum(len(json.dumps(piece)) for piece in pieces))
+		if outformat == 'srt':
+			return format_srt(merged['segments'])
+		if outformat == 'text':
+			return merged['text']
+		if outformat == 'json':
+			return json.dumps({'text': merged['text']})
+		return json.dumps(merged)
+
+
+def merge_verbose_json(pieces: list[tuple[float, dict]]) -> dict:
+	"""Merge verbose json transcripts of consecutive pieces, offsetting their timestamps"""
+	merged: dict = {**pieces[0][1], 'segments': [], 'text': ''}
+	words = []
+	texts = []
+	for offset, piece in pieces:
+		for segment in piece.get('segments') or []:
+			merged['segments'].append({
+			    **segment, 'id': len(merged['segments']),
+			    'start': segment['start'] + offset,
+			    'end': segment['end'] + offset
+			})
+		for word in piece.get('words') or []:
+			words.append({
+			    **word, 'start': word['start'] + offset,
+			    'end': word['end'] + offset
+			})
+		texts.append(piece.get('text', '').strip())
+	merged['text'] = ' '.join(text for text in texts if text)
+	if words:
+		merged['words'] = words
+	if pieces[-1][1].get('duration') is not None:
+		merged['duration'] = pieces[-1][0] + pieces[-1][1]['duration']
+	return merged
+
+
+def srt_timestamp(seconds: float) -> str:
+	ms = int(round(seconds * 1000))
+	return f'{ms // 3600000:02}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02},{ms % 1000:03}'
+
 
-		audio = open(audio_path, 'rb')
-		response = cls.client.audio.transcriptions.create(
-		    # `model` is not actually used by lemonfox
-		    model='whisper-1',
-		    file=audio,
-		    prompt=prompt,
-		    timestamp_granularities=[granularity],
-		    response_format=outformat,
-		    language='en')
-		if outformat == 'verbose_json' or outformat == 'json':
-			return str(response.model_dump_json())
-
-		return response
+def format_srt(segments: list[dict]) -> str:
+	return ''.join(
+	    f'{i + 1}\n{srt_timestamp(s["start"])} --> {srt_timestamp(s["end"])}\n'
+	    f'{s["text"].strip()}\n\n' for i, s in enumerate(segments))
 
 
 # note on lemonfox about the `prompt` arg for whisper:
@@ -1,5 +1,6 @@
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from src.clients import pool
 from src.config import DEFAULT_OLLAMA_CHAT_MODEL, DEFAULT_OLLAMA_VISION_MODEL
 from typing import Union
 import base64
@@ -7,6 +8,8 @@ import base64
 
 class ollama:
 	client: Union[OpenAI, None] = None
+	api_key = ''
+	base_url = ''
 
 	@classmethod
 	def initialize_client(cls):
@@ -17,7 +20,19 @@ class ollama:
 				raise ValueError("OLLAMA_API_KEY environment variable not set")
 			if not base_url:
 				raise ValueError("OLLAMA_BASE_URL environment variable not set")
-			cls.client = OpenAI(api_key=api_key, base_url=base_url)
+			cls.api_key = api_key
+			cls.base_url = base_url
+			cls.client = OpenAI(api_key=api_key,
+			                    base_url=base_url,
+			                    http_client=pool.client())
+
+	@classmethod
+	def async_client(cls) -> AsyncOpenAI:
+		# cheap to create, the connections live in the shared pool for the running loop
+		cls.initialize_client()
+		return AsyncOpenAI(api_key=cls.api_key,
+		                   base_url=cls.base_url,
+		                   http_client=pool.async_client())
 
 	@classmethod
 	def getModels(cls):
@@ -25,6 +40,38 @@ class ollama:
 		assert cls.client is not None
 		return cls.client.models.list()
 
+	@classmethod
+	def chatRequest(cls,
+	                prompt: str,
+	                user_input='',
+	                temperature=0.15,
+	                max_tokens=512,
+	                json=False,
+	                model=DEFAULT_OLLAMA_CHAT_MODEL) -> dict:
+		messages = []
+		messages.append({'role': 'system', 'content': prompt})
+		if user_input:
+			messages.append({'role': 'user', 'content': user_input})
+
+		request = {
+		    'model': model,
+		    'max_tokens': max_tokens,
+		    'temperature': temperature,
+		    'messages': messages
+		}
+		if json is not False:
+			request['response_format'] = {
+			    'type': 'json_object',
+			}
+		return request
+
+	@staticmethod
+	def chatContent(response) -> str:
+		if response.choices[0].finish_reason == 'length':
+			print('Warning: LLM output was cut off')
+		return response.choices[0].message.content if response.choices[
+		    0].message.content is not None else ""
+
 	@classmethod
 	def chatCompletion(cls,
 	                   prompt: str,
@@ -36,41 +83,32 @@ class ollama:
 		cls.initialize_client()
 		assert cls.client is not None
 
-		messages = []
-		messages.append({'role': 'system', 'content': prompt})
-		if user_input:
-			messages.append({'role': 'user', 'content': user_input})
+		response = cls.client.chat.completions.create(**cls.chatRequest(
+		    prompt, user_input, temperature, max_tokens, json, model))
+		return cls.chatContent(response)
 
-		if json is False:
-			response = cls.client.chat.completions.create(model=model,
-			                                              max_tokens=max_tokens,
-			                                              temperature=temperature,
-			                                              messages=messages)
-		else:
-			response = cls.client.chat.completions.create(model=model,
-			                                              max_tokens=max_tokens,
-			                                              temperature=temperature,
-			                                              messages=messages,
-			                                              response_format={
-			                                                  'type': 'json_object',
-			                                              })
-		if response.choices[0].finish_reason == 'length':
-			print('Warning: LLM output was cut off')
-		return response.choices[0].message.content if response.choices[
-		    0].message.content is not None else ""
+	@classmethod
+	async def chatCompletionAsync(cls,
+	                              prompt: str,
+	                              user_input='',
+	                              temperature=0.15,
+	                              max_tokens=512,
+	                              json=False,
+	                              model=DEFAULT_OLLAMA_CHAT_MODEL):
+		client = cls.async_client()
+		response = await client.chat.completions.create(**cls.chatRequest(
+		    prompt, user_input, temperature, max_tokens, json, model))
+		return cls.chatContent(response)
 
 	@classmethod
-	def imageQuery(
+	def imageRequest(
 	    cls,
 	    image_path: str,
 	    prompt: str,
 	    system_prompt="The following is a message followed by an image. Assistant's task is to provide a response based on the prompt and the image without judgement.",
 	    max_tokens=512,
 	    temperature=0.5,
-	    model=DEFAULT_OLLAMA_VISION_MODEL):
-		cls.initialize_client()
-		assert cls.client is not None
-
+	    model=DEFAULT_OLLAMA_VISION_MODEL) -> dict:
 		with open(image_path, 'rb') as f:
 			image_data = f.read()
 			image_data = base64.b64encode(image_data).decode('utf-8')
@@ -91,21 +129,43 @@ class ollama:
 		        'image_url': image_url
 		    }]
 		})
-		# print(messages)
 
-		# print(f"Image URL: {image_url}")
+		return {
+		    'model': model,
+		    'max_tokens': max_tokens,
+		    'temperature': temperature,
+		    'messages': messages
+		}
+
+	@classmethod
+	def imageQuery(
+	    cls,
+	    image_path: str,
+	    prompt: str,
+	    system_prompt="The following is a message followed by an image. Assistant's task is to provide a response based on the prompt and the image without judgement.",
+	    max_tokens=512,
+	    temperature=0.5,
+	    model=DEFAULT_OLLAMA_VISION_MODEL):
+		cls.initialize_client()
+		assert cls.client is not None
 
-		response = cls.client.chat.completions.create(
-		    model=model,
-		    max_tokens=max_tokens,
-		    temperature=temperature,
-		    # images=[image_path],
-		    messages=messages)
+		response = cls.client.chat.completions.create(**cls.imageRequest(
+		    image_path, prompt, system_prompt, max_tokens, temperature, model))
+		return cls.chatContent(response)
 
-		if response.choices[0].finish_reason == 'length':
-			print('Warning: LLM output was cut off')
-		return response.choices[0].message.content if response.choices[
-		    0].message.content is not None else ""
+	@classmethod
+	async def imageQueryAsync(
+	    cls,
+	    image_path: str,
+	    prompt: str,
+	    system_prompt="The following is a message followed by an image. Assistant's task is to provide a response based on the prompt and the image without judgement.",
+	    max_tokens=512,
+	    temperature=0.5,
+	    model=DEFAULT_OLLAMA_VISION_MODEL):
+		client = cls.async_client()
+		response = await client.chat.completions.create(**cls.imageRequest(
+		    image_path, prompt, system_prompt, max_tokens, temperature, model))
+		return cls.chatContent(response)
 
 	@classmethod
 	def reason(cls, prompt: str) -> tuple:
@@ -1,11 +1,15 @@
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from src.clients import pool
+from src.clients.scheduler import scheduler
 from src.config import DEFAULT_CHAT_MODEL
 from typing import Union
 
 
 class openrouter:
 	client: Union[OpenAI, None] = None
+	base_url = "https://openrouter.ai/api/v1"
+	api_key = ''
 
 	@classmethod
 	def initialize_client(cls):
@@ -13,39 +17,83 @@ class openrouter:
 			api_key = os.getenv("OPENROUTER_API_KEY")
 			if not api_key:
 				raise ValueError("OPENROUTER_API_KEY environment variable not set")
+			cls.api_key = api_key
 			cls.client = OpenAI(api_key=api_key,
-			                    base_url="https://openrouter.ai/api/v1")
+			                    base_url=cls.base_url,
+			                    http_client=pool.client(),
+			                    max_retries=0)
 
 	@classmethod
-	def chatCompletion(cls,
-	                   prompt: str,
-	                   user_input='',
-	                   temperature=0.15,
-	                   max_tokens=512,
-	                   json=False,
-	                   model=DEFAULT_CHAT_MODEL):
+	def async_client(cls) -> AsyncOpenAI:
+		# cheap to create, the connections live in the shared pool for the running loop
+		# retries are left to the scheduler
 		cls.initialize_client()
-		assert cls.client is not None
+		return AsyncOpenAI(api_key=cls.api_key,
+		                   base_url=cls.base_url,
+		                   http_client=pool.async_client(),
+		                   max_retries=0)
 
+	@classmethod
+	def chatRequest(cls,
+	                prompt: str,
+	                user_input='',
+	                temperature=0.15,
+	                max_tokens=512,
+	                json=False,
+	                model=DEFAULT_CHAT_MODEL) -> dict:
 		messages = []
 		messages.append({'role': 'system', 'content': prompt})
 		if user_input:
 			messages.append({'role': 'user', 'content': user_input})
 
-		if json is False:
-			response = cls.client.chat.completions.create(model=model,
-			                                              max_tokens=max_tokens,
-			                                              temperature=temperature,
-			                                              messages=messages)
-		else:
-			response = cls.client.chat.completions.create(model=model,
-			                                              max_tokens=max_tokens,
-			                                              temperature=temperature,
-			                                              messages=messages,
-			                                              response_format={
-			                                                  'type': 'json_object',
-			                                              })
+		request = {
+		    'model': model,
+		    'max_tokens': max_tokens,
+		    'temperature': temperature,
+		    'messages': messages
+		}
+		if json is not False:
+			request['response_format'] = {
+			    'type': 'json_object',
+			}
+		return request
+
+	@staticmethod
+	def chatContent(response) -> str:
 		if response.choices[0].finish_reason == 'length':
 			print('Warning: LLM output was cut off')
 		return response.choices[0].message.content if response.choices[
 		    0].message.content is not None else ""
+
+	@classmethod
+	def chatCompletion(cls,
+	                   prompt: str,
+	                   user_input='',
+	                   temperature=0.15,
+	                   max_tokens=512,
+	                   json=False,
+	                   model=DEFAULT_CHAT_MODEL):
+		cls.initialize_client()
+		assert cls.client is not None
+
+		client = cls.client
+		request = cls.chatRequest(prompt, user_input, temperature, max_tokens, json,
+		                          model)
+		response = scheduler.call(
+		    'openrouter', lambda: client.chat.completions.create(**request))
+		return cls.chatContent(response)
+
+	@classmethod
+	async def chatCompletionAsync(cls,
+	                              prompt: str,
+	                              user_input='',
+	                              temperature=0.15,
+	                              max_tokens=512,
+	                              json=False,
+	                              model=DEFAULT_CHAT_MODEL):
+		client = cls.async_client()
+		request = cls.chatRequest(prompt, user_input, temperature, max_tokens, json,
+		                          model)
+		response = await scheduler.call_async(
+		    'openrouter', lambda: client.chat.completions.create(**request))
+		return cls.chatContent(response)
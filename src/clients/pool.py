@@ -0,0 +1,79 @@
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Union
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from src.config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP_TIMEOUT, HTTP_HTTP2
+
+# one set of pooled connections shared by every client, so repeated calls
+# reuse keep-alive connections instead of doing a fresh TCP+TLS handshake
+
+lock = threading.Lock()
+sync_session: Union[requests.Session, None] = None
+sync_client: Union[httpx.Client, None] = None
+# event loop -> client
+async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def limits() -> httpx.Limits:
+	return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+	                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+	                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+
+
+def timeout() -> httpx.Timeout:
+	return httpx.Timeout(HTTP_TIMEOUT, connect=10.0)
+
+
+def http2_available() -> bool:
+	return bool(HTTP_HTTP2) and importlib.util.find_spec('h2') is not None
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+	"""Gives requests without a `timeout` the pool's (connect, read) timeout, so a stalled connection can't hang forever"""
+
+	def send(self, request, **kwargs):
+		if kwargs.get('timeout') is None:
+			kwargs['timeout'] = (10.0, HTTP_TIMEOUT)
+		return super().send(request, **kwargs)
+
+
+def session() -> requests.Session:
+	"""Shared `requests` session for the sync clients that stream with `requests`"""
+	global sync_session
+	with lock:
+		if sync_session is None:
+			sync_session = requests.Session()
+			adapter = TimeoutHTTPAdapter(pool_connections=HTTP_MAX_CONNECTIONS,
+			                             pool_maxsize=HTTP_MAX_CONNECTIONS)
+			sync_session.mount('http://', adapter)
+			sync_session.mount('https://', adapter)
+		return sync_session
+
+
+def client() -> httpx.Client:
+	"""Shared `httpx` client, passed to the sync OpenAI-compatible clients"""
+	global sync_client
+	with lock:
+		if sync_client is None:
+			sync_client = httpx.Client(limits=limits(), timeout=timeout())
+		return sync_client
+
+
+def async_client() -> httpx.AsyncClient:
+	"""
+	Shared `httpx` async client for the running event loop.
+	httpx connections are bound to the loop they were opened on, so there is one pool per loop.
+	"""
+	loop = asyncio.get_running_loop()
+	with lock:
+		c = async_clients.get(loop)
+		if c is None or c.is_closed:
+			c = httpx.AsyncClient(limits=limits(),
+			                      timeout=timeout(),
+			                      http2=http2_available())
+			async_clients[loop] = c
+		return c
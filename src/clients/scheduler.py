@@ -0,0 +1,330 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional, TypeVar, Union
+import httpx
+import openai
+import requests
+from src.config import RATE_LIMITS
+
+T = TypeVar('T')
+
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+CONNECTION_ERRORS = (requests.ConnectionError, requests.Timeout,
+                     httpx.TransportError, openai.APIConnectionError)
+DURATION = re.compile(r'^(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?'
+                      r'(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$')
+
+
+class ProviderError(RuntimeError):
+	"""A request to a provider failed for good (after any retries)"""
+
+	def __init__(self,
+	             provider: str,
+	             message: str,
+	             status: Optional[int] = None,
+	             retryable=False):
+		super().__init__(f'{provider} request failed'
+		                 f'{f" ({status})" if status else ""}: {message}')
+		self.provider = provider
+		self.status = status
+		self.retryable = retryable
+
+
+def parse_seconds(value: str, now: float) -> Optional[float]:
+	"""
+	Parse a rate-limit header into seconds from now. Handles plain seconds,
+	epoch seconds/milliseconds, durations like '6m0s' and HTTP dates.
+	"""
+	value = value.strip()
+	try:
+		number = float(value)
+	except ValueError:
+		match = DURATION.match(value)
+		if match and any(match.groups()):
+			h, m, s, ms = (float(g) if g else 0.0 for g in match.groups())
+			return h * 3600 + m * 60 + s + ms / 1000
+		try:
+			return parsedate_to_datetime(value).timestamp() - now
+		except (TypeError, ValueError):
+			return None
+	if number > 1e12:  # epoch milliseconds
+		return number / 1000 - now
+	if number > 1e9:  # epoch seconds
+		return number - now
+	return number
+
+
+class ProviderLimiter:
+	"""Concurrency limit plus a token bucket for a single provider"""
+
+	def __init__(self, provider: str, limits: dict):
+		self.provider = provider
+		self.concurrency = limits['concurrency']
+		self.rate = limits['requests_per_minute'] / 60
+		self.burst = max(1, limits.get('burst', self.concurrency))
+		self.max_retries = limits['max_retries']
+		self.backoff_base = limits['backoff_base']
+		self.backoff_max = limits['backoff_max']
+
+		self.semaphore = threading.BoundedSemaphore(self.concurrency)
+		self.lock = threading.Lock()
+		self.tokens = float(self.burst)
+		self.updated = time.monotonic()
+		self.blocked_until = 0.0
+
+	def reserve(self) -> float:
+		"""Take a token and return how long to wait before using it"""
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.burst,
+			                  self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+			self.tokens -= 1
+			wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+			return max(wait, self.blocked_until - now)
+
+	def update(self, headers) -> Optional[float]:
+		"""
+		Read rate-limit headers from a response. When the provider says that we're
+		out of requests, nothing else is sent until the limit resets.
+		Returns the retry-after delay, if any.
+		"""
+		now = time.time()
+		retry_after = None
+		if 'retry-after' in headers:
+			retry_after = parse_seconds(headers['retry-after'], now)
+
+		block = retry_after
+		for suffix in ['-requests', '']:
+			remaining = headers.get(f'x-ratelimit-remaining{suffix}')
+			reset = headers.get(f'x-ratelimit-reset{suffix}')
+			if remaining is None or reset is None:
+				continue
+			try:
+				if float(remaining) > 0:
+					break
+			except ValueError:
+				break
+			reset_in = parse_seconds(reset, now)
+			if reset_in is not None:
+				block = max(block or 0.0, reset_in)
+			break
+
+		if block:
+			with self.lock:
+				self.blocked_until = max(self.blocked_until,
+				                         time.monotonic() + min(block, self.backoff_max))
+		return retry_after
+
+	def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+		"""Exponential backoff with full jitter, or the provider's retry-after"""
+		if retry_after is not None and retry_after > 0:
+			return min(retry_after, self.backoff_max)
+		delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+		return random.uniform(delay / 2, delay)
+
+
+class RateLimitScheduler:
+	"""
+	Runs provider requests within that provider's limits (see `rate_limits` in
+	config/config.yaml), retrying throttled/failed requests with backoff and
+	raising `ProviderError` once a request can't succeed.
+	"""
+
+	def __init__(self, limits: dict):
+		self.limits = limits
+		self.limiters: dict[str, ProviderLimiter] = {}
+		self.lock = threading.Lock()
+
+	def limiter(self, provider: str) -> ProviderLimiter:
+		with self.lock:
+			if provider not in self.limiters:
+				limits = {**self.limits['default'], **self.limits.get(provider, {})}
+				self.limiters[provider] = ProviderLimiter(provider, limits)
+			return self.limiters[provider]
+
+	def call(self, provider: str, send: Callable[[], T]) -> T:
+		"""
+		Call `send` (which makes one request and returns a `requests`/`httpx`
+		response, or raises) until it succeeds or runs out of retries.
+		"""
+		limiter = self.limiter(provider)
+		attempt = 0
+		while True:
+			time.sleep(limiter.reserve())
+			result: Any = None
+			error: Optional[Exception] = None
+			limiter.semaphore.acquire()
+			try:
+				result = send()
+			except Exception as e:
+				error = e
+			finally:
+				# a streamed body is still being generated/downloaded: keep the slot until it's closed
+				if not release_on_close(result, error, limiter.semaphore.release):
+					limiter.semaphore.release()
+
+			status, headers = response_info(result, error)
+			retry_after = limiter.update(headers) if headers is not None else None
+			if error is None and (status is None or status < 400):
+				return result
+
+			retryable = is_retryable(status, error)
+			if not retryable and error is not None and status is None:
+				raise error
+			if not retryable or attempt >= limiter.max_retries:
+				message = error_message(result, error)
+				raise ProviderError(provider, message, status, retryable) from error
+
+			close(result)
+			delay = limiter.backoff(attempt, retry_after)
+			print(f'{provider}: {status or type(error).__name__}, '
+			      f'retrying in {delay:.1f}s')
+			time.sleep(delay)
+			attempt += 1
+
+	async def call_async(self, provider: str, send: Callable[[],
+	                                                          Awaitable[T]]) -> T:
+		"""Async counterpart of `call`"""
+		limiter = self.limiter(provider)
+		attempt = 0
+		while True:
+			await asyncio.sleep(limiter.reserve())
+			await acquire_async(limiter.semaphore)
+			result: Any = None
+			error: Optional[Exception] = None
+			try:
+				result = await send()
+			except Exception as e:
+				error = e
+			finally:
+				if not release_on_close(result, error, limiter.semaphore.release):
+					limiter.semaphore.release()
+
+			status, headers = response_info(result, error)
+			retry_after = limiter.update(headers) if headers is not None else None
+			if error is None and (status is None or status < 400):
+				return result
+
+			retryable = is_retryable(status, error)
+			if not retryable and error is not None and status is None:
+				raise error
+			if isinstance(result, httpx.Response):
+				await result.aread()
+			if not retryable or attempt >= limiter.max_retries:
+				message = error_message(result, error)
+				if isinstance(result, httpx.Response):
+					await result.aclose()
+				raise ProviderError(provider, message, status, retryable) from error
+
+			if isinstance(result, httpx.Response):
+				await result.aclose()
+			delay = limiter.backoff(attempt, retry_after)
+			print(f'{provider}: {status or type(error).__name__}, '
+			      f'retrying in {delay:.1f}s')
+			await asyncio.sleep(delay)
+			attempt += 1
+
+
+async def acquire_async(semaphore: threading.BoundedSemaphore):
+	"""
+	Acquire a semaphore shared with sync callers without blocking the event
+	loop. If we're cancelled while waiting, the slot is given back once the
+	waiting thread gets it.
+	"""
+	acquire = asyncio.ensure_future(asyncio.to_thread(semaphore.acquire))
+	try:
+		await asyncio.shield(acquire)
+	except asyncio.CancelledError:
+		acquire.add_done_callback(lambda f: semaphore.release()
+		                          if not f.cancelled() and f.exception() is None
+		                          else None)
+		raise
+
+
+def release_on_close(result: Any, error: Optional[Exception],
+                     release: Callable[[], Any]) -> bool:
+	"""
+	When `result` is a successful response whose body hasn't been read yet
+	(`stream=True`), make closing it call `release` (once) and return True
+	"""
+	if error is not None or getattr(result, 'status_code', 400) >= 400:
+		return False
+	if isinstance(result, requests.Response):
+		streaming = not result._content_consumed
+		names = ['close']
+	elif isinstance(result, httpx.Response):
+		streaming = not result.is_stream_consumed and not result.is_closed
+		names = ['close', 'aclose']
+	else:
+		return False
+	if not streaming:
+		return False
+
+	released = threading.Event()
+
+	def release_once():
+		if not released.is_set():
+			released.set()
+			release()
+
+	for name in names:
+		original = getattr(result, name)
+		if asyncio.iscoroutinefunction(original):
+
+			async def aclose(original=original):
+				try:
+					await original()
+				finally:
+					release_once()
+
+			setattr(result, name, aclose)
+		else:
+
+			def close(original=original):
+				try:
+					original()
+				finally:
+					release_once()
+
+			setattr(result, name, close)
+	return True
+
+
+def response_info(result: Any, error: Optional[Exception]) -> tuple:
+	"""(status, headers) from a response or an API error"""
+	source: Any = result
+	if error is not None:
+		source = getattr(error, 'response', None)
+	status = getattr(source, 'status_code', None)
+	headers = getattr(source, 'headers', None)
+	return status, headers
+
+
+def is_retryable(status: Optional[int], error: Optional[Exception]) -> bool:
+	if status is not None:
+		return status in RETRY_STATUSES
+	return isinstance(error, CONNECTION_ERRORS)
+
+
+def error_message(result: Any, error: Optional[Exception]) -> str:
+	if error is not None:
+		return str(error)
+	try:
+		message = result.text
+	except Exception:
+		message = ''
+	close(result)
+	return message
+
+
+def close(result: Union[requests.Response, Any]):
+	if isinstance(result, requests.Response):
+		result.close()
+
+
+scheduler = RateLimitScheduler(RATE_LIMITS)
@@ -0,0 +1,56 @@
+import os
+from typing import AsyncIterator, BinaryIO, Iterable, Union
+
+# large reads keep the number of syscalls/python iterations per clip low
+STREAM_CHUNK_SIZE = 64 * 1024
+
+Sink = Union[str, BinaryIO]
+
+
+def write_chunks(chunks: Iterable[bytes], dest: Sink) -> int:
+	"""
+	Write streamed chunks to a file path or a writable file-like object.
+	Paths are written to a temp file first so a failed download never leaves a partial file behind.
+	"""
+	if not isinstance(dest, str):
+		written = 0
+		for chunk in chunks:
+			dest.write(chunk)
+			written += len(chunk)
+		return written
+
+	dest_dir = os.path.dirname(dest)
+	if dest_dir:
+		os.makedirs(dest_dir, exist_ok=True)
+	tmp_path = f'{dest}.part'
+	try:
+		with open(tmp_path, 'wb') as f:
+			written = write_chunks(chunks, f)
+		os.replace(tmp_path, dest)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+	return written
+
+
+async def awrite_chunks(chunks: AsyncIterator[bytes], dest: Sink) -> int:
+	"""Async counterpart of `write_chunks`"""
+	if not isinstance(dest, str):
+		written = 0
+		async for chunk in chunks:
+			dest.write(chunk)
+			written += len(chunk)
+		return written
+
+	dest_dir = os.path.dirname(dest)
+	if dest_dir:
+		os.makedirs(dest_dir, exist_ok=True)
+	tmp_path = f'{dest}.part'
+	try:
+		with open(tmp_path, 'wb') as f:
+			written = await awrite_chunks(chunks, f)
+		os.replace(tmp_path, dest)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+	return written
@@ -1,5 +1,6 @@
 import os
-import requests
+from src.clients import pool
+from src.clients.scheduler import scheduler
 from src.config import DEFAULT_IMAGE_MODEL
 from src.enums import TogetherAIFluxModel
 
@@ -16,6 +17,23 @@ class together:
 		if not cls.headers['Authorization']:
 			cls.headers['Authorization'] = f'Bearer {os.getenv("TOGETHER_API_KEY")}'
 
+	@classmethod
+	def imageRequest(cls,
+	                 prompt: str,
+	                 steps: int,
+	                 width=896,
+	                 height=1152,
+	                 model=DEFAULT_IMAGE_MODEL) -> dict:
+		return {
+		    'prompt': prompt,
+		    'width': width,
+		    'height': height,
+		    'steps': steps,
+		    'model': model,
+		    'n': 1,
+		    'response_format': 'b64_json'
+		}
+
 	@classmethod
 	def generateImage(cls,
 	                  prompt: str,
@@ -24,16 +42,24 @@ class together:
 	                  height=1152,
 	                  model=DEFAULT_IMAGE_MODEL):
 		cls.initialize_client()
-		response = requests.post(f'{cls.baseurl}/images/generations',
-		                         json={
-		                             'prompt': prompt,
-		                             'width': width,
-		                             'height': height,
-		                             'steps': steps,
-		                             'model': model,
-		                             'n': 1,
-		                             'response_format': 'b64_json'
-		                         },
-		                         headers=cls.headers)
+		request = cls.imageRequest(prompt, steps, width, height, model)
+		response = scheduler.call(
+		    'together', lambda: pool.session().post(
+		        f'{cls.baseurl}/images/generations', json=request, headers=cls.headers))
+		data = response.json()
+		return data['data'][0]['b64_json']
+
+	@classmethod
+	async def generateImageAsync(cls,
+	                             prompt: str,
+	                             steps: int,
+	                             width=896,
+	                             height=1152,
+	                             model=DEFAULT_IMAGE_MODEL):
+		cls.initialize_client()
+		request = cls.imageRequest(prompt, steps, width, height, model)
+		response = await scheduler.call_async(
+		    'together', lambda: pool.async_client().post(
+		        f'{cls.baseurl}/images/generations', json=request, headers=cls.headers))
 		data = response.json()
 		return data['data'][0]['b64_json']
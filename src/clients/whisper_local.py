@@ -1,35 +1,144 @@
-from typing import Union
+import importlib.util
+from typing import Iterator, Union
+import numpy as np
 import whisper_timestamped as whisper
 from whisper import Whisper
+from src.config import WHISPER_PROFILE, WHISPER_PROFILES
+from src.models import models
+from src.tools.audio import decode_pcm
+
+
+def faster_whisper_available() -> bool:
+	return importlib.util.find_spec('faster_whisper') is not None
+
+
+def get_profile(profile: Union[str, None] = None) -> dict:
+	name = profile or WHISPER_PROFILE
+	if name not in WHISPER_PROFILES:
+		raise ValueError(f'Unknown transcription profile: {name}')
+	return WHISPER_PROFILES[name]
+
+
+def get_backend(settings: dict) -> str:
+	backend = settings.get('backend', 'whisper')
+	if backend == 'auto':
+		return 'faster_whisper' if faster_whisper_available() else 'whisper'
+	return backend
 
 
 class whisper_local:
-	model: Union[Whisper, None] = None
 
 	@classmethod
-	def initialize_client(cls):
-		if cls.model is None:
-			m = whisper.load_model("large-v3-turbo")
-			assert isinstance(m, Whisper)
-			cls.model = m
+	def initialize_client(cls, profile: Union[str, None] = None):
+		cls.get_model(get_profile(profile))
+
+	@classmethod
+	def get_model(cls, settings: dict):
+		"""The model for a profile's settings, from the process-wide registry"""
+		if get_backend(settings) == 'faster_whisper':
+			return models.faster_whisper(settings['model'],
+			                             compute_type=settings.get(
+			                                 'compute_type', 'default'),
+			                             device=settings.get('device'))
+		m = models.whisper(settings['model'], device=settings.get('device'))
+		assert isinstance(m, Whisper)
+		return m
 
 	@classmethod
-	def getTranscript(cls, audio_path: str, prompt='') -> dict:
-		cls.initialize_client()
-		assert cls.model is not None
-
-		audio = whisper.load_audio(audio_path)
-
-		result = whisper.transcribe_timestamped(cls.model,
-		                                        audio,
-		                                        language="en",
-		                                        initial_prompt=prompt,
-		                                        beam_size=5,
-		                                        best_of=5,
-		                                        temperature=(0.0, 0.2, 0.4, 0.6,
-		                                                     0.8, 1.0),
-		                                        vad=True,
-		                                        detect_disfluencies=True,
-		                                        remove_empty_words=True)
+	def getTranscript(cls,
+	                  audio_path: Union[str, np.ndarray],
+	                  prompt='',
+	                  profile: Union[str, None] = None) -> dict:
+		"""
+		Transcribe with word timestamps, using the decoding settings of `profile`
+		(see `whisper.profiles` in config/config.yaml).
+		`audio_path` can also be 16 kHz mono float PCM that's already decoded.
+		"""
+		settings = get_profile(profile)
+		model = cls.get_model(settings)
 
+		if isinstance(audio_path, str):
+			audio = decode_pcm(audio_path)
+		else:
+			audio = audio_path
+
+		if get_backend(settings) == 'faster_whisper':
+			segments = list(iter_faster_whisper(model, audio, prompt, settings))
+			return {
+			    'text': ''.join(segment['text'] for segment in segments),
+			    'segments': segments,
+			    'language': segments[0]['language'] if segments else 'en'
+			}
+
+		result = whisper.transcribe_timestamped(
+		    model,
+		    audio,
+		    language="en",
+		    initial_prompt=prompt,
+		    beam_size=settings['beam_size'],
+		    best_of=settings['best_of'],
+		    temperature=tuple(settings['temperature']),
+		    vad=settings['vad'],
+		    detect_disfluencies=settings['detect_disfluencies'],
+		    remove_empty_words=True)
+
+		# each segment carries the language too, for consumers that only see segments
+		for segment in result['segments']:
+			segment['language'] = result.get('language', 'en')
 		return result
+
+	@classmethod
+	def iterSegments(cls,
+	                 audio_path: Union[str, np.ndarray],
+	                 prompt='',
+	                 profile: Union[str, None] = None) -> Iterator[dict]:
+		"""
+		Yield transcript segments as they're decoded. Only faster-whisper decodes
+		incrementally, whisper_timestamped segments all arrive at the end.
+		"""
+		settings = get_profile(profile)
+		if get_backend(settings) != 'faster_whisper':
+			yield from cls.getTranscript(audio_path, prompt, profile)['segments']
+			return
+
+		model = cls.get_model(settings)
+		audio = decode_pcm(audio_path) if isinstance(audio_path,
+		                                             str) else audio_path
+		yield from iter_faster_whisper(model, audio, prompt, settings)
+
+
+def iter_faster_whisper(model, audio, prompt: str,
+                        settings: dict) -> Iterator[dict]:
+	"""
+	Transcribe with faster-whisper, yielding segments in the whisper_timestamped
+	structure as they're decoded
+	"""
+	segments, info = model.transcribe(audio,
+	                                language="en",
+	                                initial_prompt=prompt or None,
+	                                beam_size=settings['beam_size'],
+	                                best_of=settings['best_of'],
+	                                temperature=list(settings['temperature']),
+	                                vad_filter=settings['vad'],
+	                                word_timestamps=True)
+	for i, segment in enumerate(segments):
+		words = [{
+		    'text': word.word.strip(),
+		    'start': round(word.start, 2),
+		    'end': round(word.end, 2),
+		    'confidence': round(word.probability, 3)
+		} for word in segment.words or [] if word.word.strip()]
+		yield {
+		    'id': i,
+		    'seek': segment.seek,
+		    'start': round(segment.start, 2),
+		    'end': round(segment.end, 2),
+		    'text': segment.text,
+		    'tokens': segment.tokens,
+		    'temperature': segment.temperature,
+		    'avg_logprob': segment.avg_logprob,
+		    'compression_ratio': segment.compression_ratio,
+		    'no_speech_prob': segment.no_speech_prob,
+		    'words': words,
+		    'language': info.language
+		}
@@ -0,0 +1,198 @@
+import ipaddress
+import os
+import queue
+import secrets
+import socket
+import threading
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Union
+import numpy as np
+from src.clients.scheduler import ProviderError
+from src.config import WHISPER_WORKER_QUEUE_SIZE, WHISPER_WORKER_AUTHKEY_FILE
+from src.tools.audio import SAMPLE_RATE
+
+# A long-lived process that keeps one whisper model loaded and transcribes jobs
+# sent to it over a local socket, started with `python scripts/whisper_worker.py`.
+# Requests are dicts of `whisper_local.getTranscript` arguments.
+# Connections unpickle what they receive, so both ends need the same secret key:
+# WHISPER_WORKER_AUTHKEY, or a random one the worker writes to
+# `whisper.worker.authkey_file` (readable only by its user) when that isn't set.
+
+
+def get_address() -> Union[tuple[str, int], None]:
+	address = os.getenv("WHISPER_WORKER_ADDRESS")
+	if not address:
+		return None
+	host, _, port = address.rpartition(':')
+	return (host or 'localhost', int(port))
+
+
+def get_authkey_path() -> str:
+	return os.path.expanduser(WHISPER_WORKER_AUTHKEY_FILE)
+
+
+def get_authkey() -> Union[bytes, None]:
+	"""WHISPER_WORKER_AUTHKEY, or the worker's key file, None if there's neither"""
+	authkey = os.getenv("WHISPER_WORKER_AUTHKEY")
+	if authkey:
+		return authkey.encode()
+	try:
+		with open(get_authkey_path(), 'rb') as f:
+			return f.read().strip() or None
+	except FileNotFoundError:
+		return None
+
+
+def create_authkey() -> bytes:
+	"""The worker's key: WHISPER_WORKER_AUTHKEY, the key file, or a new random key file"""
+	authkey = get_authkey()
+	if authkey is not None:
+		return authkey
+	path = get_authkey_path()
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	authkey = secrets.token_hex(32).encode()
+	# created with 0600 from the start, never readable by anyone else
+	fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+	with os.fdopen(fd, 'wb') as f:
+		f.write(authkey)
+	print(f'Wrote a new whisper worker key to {path}')
+	return authkey
+
+
+def is_loopback(host: str) -> bool:
+	try:
+		infos = socket.getaddrinfo(host, None)
+	except socket.gaierror:
+		return False
+	return all(ipaddress.ip_address(info[4][0]).is_loopback for info in infos)
+
+
+class whisper_worker:
+
+	@classmethod
+	def connect(cls) -> Union[Connection, None]:
+		"""Connect to the worker, or return None if it isn't running"""
+		address = get_address()
+		authkey = get_authkey()
+		if address is None or authkey is None:
+			return None
+		try:
+			return Client(address, authkey=authkey)
+		except (OSError, AuthenticationError, EOFError) as e:
+			# wrong key, stale socket, ...: transcribe in-process instead
+			if not isinstance(e, (ConnectionRefusedError, FileNotFoundError)):
+				print(f'Could not connect to the whisper worker ({type(e).__name__}: {e})')
+			return None
+
+	@classmethod
+	def getTranscript(cls,
+	                  audio_path: Union[str, np.ndarray],
+	                  prompt='',
+	                  profile: Union[str, None] = None) -> Union[dict, None]:
+		"""
+		Transcribe using the worker's resident model.
+		Returns None when no worker is running or its queue is full, so callers
+		can transcribe in-process.
+		"""
+		conn = cls.connect()
+		if conn is None:
+			return None
+		if isinstance(audio_path, str):
+			# the worker doesn't share our working directory
+			audio_path = os.path.abspath(audio_path)
+		try:
+			with conn:
+				# decoded audio is sent as is
+				conn.send({
+				    'audio_path': audio_path,
+				    'prompt': prompt,
+				    'profile': profile
+				})
+				reply = conn.recv()
+		except (OSError, EOFError) as e:
+			print(f'Lost the whisper worker ({type(e).__name__}), transcribing in this process')
+			return None
+		if reply.get('busy'):
+			print('Whisper worker is busy, transcribing in this process')
+			return None
+		if 'error' in reply:
+			raise ProviderError('whisper_worker', reply['error'])
+		return reply['result']
+
+
+def handle_connection(conn: Connection, jobs: queue.Queue):
+	with conn:
+		try:
+			request = conn.recv()
+		except EOFError:
+			return
+		job: Future = Future()
+		try:
+			# turned away at once, so the client can transcribe in-process instead of waiting
+			jobs.put_nowait((request, job))
+		except queue.Full:
+			conn.send({'error': 'worker queue is full', 'busy': True})
+			return
+		try:
+			conn.send({'result': job.result()})
+		except Exception as e:
+			conn.send({'error': f'{type(e).__name__}: {e}'})
+
+
+def run_jobs(jobs: queue.Queue):
+	from src.clients.whisper_local import whisper_local
+
+	while True:
+		request, job = jobs.get()
+		if not job.set_running_or_notify_cancel():
+			continue
+		source = request['audio_path']
+		if not isinstance(source, str):
+			source = f'{len(source) / SAMPLE_RATE:.0f}s of audio'
+		print(f'Transcribing {source} ({jobs.qsize()} queued)')
+		try:
+			job.set_result(whisper_local.getTranscript(**request))
+		except Exception as e:
+			job.set_exception(e)
+
+
+def serve(address: Union[tuple[str, int], None] = None,
+          queue_size=WHISPER_WORKER_QUEUE_SIZE,
+          allow_remote=False):
+	"""
+	Load the model and serve transcription jobs until interrupted. Only
+	listens on loopback addresses unless `allow_remote`.
+	"""
+	from src.clients.whisper_local import whisper_local
+
+	if address is None:
+		address = get_address()
+	if address is None:
+		raise ValueError("WHISPER_WORKER_ADDRESS environment variable not set")
+	if not allow_remote and not is_loopback(address[0]):
+		raise ValueError(
+		    f'{address[0]} is not a loopback address, anyone who can reach it and '
+		    'has the key can run code in the worker (pass allow_remote to listen anyway)')
+	authkey = create_authkey()
+
+	whisper_local.initialize_client()
+
+	# jobs run one at a time on the single model, up to `queue_size` wait their turn
+	jobs: queue.Queue = queue.Queue(maxsize=queue_size)
+	threading.Thread(target=run_jobs, args=(jobs, ), daemon=True).start()
+
+	with Listener(address, authkey=authkey) as listener:
+		print(f'Whisper worker listening on {address[0]}:{address[1]}')
+		while True:
+			try:
+				conn = listener.accept()
+			except KeyboardInterrupt:
+				break
+			except Exception as e:  # failed handshake etc.
+				print('Rejected connection:', e)
+				continue
+			threading.Thread(target=handle_connection,
+			                 args=(conn, jobs),
+			                 daemon=True).start()
@@ -13,3 +13,44 @@ DEFAULT_OLLAMA_VISION_MODEL = config['ai']['default_ollama_vision_model']
 DEFAULT_IMAGE_MODEL = config['ai']['default_image_model']
 DEFAULT_TTS_MODEL = config['ai']['default_tts_model']
 DEFAULT_TTS_VOICE = config['ai']['default_tts_voice']
+
+TTS_CONCURRENCY = config['tts']['concurrency']
+TTS_CHUNK_RETRIES = config['tts']['chunk_retries']
+TTS_STITCHING_MODE = config['tts']['stitching']['mode']
+TTS_STITCHING_SENTENCES = config['tts']['stitching']['sentences']
+TTS_STITCHING_MAX_CHARS = config['tts']['stitching']['max_chars']
+
+ALLTALK_STREAMING = config['alltalk']['streaming']
+ALLTALK_VOICE = config['alltalk']['voice']
+ALLTALK_LANGUAGE = config['alltalk']['language']
+
+WHISPER_PROFILE = config['whisper']['profile']
+WHISPER_PROFILES = config['whisper']['profiles']
+WHISPER_STREAM_SECONDS = config['whisper']['stream_seconds']
+WHISPER_LONG_FORM_MIN_DURATION = config['whisper']['long_form']['min_duration']
+WHISPER_LONG_FORM_SEGMENT_SECONDS = config['whisper']['long_form'][
+    'segment_seconds']
+WHISPER_LONG_FORM_WORKERS = config['whisper']['long_form']['workers']
+WHISPER_WORKER_QUEUE_SIZE = config['whisper']['worker']['queue_size']
+WHISPER_WORKER_AUTHKEY_FILE = config['whisper']['worker']['authkey_file']
+
+LEMONFOX_COMPRESS = config['lemonfox']['compress']
+LEMONFOX_BITRATE = config['lemonfox']['bitrate']
+LEMONFOX_SEGMENT_SECONDS = config['lemonfox']['segment_seconds']
+
+TTS_CACHE_DIR = config['cache']['tts_dir']
+TTS_CACHE_MAX_MB = config['cache']['tts_max_mb']
+TRANSCRIPT_CACHE_DIR = config['cache']['transcripts_dir']
+TRANSCRIPT_CACHE_MAX_MB = config['cache']['transcripts_max_mb']
+SPRITE_CACHE_MAX_MB = config['cache']['sprites_max_mb']
+
+CAPTION_RENDERER = config['captions']['renderer']
+CAPTION_SLICES = config['captions']['slices']
+
+HTTP_MAX_CONNECTIONS = config['http']['max_connections']
+HTTP_MAX_KEEPALIVE_CONNECTIONS = config['http']['max_keepalive_connections']
+HTTP_KEEPALIVE_EXPIRY = config['http']['keepalive_expiry']
+HTTP_TIMEOUT = config['http']['timeout']
+HTTP_HTTP2 = config['http']['http2']
+
+RATE_LIMITS = config['rate_limits']
@@ -4,6 +4,7 @@ from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLab
 from src.gui.windows.chunk_manager import ChunkManager
 from src.gui.windows.script_editor import ScriptEditor
 from src.utils import chunkTextForTTS, create_project_folder, create_audio
+from src.cache import tts_cache
 from src.enums import ElevenLabsTTSModel, ElevenLabsTTSVoice
 
 
@@ -172,22 +173,19 @@ class TTSChunkApplication:
 			json.dump(self.chunks, f)
 
 	def generate_audio(self):
-		skipped = 0
+		# the audio cache is keyed on the chunk content, so edited chunks are
+		# regenerated and unchanged ones are restored without calling the API
+		hits = tts_cache.hits
 		for i, chunk in enumerate(self.chunks):
 			chunk_type = chunk['type']
 			audio_name = f'{i}_{chunk_type}.mp3'
 			chunk['audio'] = audio_name
-			audio_exists = os.path.exists(
-			    os.path.join(self.project_folder, audio_name))
-
-			if audio_exists:
-				skipped += 1
-				continue
 
 			content = chunk['content']
 			create_audio(content, audio_name, self.project_folder, self.tts_model,
 			             self.voice_id)
 
+		skipped = tts_cache.hits - hits
 		if skipped > 0:
 			print(f"Skipped generating {skipped} audio files")
 
@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+import psutil
+
+# Process-wide registry of loaded models (whisper, faster-whisper, the aligner).
+# Models are loaded on first use and shared by everything in the process,
+# e.g. VideoCaptioner instances and whisper_local.
+
+
+class ModelRegistry:
+
+	def __init__(self):
+		self.models: dict[tuple, Any] = {}
+		self.stats: dict[tuple, dict] = {}
+		self.lock = threading.Lock()
+		# one lock per model, so loading one doesn't hold up using another
+		self.load_locks: dict[tuple, threading.Lock] = {}
+		self.device: Optional[str] = None
+
+	def get_device(self) -> str:
+		"""'cuda' if torch can see a GPU, otherwise 'cpu', decided once per process"""
+		with self.lock:
+			if self.device is None:
+				import torch
+				self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+				print(f'Models will run on {self.device}')
+			return self.device
+
+	def get(self, key: tuple, load: Callable[[], Any]) -> Any:
+		"""The model for `key`, calling `load` to load it the first time"""
+		with self.lock:
+			if key in self.models:
+				return self.models[key]
+			load_lock = self.load_locks.setdefault(key, threading.Lock())
+
+		with load_lock:
+			with self.lock:
+				if key in self.models:
+					return self.models[key]
+			process = psutil.Process()
+			rss_before = process.memory_info().rss
+			start = time.perf_counter()
+			model = load()
+			load_seconds = time.perf_counter() - start
+			rss = process.memory_info().rss
+			stats = {
+			    'load_seconds': round(load_seconds, 2),
+			    'rss_delta_mb': round((rss - rss_before) / 1024 / 1024, 1),
+			    'rss_mb': round(rss / 1024 / 1024, 1)
+			}
+			print(f'Loaded {"/".join(str(k) for k in key)} in '
+			      f'{stats["load_seconds"]}s (+{stats["rss_delta_mb"]} MB, '
+			      f'RSS {stats["rss_mb"]} MB)')
+			with self.lock:
+				self.models[key] = model
+				self.stats[key] = stats
+			return model
+
+	def whisper(self, name: str, device: Optional[str] = None):
+		"""A whisper model, loaded through whisper_timestamped"""
+		device = device or self.get_device()
+
+		def load():
+			import whisper_timestamped
+			return whisper_timestamped.load_model(name, device=device)
+
+		return self.get(('whisper', name, device), load)
+
+	def faster_whisper(self,
+	                   name: str,
+	                   compute_type='default',
+	                   device: Optional[str] = None):
+		device = device or self.get_device()
+
+		def load():
+			from faster_whisper import WhisperModel
+			return WhisperModel(name, device=device, compute_type=compute_type)
+
+		return self.get(('faster_whisper', name, device, compute_type), load)
+
+	def aligner(self) -> tuple[Any, Any, Any, int]:
+		"""(model, tokenizer, aligner, sample rate) of torchaudio's MMS_FA"""
+
+		def load():
+			from torchaudio.pipelines import MMS_FA as bundle
+			model = bundle.get_model(with_star=False)
+			model.eval()
+			return (model, bundle.get_tokenizer(), bundle.get_aligner(),
+			        bundle.sample_rate)
+
+		return self.get(('mms_fa',), load)
+
+	def info(self) -> dict:
+		"""Load time and memory of each loaded model"""
+		with self.lock:
+			return {'/'.join(str(k) for k in key): stats for key, stats in self.stats.items()}
+
+
+models = ModelRegistry()
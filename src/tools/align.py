@@ -0,0 +1,212 @@
+import importlib.util
+import re
+from typing import Any, Optional, Union
+import numpy as np
+from src.models import models
+
+# Word timings without transcribing: forced alignment of a known script to its
+# audio with torchaudio's MMS_FA model (much cheaper than transcribing when we
+# already know what was said, e.g. audio that we synthesized), and conversion
+# of the character timings that TTS providers return. Transcripts have the same
+# structure as whisper_timestamped's.
+
+SENTENCE_END = ('.', '!', '?')
+# target length in seconds of the windows the model sees (cut at silences, so a
+# window can be somewhat longer)
+WINDOW_SECONDS = 20
+
+
+def alignment_available() -> bool:
+	return importlib.util.find_spec('torchaudio') is not None
+
+
+def get_aligner() -> tuple[Any, Any, Any, int]:
+	"""(model, tokenizer, aligner, sample rate), loaded on first use"""
+	return models.aligner()
+
+
+def normalize_word(word: str) -> str:
+	# the MMS_FA dictionary is lowercase latin letters and apostrophes
+	return re.sub(r"[^a-z']", '', word.lower())
+
+
+def split_words(text: str) -> list[tuple[str, str]]:
+	"""
+	(display text, normalized) pairs for each word of `text`. Tokens that have
+	nothing to align (numbers, symbols) are attached to the previous word.
+	"""
+	words: list[tuple[str, str]] = []
+	pending = ''
+	for token in text.split():
+		normalized = normalize_word(token)
+		if not normalized:
+			if words:
+				display, previous = words[-1]
+				words[-1] = (f'{display} {token}', previous)
+			else:
+				pending = f'{pending}{token} '
+			continue
+		words.append((pending + token, normalized))
+		pending = ''
+	return words
+
+
+def compute_emission(audio: np.ndarray, sample_rate: int) -> tuple[Any, np.ndarray]:
+	"""
+	The model's emission for `audio` (mono float PCM), computed in windows of
+	about `WINDOW_SECONDS` cut at silences (self-attention is quadratic in the
+	length of its input), and the time in seconds at which each frame starts,
+	plus the end of the last one
+	"""
+	import torch
+	import torchaudio.functional as F
+	from src.tools.audio import find_silences, plan_segments
+
+	model, _, _, model_rate = get_aligner()
+	duration = len(audio) / sample_rate
+	windows = plan_segments(duration, find_silences(audio, sample_rate),
+	                        WINDOW_SECONDS)
+	emissions = []
+	frame_times = []
+	for start, end in windows:
+		piece = audio[int(start * sample_rate):int(end * sample_rate)]
+		waveform = torch.from_numpy(np.ascontiguousarray(piece,
+		                                                 dtype=np.float32)).unsqueeze(0)
+		if sample_rate != model_rate:
+			waveform = F.resample(waveform, sample_rate, model_rate)
+		with torch.inference_mode():
+			emission, _ = model(waveform)
+		emissions.append(emission[0])
+		frame_times.append(start + np.arange(emission.size(1)) *
+		                   (end - start) / emission.size(1))
+	frame_times.append([duration])
+	return torch.cat(emissions), np.concatenate(frame_times)
+
+
+def align_words(audio: np.ndarray, words: list[tuple[str, str]],
+                sample_rate: int) -> list[dict]:
+	"""Timings for `words` (from `split_words`) spoken in `audio` (mono float PCM)"""
+	import torch
+
+	if not words or len(audio) == 0:
+		return []
+
+	_, tokenizer, token_aligner, _ = get_aligner()
+	emission, frame_times = compute_emission(audio, sample_rate)
+	with torch.inference_mode():
+		token_spans = token_aligner(emission,
+		                            tokenizer([normalized for _, normalized in words]))
+
+	result = []
+	for (display, _), spans in zip(words, token_spans):
+		result.append({
+		    'text': display,
+		    'start': round(float(frame_times[spans[0].start]), 2),
+		    'end': round(float(frame_times[spans[-1].end]), 2),
+		    'confidence': round(sum(s.score for s in spans) / len(spans), 3)
+		})
+	return result
+
+
+def group_segments(words: list[dict], breaks: set[int]) -> list[dict]:
+	"""Group aligned words into one segment per sentence, also ending one after each index in `breaks`"""
+	segments: list[dict] = []
+	current: list[dict] = []
+	for i, word in enumerate(words):
+		current.append(word)
+		if word['text'].rstrip('"\')]').endswith(
+		    SENTENCE_END) or i in breaks or i == len(words) - 1:
+			segments.append({
+			    'id': len(segments),
+			    'start': current[0]['start'],
+			    'end': current[-1]['end'],
+			    'text': ' ' + ' '.join(w['text'] for w in current),
+			    'words': current
+			})
+			current = []
+	return segments
+
+
+def align_transcript(audio: Union[str, np.ndarray],
+                     text: str,
+                     spans: Optional[list[dict]] = None) -> dict:
+	"""
+	Align `text` to `audio` (a path or 16 kHz mono float PCM) and return a
+	transcript in the whisper_timestamped format, with a segment per sentence
+	(or line, so titles get their own segment).
+
+	`spans` ({'text', 'start', 'end'} of each TTS chunk, see `make_tts_job`)
+	are aligned one at a time on their part of the audio, which keeps the cost
+	of long recordings proportional to their length.
+	"""
+	from src.tools.audio import SAMPLE_RATE, decode_pcm
+
+	if isinstance(audio, str):
+		audio = decode_pcm(audio)
+	if not spans:
+		spans = [{'text': text, 'start': 0.0, 'end': len(audio) / SAMPLE_RATE}]
+
+	aligned: list[dict] = []
+	breaks = set()
+	for span in spans:
+		words: list[tuple[str, str]] = []
+		for line in span['text'].splitlines():
+			words += split_words(line)
+			if words:
+				breaks.add(len(aligned) + len(words) - 1)
+		piece = audio[int(span['start'] * SAMPLE_RATE):int(span['end'] * SAMPLE_RATE)]
+		for word in align_words(piece, words, SAMPLE_RATE):
+			aligned.append({
+			    **word, 'start': round(word['start'] + span['start'], 2),
+			    'end': round(word['end'] + span['start'], 2)
+			})
+	segments = group_segments(aligned, breaks)
+	return {
+	    'text': ''.join(segment['text'] for segment in segments),
+	    'segments': segments,
+	    'language': 'en'
+	}
+
+
+def alignment_to_words(alignment: dict, offset=0.0) -> list[dict]:
+	"""
+	Words with timings from a character alignment (as returned by
+	`elevenlabs.writeSpeechWithTimestamps`), shifted by `offset` seconds
+	"""
+	words: list[dict] = []
+	current = ''
+	start = end = 0.0
+	for char, char_start, char_end in zip(
+	    alignment['characters'], alignment['character_start_times_seconds'],
+	    alignment['character_end_times_seconds']):
+		if char.isspace():
+			if current:
+				words.append({'text': current, 'start': start, 'end': end})
+			current = ''
+			continue
+		if not current:
+			start = round(char_start + offset, 3)
+		current += char
+		end = round(char_end + offset, 3)
+	if current:
+		words.append({'text': current, 'start': start, 'end': end})
+	return words
+
+
+def words_to_wordlevel_info(words: list[dict]) -> list[dict]:
+	"""The word JSON format of `autocaption.transcribe_audio`"""
+	return [{
+	    'word': word['text'].upper(),
+	    'start': word['start'],
+	    'end': word['end']
+	} for word in words]
+
+
+def words_to_transcript(words: list[dict]) -> dict:
+	"""A whisper_timestamped-style transcript from timed words, a segment per sentence"""
+	segments = group_segments(words, set())
+	return {
+	    'text': ''.join(segment['text'] for segment in segments),
+	    'segments': segments,
+	    'language': 'en'
+	}
@@ -0,0 +1,185 @@
+import os
+import tempfile
+from typing import Literal, Optional, Union
+import ffmpeg
+import numpy as np
+from pydub import AudioSegment
+
+ConcatMethod = Literal['copy', 'decode']
+# a media path, or mono float PCM that's already been decoded
+Audio = Union[str, np.ndarray]
+
+SAMPLE_RATE = 16000
+
+
+def probe_audio_format(path: str) -> tuple:
+	"""Returns (codec, sample rate, channels) of the first audio stream"""
+	info = ffmpeg.probe(path)
+	stream = next(s for s in info['streams'] if s['codec_type'] == 'audio')
+	return (stream['codec_name'], stream.get('sample_rate'), stream.get('channels'))
+
+
+def decode_pcm(path: str, sample_rate=SAMPLE_RATE) -> np.ndarray:
+	"""
+	Decode the audio of any media file to mono float32 PCM, piped straight from
+	ffmpeg into memory (no intermediate file, so any number of jobs can run at once)
+	"""
+	try:
+		out, _ = (ffmpeg.input(path, threads=0).output(
+		    'pipe:', format='f32le', acodec='pcm_f32le', ac=1,
+		    ar=sample_rate).run(cmd=['ffmpeg', '-nostdin'],
+		                        capture_stdout=True,
+		                        capture_stderr=True))
+	except ffmpeg.Error as e:
+		raise RuntimeError(f'Failed to decode audio: {e.stderr.decode()}') from e
+	# frombuffer is read-only, torch wants to be able to write to it
+	return np.frombuffer(out, np.float32).copy()
+
+
+def encode_opus(audio: Audio,
+                bitrate='32k',
+                sample_rate=SAMPLE_RATE) -> bytes:
+	"""
+	Encode audio (a media path or mono float PCM at `sample_rate`) to mono Opus
+	in an Ogg container, in memory. Speech stays clear at a fraction of the size of WAV.
+	"""
+	if isinstance(audio, str):
+		stream = ffmpeg.input(audio)
+		data = None
+	else:
+		stream = ffmpeg.input('pipe:', format='f32le', ac=1, ar=sample_rate)
+		data = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+	try:
+		out, _ = (stream.output('pipe:',
+		                        format='ogg',
+		                        acodec='libopus',
+		                        ac=1,
+		                        audio_bitrate=bitrate,
+		                        application='voip',
+		                        vn=None).run(input=data,
+		                                     capture_stdout=True,
+		                                     capture_stderr=True))
+	except ffmpeg.Error as e:
+		raise RuntimeError(f'Failed to encode audio: {e.stderr.decode()}') from e
+	return out
+
+
+def mp4_audio_codec(codec_name: str) -> str:
+	"""ffmpeg's acodec for putting an audio stream in MP4: copied, unless it's PCM which MP4 can't hold"""
+	return 'aac' if codec_name.startswith('pcm_') else 'copy'
+
+
+def audio_duration(audio: Audio, sample_rate=SAMPLE_RATE) -> float:
+	if isinstance(audio, str):
+		return probe_duration(audio)
+	return len(audio) / sample_rate
+
+
+def probe_duration(path: str) -> float:
+	return float(ffmpeg.probe(path)['format']['duration'])
+
+
+def concat_audio(paths: list[str], output_path: str) -> ConcatMethod:
+	"""
+	Join audio files into `output_path` and return the method that was used.
+
+	If every input has the same codec/sample rate/channels and the codec matches
+	the output container, the files are joined with ffmpeg's concat demuxer using
+	stream copy ('copy'), so nothing is decoded or re-encoded. Otherwise every
+	input is decoded once and the result is encoded in a single pass ('decode').
+	"""
+	output_codec = {'.mp3': 'mp3', '.wav': 'pcm_s16le'}.get(
+	    os.path.splitext(output_path)[1].lower())
+	formats = {probe_audio_format(path) for path in paths}
+	if len(formats) == 1 and next(iter(formats))[0] == output_codec:
+		concat_copy(paths, output_path)
+		return 'copy'
+
+	concat_decode(paths, output_path)
+	return 'decode'
+
+
+def concat_copy(paths: list[str], output_path: str):
+	fd, list_path = tempfile.mkstemp(suffix='.txt')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			for path in paths:
+				escaped = os.path.abspath(path).replace("'", "'\\''")
+				f.write(f"file '{escaped}'\n")
+		(ffmpeg.input(list_path, f='concat', safe=0).output(
+		    output_path, c='copy').run(overwrite_output=True, quiet=True))
+	finally:
+		os.remove(list_path)
+
+
+def concat_decode(paths: list[str], output_path: str):
+	segments = [AudioSegment.from_file(path) for path in paths]
+	first = segments[0]
+	segments = [
+	    s.set_frame_rate(first.frame_rate).set_channels(
+	        first.channels).set_sample_width(first.sample_width) for s in segments
+	]
+	# join the raw PCM once instead of repeated `+`, which copies on every step
+	combined = first._spawn(b''.join(s.raw_data for s in segments))
+	output_format = os.path.splitext(output_path)[1].lstrip('.') or 'mp3'
+	combined.export(output_path, format=output_format)
+
+
+def find_silences(audio: np.ndarray,
+                  sample_rate: int,
+                  min_silence=0.3,
+                  frame_seconds=0.03,
+                  threshold_db=-40.0) -> list[tuple[float, float]]:
+	"""
+	Energy-based VAD over mono float PCM: returns (start, end) seconds of every
+	stretch of at least `min_silence` seconds whose frames are quieter than
+	`threshold_db` (relative to full scale, or to the loud parts of quiet recordings).
+	"""
+	frame = max(1, int(sample_rate * frame_seconds))
+	count = len(audio) // frame
+	if count == 0:
+		return []
+	frames = audio[:count * frame].reshape(count, frame).astype(np.float32)
+	rms = np.sqrt(np.mean(frames**2, axis=1)) + 1e-10
+	db = 20 * np.log10(rms)
+	threshold = min(threshold_db, np.percentile(db, 95) + threshold_db / 2)
+	silent = db < threshold
+
+	# edges of runs of silent frames
+	padded = np.concatenate(([False], silent, [False]))
+	edges = np.flatnonzero(padded[1:] != padded[:-1])
+	silences = []
+	for start, end in zip(edges[::2], edges[1::2]):
+		if (end - start) * frame_seconds >= min_silence:
+			silences.append((start * frame / sample_rate, end * frame / sample_rate))
+	return silences
+
+
+def plan_segments(duration: float,
+                  silences: list[tuple[float, float]],
+                  segment_seconds: float,
+                  search_seconds: Optional[float] = None) -> list[tuple[float, float]]:
+	"""
+	Split `duration` seconds into segments of about `segment_seconds` each,
+	cutting in the middle of the silence nearest to each evenly spaced target
+	(or exactly at the target when no silence is within `search_seconds`).
+	"""
+	count = max(1, round(duration / segment_seconds))
+	if search_seconds is None:
+		search_seconds = segment_seconds / 4
+	cuts = [0.0]
+	for i in range(1, count):
+		target = duration * i / count
+		best = None
+		for start, end in silences:
+			middle = (start + end) / 2
+			if middle <= cuts[-1]:
+				continue
+			if abs(middle - target) <= search_seconds and (
+			    best is None or abs(middle - target) < abs(best - target)):
+				best = middle
+		cut = best if best is not None else target
+		if cut > cuts[-1]:
+			cuts.append(cut)
+	cuts.append(duration)
+	return list(zip(cuts[:-1], cuts[1:]))
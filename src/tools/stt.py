@@ -1,72 +1,394 @@
-import json, os
-from src.clients import lemonfox, whisper_local
+import json, os, re
+import multiprocessing
+import tempfile
+import uuid
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from src.clients import lemonfox, whisper_local, whisper_worker
+from src.clients.whisper_local import get_backend, get_profile
+from src.cache import transcript_cache, transcript_cache_key
+from src.config import LEMONFOX_COMPRESS, WHISPER_PROFILE, WHISPER_STREAM_SECONDS, WHISPER_LONG_FORM_MIN_DURATION, WHISPER_LONG_FORM_SEGMENT_SECONDS, WHISPER_LONG_FORM_WORKERS
+from src.tools.align import align_transcript, alignment_available, words_to_transcript
+from src.tools.audio import SAMPLE_RATE, Audio, audio_duration, decode_pcm, find_silences, plan_segments
 from src.utils import ensuredir
 from datetime import datetime
 import ffmpeg
+from typing import Iterable, Iterator, Optional
+
+
+LOCAL_PROMPT = "Transcribe the following audio into text, with 1 sentence per line."
+# improve transcription by providing a prompt
+LEMONFOX_SRT_PROMPT = 'Output the transcript in SRT format using natural prose, with at most 1 sentence per line.'
 
 
 # TODO allow specifying provider
-def create_transcript(media_path: str, type='srt', provider='whisper_local'):
-	# if path is a video file, extract audio
-	if media_path.lower().endswith(('.mp4', '.mov', '.avi', '.mkv')):
-		audio_path = os.path.join('output', 'audio', 'audio.wav')
-		ensuredir(audio_path)
-		ffmpeg.input(media_path).output(audio_path).run(overwrite_output=True)
-	else:
-		audio_path = media_path
-
-	if provider == 'whisper_local':
-		srt = False
-		if type == 'srt':
-			srt = True
-		return create_transcript_local(audio_path, srt)
-
-	if type == 'srt':
-		return create_transcript_srt(audio_path)
-	elif type == 'vjson':
-		return create_transcript_vjson(audio_path)
+def create_transcript(media_path: str,
+                      type='srt',
+                      provider='whisper_local',
+                      profile: Optional[str] = None,
+                      use_cache=True,
+                      text: Optional[str] = None,
+                      spans: Optional[list[dict]] = None):
+	"""
+	Transcribe audio/video and return the path of the transcript (SRT or JSON).
+	Transcripts are cached by the media's contents, provider, profile, prompt and type.
+
+	When the spoken `text` is known (e.g. audio from `make_tts`), the words are
+	force-aligned to the audio instead of being transcribed, chunk by chunk
+	when `make_tts_job`'s `spans` are given.
+	"""
+	if not os.path.exists(media_path):
+		raise FileNotFoundError('File not found:', media_path)
+
+	requested = (provider, profile)
+	if text and alignment_available():
+		provider = 'align'
+		profile = None
+		prompt = text
+		suffix = '.srt' if type == 'srt' else '.json'
+		project_folder = 'output/transcripts'
+	elif provider == 'whisper_local':
+		profile = profile or WHISPER_PROFILE
+		prompt = LOCAL_PROMPT
+		suffix = '.srt' if type == 'srt' else '.json'
+		project_folder = 'output/transcripts'
+	elif type in ['srt', 'vjson']:
+		profile = None
+		prompt = LEMONFOX_SRT_PROMPT if type == 'srt' else None
+		suffix = '.srt' if type == 'srt' else '.json'
+		project_folder = 'output/srt'
 	else:
 		raise ValueError('Unsupported type:', type)
 
+	cache_key = transcript_cache_key(media_path, provider, profile, prompt, type)
+	if use_cache:
+		# restored once under a name of its own, later hits reuse that file
+		cached_path = os.path.join(project_folder,
+		                           f'transcript_{cache_key[:16]}{suffix}')
+		if os.path.exists(cached_path):
+			print('Transcript already restored from cache to', cached_path)
+			return cached_path
+		ensuredir(cached_path)
+		fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=project_folder)
+		os.close(fd)
+		if transcript_cache.fetch(cache_key, tmp_path, suffix):
+			os.replace(tmp_path, cached_path)
+			print('Transcript restored from cache to', cached_path)
+			return cached_path
+		os.remove(tmp_path)
+
+	is_video = media_path.lower().endswith(('.mp4', '.mov', '.avi', '.mkv'))
+	if provider in ['align', 'whisper_local']:
+		# local models get the audio decoded in memory, videos included
+		audio = decode_pcm(media_path)
+		if provider == 'align':
+			assert text is not None
+			try:
+				transcript_path = create_transcript_aligned(audio, text, type == 'srt',
+				                                            spans)
+			except Exception as e:
+				print('Alignment failed, transcribing instead:', e)
+				return create_transcript(media_path, type, *requested, use_cache)
+		else:
+			srt = False
+			if type == 'srt':
+				srt = True
+			transcript_path = create_transcript_local(audio, srt, profile)
+	elif is_video and not LEMONFOX_COMPRESS:
+		# uploaded as is, so extract the audio to a file of our own
+		fd, audio_path = tempfile.mkstemp(suffix='.wav')
+		os.close(fd)
+		try:
+			ffmpeg.input(media_path).output(audio_path).run(overwrite_output=True)
+			if type == 'srt':
+				transcript_path = create_transcript_srt(audio_path)
+			else:
+				transcript_path = create_transcript_vjson(audio_path)
+		finally:
+			os.remove(audio_path)
+	elif type == 'srt':
+		transcript_path = create_transcript_srt(media_path)
+	else:
+		transcript_path = create_transcript_vjson(media_path)
+
+	transcript_cache.put(cache_key, transcript_path, suffix)
+	return transcript_path
+
+
+def srt_cue(index: int, segment: dict) -> str:
+	return f'{index}\n{segment["start"]} --> {segment["end"]}\n{segment["text"]}\n\n'
+
 
 def convert_timestamps_to_srt(timestamps: list):
-	srt = ''
-	for i, ts in enumerate(timestamps):
-		srt += f'{i + 1}\n'
-		srt += f'{ts["start"]} --> {ts["end"]}\n'
-		srt += f'{ts["text"]}\n\n'
-	return srt
+	return ''.join(srt_cue(i + 1, ts) for i, ts in enumerate(timestamps))
 
 
-def create_transcript_local(audio_path: str, srt=False):
-	if not os.path.exists(audio_path):
-		raise FileNotFoundError('File not found:', audio_path)
+class TranscriptWriter:
+	"""
+	Writes a transcript to `path` one segment at a time, through a temp file
+	that replaces `path` once the writer is closed without an error
+	"""
 
-	project_folder = 'output/transcripts'
+	def __init__(self, path: str):
+		ensuredir(path)
+		self.path = path
+		fd, self.tmp_path = tempfile.mkstemp(suffix='.part',
+		                                     dir=os.path.dirname(path) or '.')
+		self.file = os.fdopen(fd, 'w')
+		self.count = 0
 
-	transcript_json = whisper_local.getTranscript(
-	    audio_path,
-	    "Transcribe the following audio into text, with 1 sentence per line.")
-	transcript_json = json.dumps(transcript_json, indent=4)
+	def write(self, segment: dict):
+		self.count += 1
 
-	transcript_srt_path = os.path.join(
-	    project_folder,
-	    f'transcript_{datetime.now().strftime("%Y%m%d%H%M%S")}.json')
-	ensuredir(transcript_srt_path)
-	with open(transcript_srt_path, 'w') as f:
-		f.write(transcript_json)
+	def finish(self):
+		pass
 
-	if srt:
-		transcript_json = json.loads(transcript_json)
-		transcript_srt = convert_timestamps_to_srt(transcript_json['segments'])
-		transcript_srt_path = os.path.join(
-		    project_folder,
-		    f'transcript_{datetime.now().strftime("%Y%m%d%H%M%S")}.srt')
-		ensuredir(transcript_srt_path)
-		with open(transcript_srt_path, 'w') as f:
-			f.write(transcript_srt)
+	def close(self, error=False):
+		if not error:
+			self.finish()
+		self.file.close()
+		if error:
+			os.remove(self.tmp_path)
+		else:
+			os.replace(self.tmp_path, self.path)
 
-	return transcript_srt_path
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close(error=exc_type is not None)
+
+
+class SrtWriter(TranscriptWriter):
+
+	def write(self, segment: dict):
+		super().write(segment)
+		self.file.write(srt_cue(self.count, segment))
+		self.file.flush()
+
+
+class JsonTranscriptWriter(TranscriptWriter):
+	"""
+	Writes the whisper_timestamped JSON structure, a segment per line.
+	Without a `language`, the one the segments were transcribed in is used.
+	"""
+
+	def __init__(self, path: str, language: Optional[str] = None):
+		super().__init__(path)
+		self.language = language
+		self.texts: list[str] = []
+		self.file.write('{\n    "segments": [')
+
+	def write(self, segment: dict):
+		self.file.write(',' if self.count else '')
+		super().write(segment)
+		self.file.write('\n        ' + json.dumps(segment))
+		self.texts.append(segment['text'])
+		if self.language is None:
+			self.language = segment.get('language')
+		self.file.flush()
+
+	def finish(self):
+		self.file.write('\n    ],\n    "text": ' + json.dumps(''.join(self.texts)) +
+		                ',\n    "language": ' + json.dumps(self.language or 'en') + '\n}\n')
+
+
+def iter_transcript(audio: Audio,
+                    prompt='',
+                    profile: Optional[str] = None,
+                    long_form: Optional[bool] = None) -> Iterator[dict]:
+	"""
+	Yield transcript segments (with their words) in order on one timeline, as
+	soon as they're available, so captioning can start before transcription ends.
+
+	Uses the warm whisper worker if it's running, otherwise transcribes in this
+	process. Long recordings (see `whisper.long_form` in config/config.yaml) are
+	transcribed in parallel pieces unless `long_form` says otherwise, and with
+	whisper_timestamped (which can't yield segments as it goes) audio longer
+	than `whisper.stream_seconds` is transcribed a piece at a time when that's set.
+	"""
+	duration = audio_duration(audio)
+	if long_form is None:
+		long_form = duration >= WHISPER_LONG_FORM_MIN_DURATION
+	if long_form:
+		yield from iter_transcript_long(audio, prompt, profile)
+		return
+
+	transcript = whisper_worker.getTranscript(audio, prompt, profile)
+	if transcript is not None:
+		yield from transcript['segments']
+		return
+
+	if get_backend(get_profile(profile)) == 'faster_whisper' or (
+	    not WHISPER_STREAM_SECONDS or duration < WHISPER_STREAM_SECONDS * 1.5):
+		yield from whisper_local.iterSegments(audio, prompt, profile)
+		return
+
+	if isinstance(audio, str):
+		audio = decode_pcm(audio)
+	pieces = plan_segments(duration, find_silences(audio, SAMPLE_RATE),
+	                       WHISPER_STREAM_SECONDS)
+	# like whisper's own windows, each piece is conditioned on the text before it
+	previous: list[str] = []
+
+	def transcribe_pieces():
+		for start, end in pieces:
+			piece_prompt = ' '.join([prompt] + previous[-3:]).strip()
+			yield start, whisper_local.iterSegments(
+			    audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)], piece_prompt,
+			    profile)
+
+	for segment in merge_segments(transcribe_pieces()):
+		previous.append(segment['text'].strip())
+		yield segment
+
+
+def load_model(profile: Optional[str]):
+	whisper_local.initialize_client(profile)
+
+
+def transcribe_piece(audio, prompt: str, profile: Optional[str]) -> dict:
+	return whisper_local.getTranscript(audio, prompt, profile)
+
+
+def iter_transcript_long(
+    audio: Audio,
+    prompt='',
+    profile: Optional[str] = None,
+    segment_seconds=WHISPER_LONG_FORM_SEGMENT_SECONDS,
+    workers=WHISPER_LONG_FORM_WORKERS) -> Iterator[dict]:
+	"""
+	Split the audio at silences into pieces of about `segment_seconds`, transcribe
+	them across a process pool and yield the segments on one timeline, each
+	piece as soon as it and the ones before it are done.
+	"""
+	if isinstance(audio, str):
+		audio = decode_pcm(audio)
+	duration = len(audio) / SAMPLE_RATE
+	pieces = plan_segments(duration, find_silences(audio, SAMPLE_RATE),
+	                       segment_seconds)
+	print(f'Transcribing {duration:.0f}s of audio in {len(pieces)} pieces')
+	if len(pieces) == 1:
+		yield from transcribe_piece(audio, prompt, profile)['segments']
+		return
+
+	# spawn, since forking a process that has torch loaded isn't safe
+	with ProcessPoolExecutor(max_workers=min(workers, len(pieces)),
+	                         mp_context=multiprocessing.get_context('spawn'),
+	                         initializer=load_model,
+	                         initargs=(profile, )) as executor:
+		futures = [
+		    executor.submit(
+		        transcribe_piece,
+		        audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)], prompt,
+		        profile) for start, end in pieces
+		]
+		yield from merge_segments(
+		    (start, future.result()['segments'])
+		    for (start, _), future in zip(pieces, futures))
+
+
+def normalize_word(text: str) -> str:
+	return re.sub(r'[^\w\']', '', text.lower())
+
+
+def merge_segments(
+        pieces: Iterable[tuple[float, Iterable[dict]]]) -> Iterator[dict]:
+	"""
+	Merge the segments of (offset, segments) pieces onto one timeline.
+	The first words of each piece after the first are dropped while they
+	overlap the end of the previous piece or repeat its last word right at the
+	boundary; a piece's other words are kept as they are.
+	"""
+	count = 0
+	last_word = None
+	for offset, segments in pieces:
+		# the previous piece's last word, until this piece keeps a word
+		boundary = last_word if offset > 0 else None
+		for segment in segments:
+			words = []
+			for word in segment.get('words', []):
+				word = {
+				    **word, 'start': round(word['start'] + offset, 2),
+				    'end': round(word['end'] + offset, 2)
+				}
+				if boundary is not None and (
+				    word['start'] < boundary['end'] - 0.05 or
+				    (normalize_word(word['text']) == normalize_word(boundary['text'])
+				     and word['start'] - boundary['end'] < 0.3)):
+					continue
+				boundary = None
+				words.append(word)
+				last_word = word
+			if not words and segment.get('words'):
+				continue  # every word was a duplicate
+			merged = {
+			    **segment, 'id': count,
+			    'start': round(segment['start'] + offset, 2),
+			    'end': round(segment['end'] + offset, 2),
+			    'words': words
+			}
+			if 'words' in segment and len(words) != len(segment['words']):
+				merged['start'] = words[0]['start']
+				merged['text'] = ' ' + ' '.join(word['text'] for word in words)
+			count += 1
+			yield merged
+
+
+def new_transcript_path(suffix: str, project_folder='output/transcripts') -> str:
+	"""A timestamped path that parallel jobs won't share, even within a second"""
+	return os.path.join(
+	    project_folder, f'transcript_{datetime.now().strftime("%Y%m%d%H%M%S")}_'
+	    f'{uuid.uuid4().hex[:8]}{suffix}')
+
+
+def save_segments(segments: Iterable[dict],
+                  srt=False,
+                  language: Optional[str] = None) -> str:
+	"""
+	Write segments to output/transcripts as JSON, plus SRT if `srt`, as they
+	arrive. Returns the SRT path if `srt`, otherwise the JSON path.
+	"""
+	stem = new_transcript_path('')
+	json_path = f'{stem}.json'
+	srt_path = f'{stem}.srt'
+	with JsonTranscriptWriter(json_path, language) as json_writer, (
+	    SrtWriter(srt_path) if srt else nullcontext()) as srt_writer:
+		for segment in segments:
+			json_writer.write(segment)
+			if srt_writer is not None:
+				srt_writer.write(segment)
+
+	return srt_path if srt else json_path
+
+
+def save_transcript(transcript: dict, srt=False) -> str:
+	"""Write a transcript to output/transcripts as JSON, plus SRT if `srt`, and return the last path"""
+	return save_segments(transcript['segments'], srt, transcript.get('language'))
+
+
+def create_transcript_local(audio: Audio,
+                            srt=False,
+                            profile: Optional[str] = None):
+	if isinstance(audio, str) and not os.path.exists(audio):
+		raise FileNotFoundError('File not found:', audio)
+
+	return save_segments(iter_transcript(audio, LOCAL_PROMPT, profile), srt)
+
+
+def create_transcript_from_words(words: list[dict], srt=True):
+	"""Transcript from timed words that we already have (e.g. from `make_tts_job(timestamps=True)`)"""
+	return save_transcript(words_to_transcript(words), srt)
+
+
+def create_transcript_aligned(audio: Audio,
+                              text: str,
+                              srt=False,
+                              spans: Optional[list[dict]] = None):
+	if isinstance(audio, str) and not os.path.exists(audio):
+		raise FileNotFoundError('File not found:', audio)
+
+	return save_transcript(align_transcript(audio, text, spans), srt)
 
 
 def create_transcript_srt(audio_path: str):
@@ -75,11 +397,9 @@ def create_transcript_srt(audio_path: str):
 
 	project_folder = 'output/srt'
 
-	# improve transcription by providing a prompt
-	whisper_prompt = 'Output the transcript in SRT format using natural prose, with at most 1 sentence per line.'
 	transcript_srt = lemonfox.getTranscript(audio_path,
 	                                        outformat='srt',
-	                                        prompt=whisper_prompt)
+	                                        prompt=LEMONFOX_SRT_PROMPT)
 
 	if transcript_srt.startswith('"'):
 		transcript_srt = transcript_srt[1:]
@@ -88,9 +408,7 @@ def create_transcript_srt(audio_path: str):
 	transcript_srt = transcript_srt.replace('\\n', '\n')
 	transcript_srt = transcript_srt.strip()
 
-	transcript_srt_path = os.path.join(
-	    project_folder,
-	    f'transcript_{datetime.now().strftime("%Y%m%d%H%M%S")}.srt')
+	transcript_srt_path = new_transcript_path('.srt', project_folder)
 	ensuredir(transcript_srt_path)
 	with open(transcript_srt_path, 'w') as f:
 		f.write(transcript_srt)
@@ -108,9 +426,7 @@ def create_transcript_vjson(audio_path: str):
 	transcript_json = lemonfox.getTranscript(audio_path,
 	                                         outformat='verbose_json')
 
-	transcript_srt_path = os.path.join(
-	    project_folder,
-	    f'transcript_{datetime.now().strftime("%Y%m%d%H%M%S")}.json')
+	transcript_srt_path = new_transcript_path('.json', project_folder)
 	ensuredir(transcript_srt_path)
 	with open(transcript_srt_path, 'w') as f:
 		f.write(transcript_json)
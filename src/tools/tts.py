@@ -8,18 +8,28 @@
 
 # let me think here, how do we want to handle different models/providers?
 
+import json
+import os
+import re
 from typing import Union, Literal, Optional, Dict, Any
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.clients import elevenlabs, alltalk
+from src.clients.scheduler import ProviderError
+from src.config import TTS_CONCURRENCY, TTS_CHUNK_RETRIES, TTS_STITCHING_MODE, TTS_STITCHING_SENTENCES, TTS_STITCHING_MAX_CHARS, ALLTALK_VOICE
+from src.cache import tts_cache, speech_cache_key
 from src.enums import ElevenLabsTTSModel, ElevenLabsTTSVoice
 from src.tools.format_tts import format_tts_text
-from src.utils import get_text_from_url, chunk_text, saveB64Audio
-from pydub import AudioSegment
+from src.tools.align import alignment_to_words, words_to_wordlevel_info
+from src.tools.audio import concat_audio, probe_duration
+from src.utils import get_text_from_url, chunk_text
 
 InputType = Literal["text", "file", "url"]
 
 CHUNK_LENGTH = 5000
 
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
 
 # TODO: allow specifying provider
 def make_tts(input_src: Union[str, Path],
@@ -28,7 +38,32 @@ def make_tts(input_src: Union[str, Path],
              reformat_url_text=False,
              provider: str = 'alltalk',
              model: Optional[str] = None,
-             voice: Optional[str] = None):
+             voice: Optional[str] = None,
+             concurrency: Optional[int] = None) -> str:
+	result = make_tts_job(input_src, input_type, output_path, reformat_url_text,
+	                      provider, model, voice, concurrency)
+	return result['path']
+
+
+def make_tts_job(input_src: Union[str, Path],
+                 input_type: InputType,
+                 output_path: str = 'output/tts/output.mp3',
+                 reformat_url_text=False,
+                 provider: str = 'alltalk',
+                 model: Optional[str] = None,
+                 voice: Optional[str] = None,
+                 concurrency: Optional[int] = None,
+                 timestamps=False) -> Dict[str, Any]:
+	"""
+	Same as `make_tts`, but returns the job result: the output `path`, the
+	`text` that was spoken, the number of `chunks`, where each chunk's text is
+	in the audio (`spans`, for `create_transcript`), how they were joined
+	(`concat`) and cache hits/misses.
+
+	With `timestamps` (elevenlabs only), the provider's timings are kept as
+	`words` and written next to the audio in the word JSON format of
+	`autocaption.transcribe_audio` (`words_path`), so no transcription is needed.
+	"""
 	global CHUNK_LENGTH
 	input_text: str = ''
 	if input_type == 'text':
@@ -48,8 +83,6 @@ def make_tts(input_src: Union[str, Path],
 		chunks.append(input_text)
 	has_multiple_chunks = len(chunks) > 1
 
-	audio_segments = []
-
 	if provider == 'elevenlabs':
 		CHUNK_LENGTH = 5000
 		if model is None:
@@ -63,39 +96,173 @@ def make_tts(input_src: Union[str, Path],
 		# if voice is None:
 		# 	voice = 'ljspeech'
 		model = ''
-		voice = ''
-		pass
+		voice = ALLTALK_VOICE
 
 	assert model is not None
 	assert voice is not None
+	if timestamps and provider != 'elevenlabs':
+		print(f'{provider} does not return timestamps')
+		timestamps = False
+	cache_stats = tts_cache.stats()
+	words: Optional[list[dict]] = None
 	if has_multiple_chunks:
-		for i, chunk in enumerate(chunks):
-			previous_text = ' '.join(chunks[:i])
-			next_text = ' '.join(chunks[i + 1:])
-			chunk_path = f"{output_path}_{i}.mp3"
-			o = get_speech_as_file(chunk, chunk_path, previous_text, next_text,
-			                       provider, model, voice)
-			chunk_path = o['path']
-			audio_segments.append(AudioSegment.from_file(chunk_path, format="mp3"))
-
-		# combine all the chunks
-		combined = audio_segments[0]
-		for segment in audio_segments[1:]:
-			combined += segment
-		combined.export(output_path, format="mp3")
+		results = synthesize_chunks(chunks,
+		                            output_path,
+		                            provider,
+		                            model,
+		                            voice,
+		                            concurrency,
+		                            timestamps=timestamps)
+		chunk_paths = [o['path'] for o in results]
+		spans = chunk_spans(chunks, chunk_paths)
+		if timestamps:
+			words = join_chunk_words(results, spans)
+		concat = concat_audio(chunk_paths, output_path)
+		print(f'Joined {len(chunks)} chunks using {concat}')
 
 		# delete the chunks
-		for i in range(len(chunks)):
-			Path(f"{output_path}_{i}.mp3").unlink()
+		for chunk_path in chunk_paths:
+			Path(chunk_path).unlink()
 	else:
+		concat = None
 		o = get_speech_as_file(input_text,
 		                       output_path,
 		                       provider=provider,
 		                       model=model,
-		                       voice=voice)
+		                       voice=voice,
+		                       timestamps=timestamps)
 		output_path = o['path']
+		words = o['words']
+		spans = chunk_spans(chunks, [output_path])
+
+	words_path = None
+	if words is not None:
+		words_path = f'{os.path.splitext(output_path)[0]}.words.json'
+		with open(words_path, 'w') as f:
+			json.dump(words_to_wordlevel_info(words), f, indent=4)
+
+	hits = tts_cache.hits - cache_stats['hits']
+	misses = tts_cache.misses - cache_stats['misses']
+	print(f'TTS cache: {hits} hits, {misses} misses')
+
+	return {
+	    'path': output_path,
+	    'text': input_text,
+	    'chunks': len(chunks),
+	    'spans': spans,
+	    'concat': concat,
+	    'cache_hits': hits,
+	    'cache_misses': misses,
+	    'words': words,
+	    'words_path': words_path,
+	}
+
+
+def chunk_spans(chunks: list[str], chunk_paths: list[str]) -> list[dict]:
+	"""Each chunk's text with where it starts and ends in the joined audio"""
+	spans = []
+	offset = 0.0
+	for chunk, chunk_path in zip(chunks, chunk_paths):
+		duration = probe_duration(chunk_path)
+		spans.append({'text': chunk, 'start': offset, 'end': offset + duration})
+		offset += duration
+	return spans
+
+
+def join_chunk_words(results: list[dict], spans: list[dict]) -> list[dict]:
+	"""Put each chunk's word timings on the timeline of the joined audio"""
+	words = []
+	for o, span in zip(results, spans):
+		for word in o['words'] or []:
+			words.append({
+			    **word, 'start': round(word['start'] + span['start'], 3),
+			    'end': round(word['end'] + span['start'], 3)
+			})
+	return words
 
-	return output_path
+
+def stitching_context(
+    chunks: list[str],
+    i: int,
+    sentences: int = TTS_STITCHING_SENTENCES,
+    max_chars: int = TTS_STITCHING_MAX_CHARS
+) -> tuple[Optional[str], Optional[str]]:
+	"""
+	Returns (previous_text, next_text) for chunk `i`: at most `sentences` sentences
+	on either side, capped at `max_chars`, so the request size doesn't grow with the document.
+	"""
+	previous: list[str] = []
+	for chunk in reversed(chunks[:i]):
+		previous = SENTENCE_END.split(chunk.strip()) + previous
+		if len(previous) >= sentences:
+			break
+	following: list[str] = []
+	for chunk in chunks[i + 1:]:
+		following += SENTENCE_END.split(chunk.strip())
+		if len(following) >= sentences:
+			break
+
+	previous_text = ' '.join(previous[-sentences:])[-max_chars:]
+	next_text = ' '.join(following[:sentences])[:max_chars]
+	return previous_text or None, next_text or None
+
+
+def synthesize_chunks(chunks: list[str],
+                      output_path: str,
+                      provider: str,
+                      model: str,
+                      voice: str,
+                      concurrency: Optional[int] = None,
+                      stitching: str = TTS_STITCHING_MODE,
+                      timestamps=False) -> list[dict]:
+	"""
+	Synthesize each chunk to `{output_path}_{i}.mp3` using a bounded worker pool.
+	Returns the `get_speech_as_file` result of each chunk in input order; a
+	failed chunk is retried on its own.
+	"""
+	if concurrency is None:
+		concurrency = TTS_CONCURRENCY.get(provider, 1)
+	assert concurrency is not None and concurrency > 0
+	if stitching not in ['window', 'request_ids']:
+		raise ValueError(f'Unsupported stitching mode: {stitching}')
+
+	def synthesize(i: int, previous_request_ids: Optional[list[str]] = None):
+		previous_text, next_text = stitching_context(chunks, i)
+		chunk_path = f"{output_path}_{i}.mp3"
+		for attempt in range(TTS_CHUNK_RETRIES + 1):
+			try:
+				return get_speech_as_file(chunks[i], chunk_path, previous_text,
+				                          next_text, provider, model, voice,
+				                          previous_request_ids, timestamps)
+			except Exception as e:
+				# the scheduler has already retried provider errors, only local
+				# failures (no audio, a failed write) are retried here
+				if attempt == TTS_CHUNK_RETRIES or isinstance(e, ProviderError):
+					raise
+				print(f'Chunk {i} failed ({e}), retrying')
+		raise RuntimeError(f'Chunk {i} failed')
+
+	results: list[dict] = [{}] * len(chunks)
+
+	if stitching == 'request_ids' and provider == 'elevenlabs':
+		# each request needs the ids of the ones before it, so they run in order
+		request_ids: list[str] = []
+		for i in range(len(chunks)):
+			o = synthesize(i, request_ids)
+			results[i] = o
+			# a cached chunk has no request id, which breaks the chain
+			request_ids = request_ids + [o['request_id']] if o['request_id'] else []
+			print(f'Chunk {i + 1}/{len(chunks)} done')
+		return results
+
+	with ThreadPoolExecutor(max_workers=concurrency) as executor:
+		futures = {executor.submit(synthesize, i): i for i in range(len(chunks))}
+		for future in as_completed(futures):
+			i = futures[future]
+			results[i] = future.result()
+			print(f'Chunk {i + 1}/{len(chunks)} done')
+
+	return results
 
 
 def get_speech_as_file(
@@ -105,19 +272,63 @@ def get_speech_as_file(
     next_text: Optional[str] = None,
     provider: str = 'elevenlabs',
     model: str = ElevenLabsTTSModel.Multilingual_v2.value,
-    voice: str = ElevenLabsTTSVoice.Brian.value) -> Dict[str, Any]:
-	if Path(output_path).exists():
-		print('File already exists:', output_path)
-		return {'path': output_path}
+    voice: str = ElevenLabsTTSVoice.Brian.value,
+    previous_request_ids: Optional[list[str]] = None,
+    timestamps=False) -> Dict[str, Any]:
+	"""
+	Synthesize `input_text` to `output_path`, returns the `path`, the
+	provider's `request_id` and, with `timestamps`, the timed `words`
+	"""
+	voice_settings = elevenlabs.voice_settings if provider == 'elevenlabs' else None
+	cache_key = speech_cache_key(provider, model, voice, voice_settings,
+	                             input_text, previous_text, next_text)
+	# one cache lookup per chunk: the words are only checked for, the audio is
+	# fetched, and missing words count as the chunk's miss
+	cached_words = tts_cache.path(cache_key, '.words.json') if timestamps else None
+	if cached_words is not None and not os.path.exists(cached_words):
+		cached_words = tts_cache.get(cache_key, '.words.json')
+	if (not timestamps or cached_words) and tts_cache.fetch(
+	    cache_key, output_path, '.mp3'):
+		print('Using cached audio for:', output_path)
+		words = None
+		if cached_words:
+			with open(cached_words) as f:
+				words = json.load(f)
+		return {'path': output_path, 'request_id': None, 'words': words}
 
-	if provider == 'elevenlabs':
-		tts = elevenlabs.getSpeechB64(input_text,
-		                              model_id=model,
-		                              voice_id=voice,
-		                              previous_text=previous_text,
-		                              next_text=next_text)
+	words = None
+	if provider == 'elevenlabs' and timestamps:
+		o = elevenlabs.writeSpeechWithTimestamps(
+		    input_text,
+		    output_path,
+		    model_id=model,
+		    voice_id=voice,
+		    previous_text=previous_text,
+		    next_text=next_text,
+		    previous_request_ids=previous_request_ids)
+		words = alignment_to_words(o['alignment']) if o['alignment'] else []
+	elif provider == 'elevenlabs':
+		o = elevenlabs.writeSpeech(input_text,
+		                           output_path,
+		                           model_id=model,
+		                           voice_id=voice,
+		                           previous_text=previous_text,
+		                           next_text=next_text,
+		                           previous_request_ids=previous_request_ids)
 	elif provider == 'alltalk':
-		tts = alltalk.getSpeechB64(input_text)
+		o = alltalk.writeSpeech(input_text, output_path)
+	else:
+		raise ValueError(f'Unsupported provider: {provider}')
+
+	if not o['bytes']:
+		Path(output_path).unlink()
+		raise RuntimeError(f'{provider} returned no audio for: {output_path}')
 
-	saveB64Audio(tts, output_path)
-	return {'path': output_path}
+	tts_cache.put(cache_key, output_path, '.mp3')
+	if words is not None:
+		words_path = f'{output_path}.words.json'
+		with open(words_path, 'w') as f:
+			json.dump(words, f)
+		tts_cache.put(cache_key, words_path, '.words.json')
+		Path(words_path).unlink()
+	return {'path': output_path, 'request_id': o['request_id'], 'words': words}
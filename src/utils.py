@@ -2,12 +2,17 @@ import base64
 import json
 import os
 from datetime import datetime
+from typing import Iterator, Optional
 from PIL import Image
 from io import BytesIO
 from IPython import display
 from src.clients import elevenlabs
+from src.cache import tts_cache, speech_cache_key
+from src.config import DEFAULT_TTS_MODEL, DEFAULT_TTS_VOICE
 from newspaper import Article
 
+SENTENCE_BOUNDARIES = ('.', '!', '?', '\n')
+
 
 def ensuredir(path):
 	# is file? get dirname
@@ -31,10 +36,20 @@ def create_audio(text,
 	# see https://elevenlabs.io/docs/api-reference/how-to-use-request-stitching
 	if project_folder is None:
 		project_folder = create_project_folder()
+	if model is None:
+		model = DEFAULT_TTS_MODEL
+	if voice is None:
+		voice = DEFAULT_TTS_VOICE
 
-	audio = elevenlabs.getSpeechB64(text, model, voice)
 	audio_path = os.path.join(project_folder, audio_name)
-	saveB64Audio(audio, audio_path)
+	cache_key = speech_cache_key('elevenlabs', model, voice,
+	                             elevenlabs.voice_settings, text)
+	if tts_cache.fetch(cache_key, audio_path, '.mp3'):
+		print(f"Audio {audio_name} restored from cache in {project_folder}")
+		return project_folder, audio_path
+
+	elevenlabs.writeSpeech(text, audio_path, model_id=model, voice_id=voice)
+	tts_cache.put(cache_key, audio_path, '.mp3')
 
 	print(f"Audio {audio_name} created successfully in {project_folder}")
 	return project_folder, audio_path
@@ -122,45 +137,10 @@ def displayVideo(b64='', path=''):
 # - lines starting with # are considered titles and are separated from the rest of the text
 # - lines starting with [ and ending with ] are considered comments and are removed from the text
 def chunkTextForTTS(text: str, max_chars=5000) -> list[dict]:
-	sections = []
-	lines = text.split('\n')
-	section = {'type': 'text', 'content': ''}
-
-	# filter out empty lines
-	lines = [line for line in lines if line.strip()]
-
-	for line in lines:
-		# '--' to start a new chunk
-		if line.startswith('--'):
-			if section['content']:
-				section['content'] = section['content'].strip()
-				sections.append(section)
-			section = {'type': 'text', 'content': ''}
-			continue
-
-		if '[' in line and ']' in line:  # remove comments
-			comment_start = line.find('[')
-			comment_end = line.find(']')
-			comment = line[comment_start:comment_end + 1]
-			line = line.replace(comment, '')
-
-		if line.startswith('#'):  # new title
-			if section['content']:
-				section['content'] = section['content'].strip()
-				sections.append(section)
-			section = {'type': 'title', 'content': line.lstrip('#').strip()}
-			sections.append(section)
-			section = {'type': 'text', 'content': ''}
-		else:  # new chunk
-			if len(section['content']) + len(line) + 1 > max_chars:
-				sections.append(section)
-				section = {'type': 'text', 'content': ''}
-			section['content'] += line.strip() + '\n'
-
-	if section['content']:
-		sections.append(section)
-
-	return sections
+	return [{
+	    'type': section['type'],
+	    'content': section['content']
+	} for section in segment_text(text, max_chars, script=True)]
 
 
 def extractSingleJsonString(json: str, key):
@@ -226,22 +206,149 @@ def extractSingleArray(json_string: str, key: str):
 
 
 def chunk_text(text, max_length=5000):
-	chunks = []
-	while len(text) > max_length:
-		# Find the nearest ending punctuation before the max_length
-		end = text.rfind('.', 0, max_length)
-		if end == -1:
-			end = text.rfind('!', 0, max_length)
-		if end == -1:
-			end = text.rfind('?', 0, max_length)
-		if end == -1:
-			end = text.rfind('\n', 0, max_length)
+	return [chunk['content'] for chunk in segment_text(text, max_length)]
+
+
+def split_sentences(text: str,
+                    max_length: int,
+                    start=0,
+                    stop: Optional[int] = None) -> Iterator[tuple[int, int]]:
+	"""
+	Yield (start, end) offsets of pieces of `text[start:stop]` that are at most
+	`max_length` long (+1 when there's no sentence boundary to split at),
+	preferring to split after a '.', then '!', '?' and finally a newline.
+	Whitespace between pieces is skipped, as is trailing whitespace after the first piece.
+	"""
+	if stop is None:
+		stop = len(text)
+	stripped_stop = stop
+	while stripped_stop > start and text[stripped_stop - 1].isspace():
+		stripped_stop -= 1
+	first = True
+	while (stop if first else stripped_stop) - start > max_length:
+		window = start + max_length
+		end = -1
+		for mark in SENTENCE_BOUNDARIES:
+			end = text.rfind(mark, start, window)
+			if end != -1:
+				break
 		if end == -1:
-			end = max_length  # If no punctuation is found, chunk at max_length
-		chunks.append(text[:end + 1])
-		text = text[end + 1:].strip()
-	chunks.append(text)
-	return chunks
+			end = window  # If no punctuation is found, chunk at max_length
+		yield start, end + 1
+		start = end + 1
+		while start < stop and text[start].isspace():
+			start += 1
+		first = False
+	yield start, (stop if first else stripped_stop)
+
+
+def piece_offsets(text: str, piece: str, cursor: int, line_start: int,
+                  line_end: int) -> tuple[int, int]:
+	"""Offsets of `piece` of a line in `text`, or the line's if a removed comment split it"""
+	found = text.find(piece, cursor, line_end)
+	if found == -1:
+		return line_start, line_end
+	return found, found + len(piece)
+
+
+def segment_text(text: str, max_chars=5000, script=False) -> Iterator[dict]:
+	"""
+	Split `text` into chunks of at most `max_chars` in a single pass.
+
+	Yields dicts with the chunk's 'type' ('text' or 'title'), 'content', and the
+	'start'/'end' character offsets that it spans in `text`. With `script=True`,
+	the format described above `chunkTextForTTS` is honoured: '#' titles, '--'
+	breaks and '[comments]'; otherwise chunks end at sentence boundaries.
+	"""
+	if not script:
+		for start, end in split_sentences(text, max_chars):
+			yield {'type': 'text', 'content': text[start:end], 'start': start, 'end': end}
+		return
+
+	parts: list[str] = []
+	length = 0
+	start = end = 0
+
+	def section(strip: bool) -> dict:
+		content = ''.join(parts)
+		return {
+		    'type': 'text',
+		    'content': content.strip() if strip else content,
+		    'start': start,
+		    'end': end
+		}
+
+	pos = 0
+	while pos <= len(text):
+		line_end = text.find('\n', pos)
+		if line_end == -1:
+			line_end = len(text)
+		line_start = pos
+		line = text[line_start:line_end]
+		pos = line_end + 1
+		if not line.strip():
+			continue
+
+		# '--' to start a new chunk
+		if line.startswith('--'):
+			if parts:
+				yield section(strip=True)
+			parts, length = [], 0
+			continue
+
+		if '[' in line and ']' in line:  # remove comments
+			comment_start = line.find('[')
+			comment_end = line.find(']')
+			comment = line[comment_start:comment_end + 1]
+			line = line.replace(comment, '')
+			if not line.strip():
+				continue
+
+		if line.startswith('#'):  # new title
+			if parts:
+				yield section(strip=True)
+			parts, length = [], 0
+			yield {
+			    'type': 'title',
+			    'content': line.lstrip('#').strip(),
+			    'start': line_start,
+			    'end': line_end
+			}
+			continue
+
+		stripped = line.strip()
+		if parts and length + len(line) + 1 > max_chars:
+			yield section(strip=False)
+			parts, length = [], 0
+
+		if len(stripped) + 1 > max_chars:
+			# a single line that is too long on its own is split at sentence boundaries
+			pieces = [
+			    stripped[piece_start:piece_end].strip()
+			    for piece_start, piece_end in split_sentences(stripped, max_chars - 1)
+			]
+			pieces = [piece for piece in pieces if piece]
+			if not pieces:
+				continue
+			cursor = line_start
+			for piece in pieces[:-1]:
+				start, end = piece_offsets(text, piece, cursor, line_start, line_end)
+				cursor = end
+				parts = [piece + '\n']
+				yield section(strip=False)
+			parts, length = [], 0
+			stripped = pieces[-1]
+			line_start, line_end = piece_offsets(text, stripped, cursor, line_start,
+			                                     line_end)
+
+		if not parts:
+			start = line_start
+		parts.append(stripped + '\n')
+		length += len(stripped) + 1
+		end = line_end
+
+	if parts:
+		yield section(strip=False)
 
 
 def get_text_from_url(url, cache_file='cache.json'):
@@ -0,0 +1,205 @@
+import os
+from typing import Optional
+import ffmpeg
+from PIL import ImageFont
+from src.tools.audio import mp4_audio_codec
+from src.video.text import Color, find_font, parse_color
+
+# Captions as an Advanced SubStation Alpha file, burned in by ffmpeg's
+# subtitles filter (libass) in a single pass, with no per-frame work in Python.
+# Each caption line is one event, its words timed with karaoke \k tags: a word
+# turns to the highlight colour when it starts and back when it ends, like the
+# highlight clips of the MoviePy renderers.
+
+# `add_captions` positions -> (ASS alignment, vertical margin as a fraction of the height)
+POSITIONS = {
+    'bottom75': (8, 0.75),
+    'bottom': (2, None),
+    'top': (8, None),
+    'center': (5, None),
+    'left': (4, None),
+    'right': (6, None)
+}
+
+
+def ass_color(color: Optional[Color], opacity=1.0) -> str:
+	"""&HAABBGGRR, where AA is transparency"""
+	r, g, b, a = parse_color(color)
+	return f'&H{255 - round(a * opacity):02X}{b:02X}{g:02X}{r:02X}'
+
+
+def ass_time(seconds: float) -> str:
+	centiseconds = max(0, round(seconds * 100))
+	hours, centiseconds = divmod(centiseconds, 360000)
+	minutes, centiseconds = divmod(centiseconds, 6000)
+	return f'{hours}:{minutes:02}:{centiseconds // 100:02}.{centiseconds % 100:02}'
+
+
+def escape_text(text: str) -> str:
+	# braces always start override tags and can't be escaped
+	return text.replace('{', '(').replace('}', ')').replace('\\', '/').replace(
+	    '\n', ' ')
+
+
+def font_name(path: str) -> str:
+	"""The full name libass looks the font up by, e.g. 'Poppins ExtraBold'"""
+	family, style = ImageFont.truetype(path, 10).getname()
+	return family if style in (None, '', 'Regular') else f'{family} {style}'
+
+
+def karaoke_text(line: dict, color: Color, highlight_color: Color) -> str:
+	"""
+	The line's words with a \\k for each, lasting until the next word starts, and
+	a \\t back to `color` when the word ends. Override tags carry on to the rest
+	of the event, so each word sets the primary colour back to `highlight_color`
+	before its own \\t.
+	"""
+	start = line['start']
+	words = line['textcontents']
+	parts = []
+	# centiseconds from the start of the event, rounded once so durations don't drift
+	offsets = [round((word['start'] - start) * 100) for word in words]
+	# time before the first word, without a space
+	lead = f'{{\\k{offsets[0]}}}' if offsets[0] > 0 else ''
+	highlight = ass_color(highlight_color)[4:]
+	base = ass_color(color)[4:]
+	for i, word in enumerate(words):
+		next_offset = offsets[i + 1] if i + 1 < len(words) else round(
+		    (word['end'] - start) * 100)
+		end_ms = round((word['end'] - start) * 1000)
+		parts.append(f'{{\\k{max(0, next_offset - offsets[i])}\\1c&H{highlight}&'
+		             f'\\t({end_ms},{end_ms},\\1c&H{base}&)}}'
+		             f'{escape_text(word["word"])}')
+	return lead + ' '.join(parts)
+
+
+def write_ass(lines: list[dict],
+              path: str,
+              frame_size: tuple[int, int],
+              font: Optional[str] = None,
+              fontsize: float = 24,
+              color: Color = 'white',
+              highlight_color: Color = 'yellow',
+              stroke_color: Optional[Color] = 'black',
+              stroke_width: float = 1,
+              kerning: Optional[float] = None,
+              position='bottom',
+              margin_h=50,
+              margin_v=40,
+              box_opacity=0.0,
+              box_color: Color = 'rgb(64, 64, 64)') -> str:
+	"""
+	Write caption lines (see src/video/captions.py) as an ASS file and return
+	the directory of the font, for the subtitles filter's `fontsdir`.
+	Sizes are in pixels of `frame_size`, `kerning` is extra space between characters.
+	"""
+	width, height = frame_size
+	font_path = find_font(font)
+	alignment, relative_margin = POSITIONS[position]
+	if relative_margin is not None:
+		margin_v = round(height * relative_margin)
+	outline = stroke_width / 2 if stroke_color is not None else 0
+	# 4 draws a box behind the text and keeps the outline (3 would replace it)
+	border_style = 4 if box_opacity > 0 else 1
+
+	style = ','.join(
+	    str(value) for value in [
+	        'Caption',
+	        font_name(font_path),
+	        fontsize,
+	        # karaoke: words are Secondary until they start, Primary after
+	        ass_color(highlight_color),
+	        ass_color(color),
+	        ass_color(stroke_color),
+	        ass_color(box_color, box_opacity),
+	        0, 0, 0, 0, 100, 100,
+	        kerning or 0,
+	        0,
+	        border_style,
+	        outline,
+	        0,
+	        alignment,
+	        margin_h,
+	        margin_h,
+	        margin_v,
+	        1
+	    ])
+
+	with open(path, 'w', encoding='utf-8') as f:
+		f.write('[Script Info]\n'
+		        'ScriptType: v4.00+\n'
+		        f'PlayResX: {width}\n'
+		        f'PlayResY: {height}\n'
+		        'WrapStyle: 0\n'
+		        'ScaledBorderAndShadow: yes\n\n'
+		        '[V4+ Styles]\n'
+		        'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, '
+		        'OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, '
+		        'ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, '
+		        'Alignment, MarginL, MarginR, MarginV, Encoding\n'
+		        f'Style: {style}\n\n'
+		        '[Events]\n'
+		        'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, '
+		        'Effect, Text\n')
+		for line in lines:
+			if not line['textcontents']:
+				continue
+			f.write(f'Dialogue: 0,{ass_time(line["start"])},{ass_time(line["end"])},'
+			        f'Caption,,0,0,0,,{karaoke_text(line, color, highlight_color)}\n')
+	return os.path.dirname(os.path.abspath(font_path))
+
+
+def probe_video_size(path: str) -> Optional[tuple[int, int]]:
+	return video_size(ffmpeg.probe(path))
+
+
+def video_size(info: dict) -> Optional[tuple[int, int]]:
+	"""(width, height) of the video in ffprobe output, None for audio (cover art doesn't count)"""
+	for stream in info['streams']:
+		if stream['codec_type'] == 'video' and not stream.get(
+		    'disposition', {}).get('attached_pic'):
+			return (int(stream['width']), int(stream['height']))
+	return None
+
+
+def burn_subtitles(media_path: str,
+                   subtitles_path: str,
+                   output_path: str,
+                   fonts_dir: Optional[str] = None,
+                   size=(720, 480),
+                   background: Color = 'black',
+                   fps=24):
+	"""
+	Burn subtitles into `media_path` in one ffmpeg pass, copying its audio as is.
+	Audio-only media gets a plain `background` of `size` instead.
+	"""
+	info = ffmpeg.probe(media_path)
+	audio = next((s for s in info['streams'] if s['codec_type'] == 'audio'),
+	             None)
+
+	source = ffmpeg.input(media_path)
+	if video_size(info) is not None:
+		video = source.video
+	else:
+		r, g, b, _ = parse_color(background)
+		video = ffmpeg.input(f'color=c=0x{r:02X}{g:02X}{b:02X}:s={size[0]}x{size[1]}'
+		                     f':r={fps}',
+		                     f='lavfi',
+		                     t=info['format']['duration'])
+	options = {'filename': subtitles_path}
+	if fonts_dir:
+		options['fontsdir'] = fonts_dir
+	video = video.filter('subtitles', **options)
+
+	outputs = [video]
+	output_options = {'vcodec': 'libx264', 'pix_fmt': 'yuv420p'}
+	if audio is not None:
+		outputs.append(source.audio)
+		output_options['acodec'] = mp4_audio_codec(audio['codec_name'])
+	try:
+		ffmpeg.output(*outputs, output_path,
+		              **output_options).run(overwrite_output=True,
+		                                    capture_stdout=True,
+		                                    capture_stderr=True)
+	except ffmpeg.Error as e:
+		raise RuntimeError(f'Failed to burn in subtitles: {e.stderr.decode()}') from e
@@ -0,0 +1,121 @@
+import json
+import os
+
+# Caption lines for the renderers, from any of the transcripts we produce:
+# SRT, whisper_timestamped-style JSON (segments with words) from
+# `create_transcript`, Lemonfox's verbose JSON, and the word JSON of
+# `VideoCaptioner`. A line is {'word' (its text), 'start', 'end',
+# 'textcontents': [{'word', 'start', 'end'}, ...]}, as `split_text_into_lines`
+# in autocaption makes them.
+
+
+def parse_srt_time(value: str) -> float:
+	# our SRT cues can have plain seconds as well as HH:MM:SS,mmm
+	return sum(
+	    float(x) * 60**i
+	    for i, x in enumerate(reversed(value.strip().replace(',', '.').split(':'))))
+
+
+def read_srt(path: str) -> list[tuple[float, float, str]]:
+	"""(start, end, text) of every cue"""
+	with open(path, 'r', encoding='utf-8') as f:
+		blocks = f.read().strip().split('\n\n')
+	cues = []
+	for block in blocks:
+		parts = block.split('\n')
+		if len(parts) >= 3:
+			times = parts[1].split(' --> ')
+			cues.append((parse_srt_time(times[0]), parse_srt_time(times[1]),
+			             ' '.join(parts[2:])))
+	return cues
+
+
+def make_line(words: list[dict]) -> dict:
+	return {
+	    'word': ' '.join(word['word'] for word in words),
+	    'start': words[0]['start'],
+	    'end': words[-1]['end'],
+	    'textcontents': words
+	}
+
+
+def spread_words(text: str, start: float, end: float) -> list[dict]:
+	"""Words of `text` with the cue's time split evenly between them"""
+	words = text.split()
+	if not words:
+		return []
+	word_duration = (end - start) / len(words)
+	return [{
+	    'word': word,
+	    'start': start + i * word_duration,
+	    'end': start + (i + 1) * word_duration
+	} for i, word in enumerate(words)]
+
+
+def srt_lines(path: str) -> list[dict]:
+	lines = []
+	for start, end, text in read_srt(path):
+		words = spread_words(text, start, end)
+		if words:
+			lines.append(make_line(words))
+	return lines
+
+
+def segment_lines(segments: list[dict]) -> list[dict]:
+	lines = []
+	for segment in segments:
+		if segment.get('words'):
+			words = [{
+			    'word': word.get('text', word.get('word', '')).strip(),
+			    'start': word['start'],
+			    'end': word['end']
+			} for word in segment['words']]
+		else:
+			words = spread_words(segment['text'], segment['start'], segment['end'])
+		words = [word for word in words if word['word']]
+		if words:
+			lines.append(make_line(words))
+	return lines
+
+
+def read_transcript(path: str) -> tuple[list[dict], bool]:
+	"""
+	Caption lines of an SRT or JSON transcript, or its words if it's just a list
+	of words, and whether it was lines
+	"""
+	if os.path.splitext(path)[1].lower() == '.srt':
+		return srt_lines(path), True
+
+	with open(path, encoding='utf-8') as f:
+		data = json.load(f)
+	if isinstance(data, dict):
+		# Lemonfox's word timings are top level, next to segments without them
+		if not data.get('words'):
+			return segment_lines(data.get('segments', [])), True
+		data = data['words']
+	words = [{
+	    'word': word.get('word', word.get('text', '')).strip(),
+	    'start': word['start'],
+	    'end': word['end']
+	} for word in data]
+	return [word for word in words if word['word']], False
+
+
+def load_caption_words(path: str) -> list[dict]:
+	"""Timed words ({'word', 'start', 'end'}) of an SRT or JSON transcript"""
+	items, is_lines = read_transcript(path)
+	if is_lines:
+		return [word for line in items for word in line['textcontents']]
+	return items
+
+
+def load_caption_lines(path: str, max_chars=20) -> list[dict]:
+	"""
+	Caption lines of an SRT or JSON transcript. Transcripts keep their cues or
+	segments, bare word lists are split into lines of up to `max_chars` characters.
+	"""
+	items, is_lines = read_transcript(path)
+	if is_lines:
+		return items
+	from autocaption.autocaption import split_text_into_lines
+	return split_text_into_lines(items, None, max_chars)
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from typing import Union
+import numpy as np
+
+# Draws caption sprites (RGBA arrays, see src/video/sprites.py) onto video
+# frames. Putting every caption clip into one CompositeVideoClip makes MoviePy
+# check the whole timeline on every frame, here sprites are indexed by time so
+# a frame only touches the few that are showing.
+
+Position = Union[str, tuple]
+
+
+class CaptionCompositor:
+	"""
+	Sprites placed at (x, y) between `start` and `end` seconds, drawn in the
+	order they were added. They're indexed in buckets of `bucket_seconds`, so
+	finding the ones showing at any time costs the same for short and long videos.
+	"""
+
+	def __init__(self, bucket_seconds=1.0):
+		self.bucket_seconds = bucket_seconds
+		self.buckets: defaultdict[int, list[dict]] = defaultdict(list)
+		self.count = 0
+
+	def add(self, sprite: np.ndarray, x: float, y: float, start: float,
+	        end: float):
+		if end <= start or sprite.size == 0:
+			return
+		item = {
+		    'order': self.count,
+		    'sprite': sprite,
+		    # truncated like MoviePy's own positioning
+		    'x': int(x),
+		    'y': int(y),
+		    'start': start,
+		    'end': end
+		}
+		self.count += 1
+		for bucket in range(int(start // self.bucket_seconds),
+		                    int(end // self.bucket_seconds) + 1):
+			self.buckets[bucket].append(item)
+
+	def items(self, start: float, end: float) -> list[dict]:
+		"""Sprites showing at some point between `start` and `end`, in drawing order"""
+		items = {
+		    id(item): item
+		    for bucket in range(int(start // self.bucket_seconds),
+		                        int(end // self.bucket_seconds) + 1)
+		    for item in self.buckets.get(bucket, [])
+		    if item['start'] < end and item['end'] > start
+		}
+		return sorted(items.values(), key=lambda item: item['order'])
+
+	def window(self, start: float, end: float) -> 'CaptionCompositor':
+		"""A compositor with just the sprites showing between `start` and `end`, on the same timeline"""
+		part = CaptionCompositor(self.bucket_seconds)
+		for item in self.items(start, end):
+			part.add(item['sprite'], item['x'], item['y'], item['start'],
+			         item['end'])
+		return part
+
+	def active(self, t: float) -> list[dict]:
+		"""Sprites showing at `t`, in drawing order"""
+		return [
+		    item for item in self.buckets.get(int(t // self.bucket_seconds), [])
+		    if item['start'] <= t < item['end']
+		]
+
+	def draw(self, frame: np.ndarray, t: float) -> np.ndarray:
+		items = self.active(t)
+		if not items:
+			return frame
+		frame = frame.copy()
+		for item in items:
+			blend(frame, item['sprite'], item['x'], item['y'])
+		return frame
+
+	def apply(self, clip, offset=0.0):
+		"""
+		`clip` with the sprites drawn over it, audio and timing unchanged.
+		`offset` is where the clip starts on the captions' timeline.
+		"""
+		return clip.fl(lambda get_frame, t: self.draw(get_frame(t), t + offset))
+
+
+def blend(frame: np.ndarray, sprite: np.ndarray, x: int,
+          y: int) -> tuple[int, int, int, int]:
+	"""
+	Alpha blend an RGBA sprite onto an RGB or RGBA frame in place, clipped to
+	the frame. Returns the (x0, y0, x1, y1) box that was drawn on.
+	"""
+	height, width = frame.shape[:2]
+	x0, y0 = max(x, 0), max(y, 0)
+	x1 = min(x + sprite.shape[1], width)
+	y1 = min(y + sprite.shape[0], height)
+	if x0 >= x1 or y0 >= y1:
+		return (x0, y0, x0, y0)
+	part = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+	alpha = part[..., 3:].astype(np.float32) / 255
+	region = frame[y0:y1, x0:x1].astype(np.float32)
+	if frame.shape[2] == 3:
+		frame[y0:y1, x0:x1] = (part[..., :3] * alpha + region *
+		                       (1 - alpha)).round().astype(frame.dtype)
+		return (x0, y0, x1, y1)
+
+	# onto a transparent layer: the 'over' operator
+	below = region[..., 3:] / 255 * (1 - alpha)
+	out_alpha = alpha + below
+	rgb = np.divide(part[..., :3] * alpha + region[..., :3] * below,
+	                out_alpha,
+	                out=np.zeros_like(region[..., :3]),
+	                where=out_alpha > 0)
+	frame[y0:y1, x0:x1] = np.dstack(
+	    (rgb, out_alpha * 255)).round().astype(frame.dtype)
+	return (x0, y0, x1, y1)
+
+
+def solid_sprite(width: int, height: int, color: tuple,
+                 opacity: float) -> np.ndarray:
+	"""A box of `color` as an RGBA sprite"""
+	sprite = np.empty((height, width, 4), dtype=np.uint8)
+	sprite[..., :3] = color
+	sprite[..., 3] = round(opacity * 255)
+	return sprite
+
+
+def resolve_position(position: Position, size: tuple[int, int],
+                     frame_size: tuple[int, int],
+                     relative=False) -> tuple[float, float]:
+	"""
+	Top left corner of something `size` big placed at `position` in a frame,
+	with MoviePy's `set_position` semantics ('center', ('center', 0.75) with `relative`, ...)
+	"""
+	if isinstance(position, str):
+		position = {
+		    'center': ['center', 'center'],
+		    'left': ['left', 'center'],
+		    'right': ['right', 'center'],
+		    'top': ['center', 'top'],
+		    'bottom': ['center', 'bottom']
+		}[position]
+	else:
+		position = list(position)
+	if relative:
+		for i, dim in enumerate(frame_size):
+			if not isinstance(position[i], str):
+				position[i] = dim * position[i]
+	if isinstance(position[0], str):
+		position[0] = {
+		    'left': 0,
+		    'center': (frame_size[0] - size[0]) / 2,
+		    'right': frame_size[0] - size[0]
+		}[position[0]]
+	if isinstance(position[1], str):
+		position[1] = {
+		    'top': 0,
+		    'center': (frame_size[1] - size[1]) / 2,
+		    'bottom': frame_size[1] - size[1]
+		}[position[1]]
+	return position[0], position[1]
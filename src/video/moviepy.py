@@ -1,21 +1,33 @@
-from moviepy.editor import AudioFileClip, TextClip, CompositeVideoClip
+import os
+from typing import Optional
+from moviepy.editor import AudioFileClip, CompositeVideoClip
 from moviepy.video.VideoClip import ColorClip
 from moviepy.editor import VideoFileClip
-
-
-def create_word_clips(text_segment,
-                      start_time,
-                      end_time,
-                      fontsize=24,
-                      bg_color=(0, 0, 0, 0),
-                      width=720,
-                      height=480):
-	"""Create clips for full text with word highlighting"""
+from src.config import CAPTION_RENDERER
+from src.video.ass import burn_subtitles, probe_video_size, write_ass
+from src.video.captions import read_srt, srt_lines
+from src.video.compositor import CaptionCompositor
+from src.video.overlay import render_overlay
+from src.video.render import render_slices, slice_count
+from src.video.sprites import sprite_cache
+
+
+def create_word_sprites(text_segment,
+                        start_time,
+                        end_time,
+                        fontsize=24,
+                        bg_color=(0, 0, 0, 0),
+                        width=720,
+                        height=480):
+	"""
+	Place the text with word highlighting: returns sprites with their position
+	and timing ({'sprite', 'x', 'y', 'start', 'end'}) and the height of the text
+	"""
 	words = text_segment.split()
 	duration = end_time - start_time
 	word_duration = duration / len(words)
 
-	word_clips = []
+	word_sprites = []
 	line_words = []
 	current_line_width = 0
 	max_line_width = width - 100  # Leave margins
@@ -25,25 +37,25 @@ def create_word_clips(text_segment,
 	current_time = start_time
 	current_line = []
 
-	# Create a temp clip to get consistent height
-	temp_clip = TextClip(
-	    "TEST",
-	    fontsize=fontsize,
-	    color='white',
-	    stroke_color='rgb(50, 50, 50)',
-	    stroke_width=1,
-	)
-	line_height = temp_clip.size[1]
+	# every word is rasterized once (see src/video/sprites.py), the base style
+	# has the same size as the highlight so it's used for measuring too
+	base_style = {
+	    'fontsize': fontsize,
+	    'color': 'white',
+	    'stroke_color': 'rgba(50, 50, 50, 0)',
+	    'stroke_width': 1,
+	    'bg_color': f'rgb{bg_color}'
+	}
+	highlight_style = {
+	    **base_style, 'color': 'yellow',
+	    'stroke_color': 'rgb(50, 50, 50)'
+	}
+
+	# height of a reference word, so every line is equally tall
+	line_height = sprite_cache.get("TEST", **base_style).shape[0]
 
 	for word in words:
-		word_clip = TextClip(word,
-		                     fontsize=fontsize,
-		                     color='white',
-		                     stroke_color='rgb(50, 50, 50)',
-		                     stroke_width=1,
-		                     bg_color=f'rgba{bg_color}')
-
-		word_width = word_clip.size[0]
+		word_width = sprite_cache.get(word, **base_style).shape[1]
 
 		# Check if adding this word would exceed line width
 		if current_line_width + word_width + 10 > max_line_width and current_line:
@@ -82,7 +94,7 @@ def create_word_clips(text_segment,
 	bottom_margin = 40
 	start_y = height - bottom_margin - total_height
 
-	# Second pass: create all clips with proper positioning
+	# Second pass: place every word
 	current_y = start_y
 
 	for line in lines_info:
@@ -91,37 +103,44 @@ def create_word_clips(text_segment,
 		current_x = start_x
 
 		for word_info in line['words']:
-			# Base word clip (visible entire duration)
-			base_clip = (TextClip(
-			    word_info['word'],
-			    fontsize=fontsize,
-			    color='white',
-			    stroke_color='rgba(50, 50, 50, 0)',
-			    stroke_width=1,
-			    bg_color=f'rgb{bg_color}').set_position(
-			        (current_x,
-			         current_y)).set_start(start_time).set_duration(end_time -
-			                                                        start_time))
-
-			# Highlight clip (visible only during word timing)
-			highlight_clip = (
-			    TextClip(
-			        word_info['word'],
-			        fontsize=fontsize,
-			        color='yellow',  # Highlight color
-			        stroke_color='rgb(50, 50, 50)',
-			        stroke_width=1,
-			        bg_color=f'rgb{bg_color}').set_position(
-			            (current_x, current_y)).set_start(
-			                word_info['start']).set_duration(word_info['end'] -
-			                                                 word_info['start']))
-
-			word_clips.extend([base_clip, highlight_clip])
+			# Base word (visible entire duration)
+			word_sprites.append({
+			    'sprite': sprite_cache.get(word_info['word'], **base_style),
+			    'x': current_x,
+			    'y': current_y,
+			    'start': start_time,
+			    'end': end_time
+			})
+
+			# Highlight (visible only during word timing)
+			word_sprites.append({
+			    'sprite': sprite_cache.get(word_info['word'], **highlight_style),
+			    'x': current_x,
+			    'y': current_y,
+			    'start': word_info['start'],
+			    'end': word_info['end']
+			})
 			current_x += word_info['width'] + 10  # Add space between words
 
 		current_y += line_height + 5  # Move to next line
 
-	return word_clips, total_height
+	return word_sprites, total_height
+
+
+def create_subtitle_compositor(srt_file, bg_color, width, height):
+	compositor = CaptionCompositor()
+	for start_time, end_time, text in read_srt(srt_file):
+		# Place words with highlighting
+		word_sprites, _ = create_word_sprites(text,
+		                                      start_time,
+		                                      end_time,
+		                                      fontsize=24,
+		                                      bg_color=bg_color,
+		                                      width=width,
+		                                      height=height)
+		for word in word_sprites:
+			compositor.add(**word)
+	return compositor
 
 
 def create_video_with_subtitles(media_file,
@@ -129,9 +148,42 @@ def create_video_with_subtitles(media_file,
                                 output_video_file,
                                 greenscreen=True,
                                 width=720,
-                                height=480):
+                                height=480,
+                                renderer=CAPTION_RENDERER,
+                                slices: Optional[int] = None):
+	"""
+	Caption `media_file` (a video, or audio to put on a plain background) with
+	the SRT's cues. `renderer` is 'moviepy' (in `slices` parallel slices when
+	more than 1), 'ass' or 'overlay', see `captions` in config/config.yaml.
+	"""
+	if renderer == 'ass':
+		create_video_with_ass_subtitles(media_file, srt_file, output_video_file,
+		                                greenscreen, width, height)
+		return
+
+	bg_color = (0, 255, 0) if greenscreen else (0, 0, 0)
+	is_video = media_file.lower().endswith(('.mp4', '.mov', '.avi', '.mkv'))
+
+	if renderer == 'overlay' or slice_count(slices) > 1:
+		# ffmpeg reads the source, MoviePy never opens it here
+		if is_video:
+			width, height = probe_video_size(media_file) or (width, height)
+		compositor = create_subtitle_compositor(srt_file, bg_color, width, height)
+		background = None if is_video else bg_color
+		if renderer == 'overlay':
+			render_overlay(media_file, compositor, output_video_file, background,
+			               (width, height))
+		else:
+			render_slices(media_file,
+			              compositor,
+			              output_video_file,
+			              slices,
+			              background=background,
+			              size=(width, height))
+		return
+
 	# Media file handling
-	if media_file.lower().endswith(('.mp4', '.mov', '.avi', '.mkv')):
+	if is_video:
 		media_clip = VideoFileClip(media_file)
 	else:
 		media_clip = AudioFileClip(media_file)
@@ -139,56 +191,17 @@ def create_video_with_subtitles(media_file,
 	if isinstance(media_clip, VideoFileClip):
 		width, height = media_clip.size
 
-	# Read and parse the SRT file
-	with open(srt_file, 'r', encoding='utf-8') as f:
-		srt_content = f.read().strip().split('\n\n')
+	compositor = create_subtitle_compositor(srt_file, bg_color, width, height)
 
-	bg_color = (0, 255, 0) if greenscreen else (0, 0, 0)
-
-	all_clips = []
-	y_offset = 150  # Starting Y position near bottom
-
-	for block in srt_content:
-		parts = block.split('\n')
-		if len(parts) >= 3:
-			times = parts[1].split(' --> ')
-			start_time = sum(
-			    float(x) * 60**i for i, x in enumerate(
-			        reversed(times[0].replace(',', '.').split(':'))))
-			end_time = sum(
-			    float(x) * 60**i for i, x in enumerate(
-			        reversed(times[1].replace(',', '.').split(':'))))
-			text = ' '.join(parts[2:])
-
-			# Create word clips with highlighting
-			word_clips, height_used = create_word_clips(text,
-			                                            start_time,
-			                                            end_time,
-			                                            fontsize=24,
-			                                            bg_color=bg_color,
-			                                            width=width,
-			                                            height=height)
-
-			# Adjust all clips to the current y_offset
-			for clip in word_clips:
-				current_pos = clip.pos
-				if isinstance(current_pos, tuple):
-					clip = clip.set_position((current_pos[0], current_pos[1] + y_offset))
-				all_clips.append(clip)
-
-			# Update y_offset for next segment if needed
-			y_offset += height_used + 20
-			if y_offset > 440:  # Reset if too low
-				y_offset = 380
-
-	# Create the final composite
+	# Draw the captions over the video (or a plain background for audio),
+	# each frame only blends the words showing at that time
 	if isinstance(media_clip, AudioFileClip):
 		background_clip = ColorClip(size=(width, height),
 		                            color=bg_color,
 		                            duration=duration)
-		final_clip = CompositeVideoClip([background_clip] + all_clips)
+		final_clip = compositor.apply(background_clip)
 	else:
-		final_clip = CompositeVideoClip([media_clip] + all_clips)
+		final_clip = compositor.apply(media_clip)
 
 	# Set audio and write video
 	audio = media_clip if isinstance(media_clip,
@@ -201,6 +214,40 @@ def create_video_with_subtitles(media_file,
 	final_clip.close()
 
 
+def create_video_with_ass_subtitles(media_file,
+                                    srt_file,
+                                    output_video_file,
+                                    greenscreen=True,
+                                    width=720,
+                                    height=480):
+	"""
+	`create_video_with_subtitles` as an ASS file (kept next to the video) burned
+	in by ffmpeg in one pass, with the same style
+	"""
+	bg_color = (0, 255, 0) if greenscreen else (0, 0, 0)
+	size = probe_video_size(media_file) or (width, height)
+	subtitles_file = os.path.splitext(output_video_file)[0] + '.ass'
+	fonts_dir = write_ass(
+	    srt_lines(srt_file),
+	    subtitles_file,
+	    size,
+	    fontsize=24,
+	    stroke_color='rgb(50, 50, 50)',
+	    stroke_width=1,
+	    position='bottom',
+	    margin_h=50,
+	    margin_v=40,
+	    # the words are drawn on boxes of the background colour
+	    box_opacity=1.0,
+	    box_color=f'rgb{bg_color}')
+	burn_subtitles(media_file,
+	               subtitles_file,
+	               output_video_file,
+	               fonts_dir,
+	               size,
+	               background=f'rgb{bg_color}')
+
+
 def create_video_from_audio(audio_file,
                             output_video_file,
                             width=720,
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+import ffmpeg
+import numpy as np
+from PIL import Image
+from src.tools.audio import mp4_audio_codec
+from src.video.ass import video_size
+from src.video.compositor import CaptionCompositor, blend
+
+# Only the caption layer is rendered: one transparent PNG per change of what's
+# on screen, timed by an ffconcat list, and ffmpeg's overlay filter puts it on
+# the untouched source in a single pass. No source frame is ever decoded into
+# Python, so the cost follows the number of caption changes, not the
+# resolution or length of the video.
+
+
+def overlay_events(compositor: CaptionCompositor,
+                   duration: float) -> list[dict]:
+	"""
+	Spans of time ({'start', 'end', 'items'}) over which the same sprites
+	show, covering 0-`duration`, including spans where nothing does
+	"""
+	items = compositor.items(0, duration)
+	times = {0.0, duration}
+	for item in items:
+		times.update(t for t in (item['start'], item['end']) if 0 < t < duration)
+	times = sorted(times)
+
+	events: list[dict] = []
+	for start, end in zip(times, times[1:]):
+		active = compositor.active(start)
+		if events and [id(i) for i in events[-1]['items']
+		              ] == [id(i) for i in active]:
+			events[-1]['end'] = end
+		else:
+			events.append({'start': start, 'end': end, 'items': active})
+	return events
+
+
+def write_overlay(compositor: CaptionCompositor, size: tuple[int, int],
+                  duration: float, directory: str) -> str:
+	"""
+	Write the caption layer as frame-sized transparent PNGs, one per event,
+	and an ffconcat list timing them; returns the list's path
+	"""
+	width, height = size
+	canvas = np.zeros((height, width, 4), dtype=np.uint8)
+	# the same set of sprites is only written once
+	written: dict[tuple, str] = {}
+	entries = []
+	for event in overlay_events(compositor, duration):
+		key = tuple(id(item) for item in event['items'])
+		if key not in written:
+			boxes = [
+			    blend(canvas, item['sprite'], item['x'], item['y'])
+			    for item in event['items']
+			]
+			path = os.path.join(directory, f'overlay_{len(written):05}.png')
+			# mostly empty, so the fastest compression is still small
+			Image.fromarray(canvas).save(path, compress_level=1)
+			for x0, y0, x1, y1 in boxes:
+				canvas[y0:y1, x0:x1] = 0
+			written[key] = path
+		entries.append((written[key], event['end'] - event['start']))
+	if not entries:
+		# a zero-length source has no events: a single transparent frame
+		path = os.path.join(directory, 'overlay_00000.png')
+		Image.fromarray(canvas).save(path, compress_level=1)
+		written[()] = path
+		entries.append((path, duration))
+
+	list_path = os.path.join(directory, 'overlay.ffconcat')
+	with open(list_path, 'w') as f:
+		f.write('ffconcat version 1.0\n')
+		for path, seconds in entries:
+			f.write(f"file '{os.path.basename(path)}'\n")
+			if seconds > 0:
+				f.write(f'duration {seconds:.6f}\n')
+		# the last file again, or its duration is ignored
+		f.write(f"file '{os.path.basename(entries[-1][0])}'\n")
+	print(f'Wrote {len(entries)} caption events as {len(written)} images')
+	return list_path
+
+
+def render_overlay(source: str,
+                   compositor: CaptionCompositor,
+                   output_path: str,
+                   background: Optional[tuple] = None,
+                   size: tuple[int, int] = (720, 480),
+                   fps=24):
+	"""
+	Put the captions on `source` with one ffmpeg overlay pass. Video is
+	re-encoded once by ffmpeg and audio is copied. Audio-only sources (or any
+	source when `background` is given) get a plain background of `size` instead.
+	"""
+	info = ffmpeg.probe(source)
+	duration = float(info['format']['duration'])
+	audio = next((s for s in info['streams'] if s['codec_type'] == 'audio'),
+	             None)
+	source_size = video_size(info)
+	if background is None and source_size is None:
+		background = (0, 0, 0)
+	if background is None:
+		size = source_size
+
+	directory = tempfile.mkdtemp()
+	try:
+		began = time.perf_counter()
+		list_path = write_overlay(compositor, size, duration, directory)
+		print(f'Rendered the caption layer in {time.perf_counter() - began:.1f}s')
+
+		media = ffmpeg.input(source)
+		if background is None:
+			video = media.video
+		else:
+			r, g, b = background
+			video = ffmpeg.input(f'color=c=0x{r:02X}{g:02X}{b:02X}:s={size[0]}x{size[1]}'
+			                     f':r={fps}',
+			                     f='lavfi',
+			                     t=duration)
+		layer = ffmpeg.input(list_path, f='concat', safe=0).video
+		# eof_action=pass: past the last caption event the video goes through as is
+		video = ffmpeg.filter([video, layer], 'overlay', eof_action='pass')
+
+		streams = [video]
+		options = {'vcodec': 'libx264', 'pix_fmt': 'yuv420p'}
+		if audio is not None:
+			streams.append(media.audio)
+			options['acodec'] = mp4_audio_codec(audio['codec_name'])
+		began = time.perf_counter()
+		ffmpeg.output(*streams, output_path, **options).run(overwrite_output=True,
+		                                                    capture_stdout=True,
+		                                                    capture_stderr=True)
+		print(f'Overlaid the captions in {time.perf_counter() - began:.1f}s')
+	except ffmpeg.Error as e:
+		raise RuntimeError(f'Failed to overlay captions: {e.stderr.decode()}') from e
+	finally:
+		shutil.rmtree(directory, ignore_errors=True)
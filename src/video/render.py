@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import ffmpeg
+from moviepy.editor import ColorClip, VideoFileClip
+from src.config import CAPTION_SLICES
+from src.tools.audio import mp4_audio_codec, plan_segments
+from src.video.compositor import CaptionCompositor
+
+# Captioned video rendered in parallel: the timeline is cut into slices at
+# keyframes, each slice's frames are drawn and encoded in its own process, and
+# the encoded slices are joined with the concat demuxer (no re-encoding), with
+# the source's audio copied in at the same time.
+
+
+def slice_count(slices: Optional[int] = None) -> int:
+	"""Slices to render, from `captions.slices` in config/config.yaml when not given (0 = one per CPU)"""
+	slices = CAPTION_SLICES if slices is None else slices
+	return slices if slices > 0 else os.cpu_count() or 1
+
+
+def keyframe_times(path: str) -> list[float]:
+	"""Timestamps of the video's keyframes (only keyframes are decoded)"""
+	info = ffmpeg.probe(path,
+	                    select_streams='v:0',
+	                    skip_frame='nokey',
+	                    show_entries='frame=pts_time')
+	return sorted(
+	    float(frame['pts_time'])
+	    for frame in info.get('frames', [])
+	    if frame.get('pts_time') not in (None, 'N/A'))
+
+
+def plan_slices(duration: float, keyframes: list[float], count: int,
+                fps: float) -> list[tuple[float, float]]:
+	"""
+	About `count` equal slices, cut at the keyframe nearest to each target and
+	rounded to the output's frames, so the slices have exactly the frames a
+	single render would
+	"""
+	slices = plan_segments(duration, [(t, t) for t in keyframes],
+	                       duration / count,
+	                       search_seconds=duration)
+	cuts = sorted({0.0} | {round(start * fps) / fps for start, _ in slices})
+	# rounding can put a cut on or past the end, which would leave an empty slice
+	cuts = [cut for cut in cuts if cut == 0 or 0 < cut <= duration - 1 / fps]
+	return [(start, end) for start, end in zip(cuts, cuts[1:] + [duration])
+	        if end > start]
+
+
+def render_slice(source: str, start: float, end: float, path: str,
+                 compositor: CaptionCompositor, fps: float,
+                 background: Optional[tuple], size: tuple[int, int]) -> float:
+	"""Render the captions over `start`-`end` of the source (or `background`) without audio, returns the seconds it took"""
+	began = time.perf_counter()
+	duration = end - start
+	if abs(end * fps - round(end * fps)) < 1e-6:
+		# cut on a frame: stop half a frame short, so float error can't add the
+		# frame that starts the next slice
+		duration -= 0.5 / fps
+	if background is None:
+		clip = VideoFileClip(source, audio=False).subclip(start, start + duration)
+	else:
+		clip = ColorClip(size=size, color=background, duration=duration)
+	compositor.apply(clip, start).write_videofile(path,
+	                                              fps=fps,
+	                                              codec='libx264',
+	                                              audio=False,
+	                                              logger=None)
+	clip.close()
+	return time.perf_counter() - began
+
+
+def join_slices(paths: list[str], source: str, output_path: str):
+	"""Concatenate the encoded slices as they are and add the source's audio"""
+	audio = next((s for s in ffmpeg.probe(source)['streams']
+	              if s['codec_type'] == 'audio'), None)
+	fd, list_path = tempfile.mkstemp(suffix='.txt')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			for path in paths:
+				escaped = os.path.abspath(path).replace("'", "'\\''")
+				f.write(f"file '{escaped}'\n")
+		streams = [ffmpeg.input(list_path, f='concat', safe=0).video]
+		options = {'vcodec': 'copy'}
+		if audio is not None:
+			streams.append(ffmpeg.input(source).audio)
+			options['acodec'] = mp4_audio_codec(audio['codec_name'])
+		ffmpeg.output(*streams, output_path, **options).run(overwrite_output=True,
+		                                                    quiet=True)
+	finally:
+		os.remove(list_path)
+
+
+def render_slices(source: str,
+                  compositor: CaptionCompositor,
+                  output_path: str,
+                  slices: Optional[int] = None,
+                  fps=24,
+                  background: Optional[tuple] = None,
+                  size: tuple[int, int] = (720, 480)) -> list[dict]:
+	"""
+	Render `compositor`'s captions over the video `source` (or over a plain
+	`background` of `size`, keeping the audio of `source`) into `output_path`,
+	in parallel slices. Returns the time each slice took.
+	"""
+	duration = float(ffmpeg.probe(source)['format']['duration'])
+	keyframes = keyframe_times(source) if background is None else []
+	ranges = plan_slices(duration, keyframes, slice_count(slices), fps)
+	print(f'Rendering {duration:.0f}s of video in {len(ranges)} slices')
+
+	directory = tempfile.mkdtemp()
+	try:
+		paths = [
+		    os.path.join(directory, f'slice_{i:04}.mp4') for i in range(len(ranges))
+		]
+		# spawn, like the transcription pool, so nothing is inherited mid-render
+		with ProcessPoolExecutor(
+		    max_workers=len(ranges),
+		    mp_context=multiprocessing.get_context('spawn')) as executor:
+			futures = [
+			    executor.submit(render_slice, source, start, end, path,
+			                    compositor.window(start, end), fps, background, size)
+			    for (start, end), path in zip(ranges, paths)
+			]
+			timings = []
+			for i, ((start, end), future) in enumerate(zip(ranges, futures)):
+				seconds = future.result()
+				print(f'Slice {i} ({start:.2f}-{end:.2f}s) rendered in {seconds:.1f}s')
+				timings.append({'start': start, 'end': end, 'seconds': seconds})
+
+		began = time.perf_counter()
+		join_slices(paths, source, output_path)
+		print(f'Joined {len(paths)} slices in {time.perf_counter() - began:.1f}s')
+	finally:
+		shutil.rmtree(directory, ignore_errors=True)
+	return timings
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from src.config import SPRITE_CACHE_MAX_MB
+from src.video.text import render_text
+
+# Rasterized caption words. Captions repeat the same words in the same few
+# styles over and over, so each (text, style) is rendered once and kept in
+# memory as an RGBA array (rendered by src/video/text.py) instead of rendering
+# it again for every occurrence.
+
+
+class SpriteCache:
+	"""
+	In-memory LRU of rendered text, as HxWx4 uint8 RGBA arrays.
+	The least recently used sprites are evicted once the total size goes over `max_bytes`.
+	"""
+
+	def __init__(self, max_bytes: int):
+		self.max_bytes = max_bytes
+		self.sprites: OrderedDict[tuple, np.ndarray] = OrderedDict()
+		self.total_bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def get(self,
+	        text: str,
+	        font: Optional[str] = None,
+	        fontsize=24,
+	        color='white',
+	        stroke_color: Optional[str] = None,
+	        stroke_width: float = 1,
+	        kerning: Optional[float] = None,
+	        bg_color: Optional[str] = None,
+	        right_to_left=False) -> np.ndarray:
+		key = (text, font, fontsize, color, stroke_color, stroke_width, kerning,
+		       bg_color, right_to_left)
+		with self.lock:
+			sprite = self.sprites.get(key)
+			if sprite is not None:
+				self.sprites.move_to_end(key)
+				self.hits += 1
+				return sprite
+			self.misses += 1
+
+		sprite = render_text(text, font, fontsize, color, stroke_color,
+		                     stroke_width, kerning, bg_color, right_to_left)
+		# shared between clips, nothing may draw on it
+		sprite.flags.writeable = False
+
+		with self.lock:
+			if key not in self.sprites:
+				self.sprites[key] = sprite
+				self.total_bytes += sprite.nbytes
+				while self.total_bytes > self.max_bytes and len(self.sprites) > 1:
+					_, evicted = self.sprites.popitem(last=False)
+					self.total_bytes -= evicted.nbytes
+			return self.sprites[key]
+
+	def stats(self) -> dict:
+		return {
+		    'hits': self.hits,
+		    'misses': self.misses,
+		    'sprites': len(self.sprites),
+		    'mb': round(self.total_bytes / 1024 / 1024, 1)
+		}
+
+
+sprite_cache = SpriteCache(SPRITE_CACHE_MAX_MB * 1024 * 1024)
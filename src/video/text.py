@@ -0,0 +1,151 @@
+import functools
+import math
+import os
+import re
+from typing import Optional, Union
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont, features
+
+# Text rasterizer for captions: renders with FreeType through Pillow, in
+# process, straight into RGBA arrays. Replaces MoviePy's TextClip, which forks
+# ImageMagick and goes through temp files for every piece of text, while
+# keeping its look (ImageMagick colour strings, stroke, kerning).
+
+ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# bundled fonts, in the repo root
+FONT_DIRS = ('Poppins', 'Arial', 'M_PLUS_Rounded_1c', 'Atkinson_Hyperlegible')
+# used when no font is given (TextClip's default, Courier, isn't bundled)
+DEFAULT_FONT = 'Arial/Arial_Bold.ttf'
+
+Color = Union[str, tuple]
+
+
+def find_font(font: Optional[str]) -> str:
+	"""
+	Path of a font given as a path (absolute, or relative to the working
+	directory or the repo) or as the name of a bundled font file, e.g. 'Poppins-ExtraBold'
+	"""
+	font = font or DEFAULT_FONT
+	for path in (font, os.path.join(ROOT, font)):
+		if os.path.isfile(path):
+			return path
+	name = os.path.splitext(os.path.basename(font))[0].lower()
+	for directory in FONT_DIRS:
+		directory = os.path.join(ROOT, directory)
+		if not os.path.isdir(directory):
+			continue
+		for filename in os.listdir(directory):
+			if os.path.splitext(filename)[0].lower() == name:
+				return os.path.join(directory, filename)
+	print(f'Font {font} not found, using {DEFAULT_FONT}')
+	return os.path.join(ROOT, DEFAULT_FONT)
+
+
+@functools.lru_cache(maxsize=64)
+def load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+	return ImageFont.truetype(path, size)
+
+
+def parse_color(color: Optional[Color]) -> tuple[int, int, int, int]:
+	"""
+	RGBA of a colour name, '#rrggbb', 'rgb(r, g, b)', 'rgba(r, g, b, a)' with
+	ImageMagick's 0-1 alpha, or a tuple. None and 'transparent' are fully transparent.
+	"""
+	if color is None or color == 'transparent':
+		return (0, 0, 0, 0)
+	if isinstance(color, tuple):
+		return tuple(color) + (255,) if len(color) == 3 else tuple(color)
+	match = re.fullmatch(r'\s*rgba\(([^,]+),([^,]+),([^,]+),([^)]+)\)\s*', color)
+	if match:
+		r, g, b = (int(float(v)) for v in match.groups()[:3])
+		alpha = float(match.group(4))
+		return (r, g, b, round(alpha * 255) if alpha <= 1 else int(alpha))
+	return ImageColor.getcolor(color, 'RGBA')
+
+
+def stroke_pixels(stroke_width: float) -> int:
+	# ImageMagick centres the stroke on the outline, Pillow draws it all outside
+	return max(1, round(stroke_width / 2)) if stroke_width > 0 else 0
+
+
+def render_text(text: str,
+                font: Optional[str] = None,
+                fontsize=24,
+                color: Color = 'white',
+                stroke_color: Optional[Color] = None,
+                stroke_width: float = 1,
+                kerning: Optional[float] = None,
+                bg_color: Optional[Color] = None,
+                right_to_left=False) -> np.ndarray:
+	"""
+	Render a line of text as HxWx4 uint8 RGBA. Like TextClip, the image is as
+	wide as the text and as tall as the font's line, padded for the stroke.
+	`kerning` is extra space between characters, in pixels.
+	"""
+	face = load_font(find_font(font), int(fontsize))
+	pad = stroke_pixels(stroke_width) if stroke_color is not None else 0
+
+	direction = None
+	if right_to_left:
+		if features.check('raqm'):
+			direction = 'rtl'
+		else:
+			# no bidi layout without libraqm, draw the characters in visual order
+			text = text[::-1]
+
+	# with kerning every character is placed separately, after the advance of
+	# everything before it (which keeps the font's own kerning pairs)
+	if kerning and direction is None and len(text) > 1:
+		runs = [(face.getlength(text[:i]) + i * kerning, char)
+		        for i, char in enumerate(text)]
+		advance = face.getlength(text) + (len(text) - 1) * kerning
+	else:
+		runs = [(0.0, text)]
+		advance = face.getlength(text, direction=direction)
+
+	boxes = [(x, face.getbbox(run, direction=direction)) for x, run in runs]
+	left = min([0.0] + [x + box[0] for x, box in boxes])
+	right = max([advance] + [x + box[2] for x, box in boxes])
+	ascent, descent = face.getmetrics()
+	size = (max(1, math.ceil(right - left) + 2 * pad), ascent + descent + 2 * pad)
+
+	def mask(stroke: int) -> np.ndarray:
+		image = Image.new('L', size, 0)
+		draw = ImageDraw.Draw(image)
+		for x, run in runs:
+			draw.text((x - left + pad, pad),
+			          run,
+			          font=face,
+			          fill=255,
+			          direction=direction,
+			          stroke_width=stroke,
+			          stroke_fill=255)
+		return np.asarray(image, dtype=np.float32) / 255
+
+	layers = []
+	if bg_color is not None:
+		layers.append((parse_color(bg_color), np.ones((size[1], size[0]),
+		                                              dtype=np.float32)))
+	if pad:
+		layers.append((parse_color(stroke_color), mask(pad)))
+	layers.append((parse_color(color), mask(0)))
+	return composite_layers(layers, (size[1], size[0]))
+
+
+def composite_layers(layers: list[tuple[tuple, np.ndarray]],
+                     shape: tuple[int, int]) -> np.ndarray:
+	"""Stack solid colours through coverage masks, bottom first, with the 'over' operator"""
+	premultiplied = np.zeros(shape + (3,), dtype=np.float32)
+	alpha = np.zeros(shape, dtype=np.float32)
+	for rgba, coverage in layers:
+		layer_alpha = coverage * (rgba[3] / 255)
+		premultiplied = (np.asarray(rgba[:3], dtype=np.float32) *
+		                 layer_alpha[..., None] +
+		                 premultiplied * (1 - layer_alpha[..., None]))
+		alpha = layer_alpha + alpha * (1 - layer_alpha)
+	rgb = np.divide(premultiplied,
+	                alpha[..., None],
+	                out=np.zeros_like(premultiplied),
+	                where=alpha[..., None] > 0)
+	return np.dstack((np.round(rgb), np.round(alpha * 255))).astype(np.uint8)
@@ -10,8 +10,8 @@ import ffmpeg
 from src.utils import ensuredir, get_text_from_url
 from src.enums import ElevenLabsTTSModel, ElevenLabsTTSVoice
 from src.tools.format_tts import format_tts_text
-from src.tools.tts import make_tts
-from src.tools.stt import create_transcript
+from src.tools.tts import make_tts_job
+from src.tools.stt import create_transcript, create_transcript_from_words
 from src.video.moviepy import create_video_with_subtitles
 from dotenv import load_dotenv
 
@@ -127,6 +127,10 @@ def main():
 							f = ["".join(e for e in s if e.isalnum()) for s in f]
 							input_filename = '_'.join(f)
 
+						# the spoken text, when we synthesized it
+						spoken_text = None
+						spoken_words = None
+						spoken_spans = None
 						if is_video_input:
 							# Process video input
 							media_path = process_video_input(input_src)
@@ -139,13 +143,23 @@ def main():
 							#                       reformat_url_text=reformat_url_text,
 							#                       model=tts_model,
 							#                       voice=tts_voice)
-							media_path = make_tts(input_src,
-							                      input_type,
-							                      output_file,
-							                      reformat_url_text=reformat_url_text)
+							tts = make_tts_job(input_src,
+							                   input_type,
+							                   output_file,
+							                   reformat_url_text=reformat_url_text,
+							                   timestamps=True)
+							media_path = tts['path']
+							spoken_text = tts['text']
+							spoken_words = tts['words']
+							spoken_spans = tts['spans']
 
 						# Create transcript and add subtitles
-						srt_file = create_transcript(media_path)
+						if spoken_words is not None:
+							srt_file = create_transcript_from_words(spoken_words)
+						else:
+							srt_file = create_transcript(media_path,
+							                             text=spoken_text,
+							                             spans=spoken_spans)
 						video_output_file = f"output/video/{pd.Timestamp.now().strftime('%Y%m%d%H%M%S')}.mp4"
 						ensuredir(video_output_file)
 